@@ -7,28 +7,54 @@
 
 import numpy as np
 cimport numpy as cnp
+from cython.parallel import prange
 
 def compute_gae(cnp.ndarray dones, cnp.ndarray values,
         cnp.ndarray rewards, float gamma, float gae_lambda):
     '''Fast Cython implementation of Generalized Advantage Estimation (GAE)'''
     cdef int num_steps = len(rewards)
     cdef cnp.ndarray advantages = np.zeros(num_steps, dtype=np.float32)
-    cdef float[:] c_advantages = advantages
-    cdef float[:] c_dones = dones
-    cdef float[:] c_values = values
-    cdef float[:] c_rewards = rewards
-
-    cdef float lastgaelam = 0
-    cdef float nextnonterminal, delta
-    cdef int t, t_cur, t_next
-    for t in range(num_steps-1):
-        t_cur = num_steps - 2 - t
-        t_next = num_steps - 1 - t
-        nextnonterminal = 1.0 - c_dones[t_next]
-        delta = c_rewards[t_next] + gamma * c_values[t_next] * nextnonterminal - c_values[t_cur]
-        lastgaelam = delta + gamma * gae_lambda * nextnonterminal * lastgaelam
-        c_advantages[t_cur] = lastgaelam
+    if num_steps < 2:
+        return advantages
 
+    # One segment whose last step is only used to bootstrap
+    advantages[:-1] = compute_segment_gae(
+        np.ascontiguousarray(values).reshape(1, -1),
+        np.ascontiguousarray(rewards).reshape(1, -1),
+        np.ascontiguousarray(dones).reshape(1, -1),
+        np.zeros((1, num_steps), dtype=np.float32),
+        np.ones(1, dtype=np.float32), gamma, gae_lambda)[0]
     return advantages
 
+def compute_segment_gae(float[:, :] values, float[:, :] rewards,
+        float[:, :] terminals, float[:, :] truncations, float[:] bootstrap,
+        float gamma, float gae_lambda):
+    '''GAE over [segments, horizon + 1] arrays, parallel across segments
+
+    Column horizon holds the step after each segment and is only used to
+    bootstrap. Segments with bootstrap 0 have no such step, so their last
+    advantage is 0. Terminals and truncations both end the trajectory, but
+    a truncation bootstraps from the value of the step before it, since the
+    observation it ended on is not stored.
+    '''
+    cdef int num_segments = values.shape[0]
+    cdef int horizon = values.shape[1] - 1
+    cdef cnp.ndarray advantages = np.zeros((num_segments, horizon), dtype=np.float32)
+    cdef float[:, :] c_advantages = advantages
 
+    cdef float lastgaelam, nextnonterminal, delta
+    cdef int s, t
+    for s in prange(num_segments, nogil=True):
+        lastgaelam = 0
+        for t in range(horizon - 1, -1, -1):
+            if t == horizon - 1 and bootstrap[s] == 0:
+                lastgaelam = 0
+            elif truncations[s, t+1] != 0 and terminals[s, t+1] == 0:
+                lastgaelam = rewards[s, t+1] + (gamma - 1) * values[s, t]
+            else:
+                nextnonterminal = 1.0 - terminals[s, t+1]
+                delta = rewards[s, t+1] + gamma * values[s, t+1] * nextnonterminal - values[s, t]
+                lastgaelam = delta + gamma * gae_lambda * nextnonterminal * lastgaelam
+            c_advantages[s, t] = lastgaelam
+
+    return advantages
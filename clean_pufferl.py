@@ -17,14 +17,16 @@ import torch
 
 import pufferlib
 import pufferlib.utils
+import pufferlib.environment
 import pufferlib.pytorch
+import pufferlib.cleanrl
 
 torch.set_float32_matmul_precision('high')
 
 # Fast Cython GAE implementation
 #import pyximport
 #pyximport.install(setup_args={"include_dirs": np.get_include()})
-from c_gae import compute_gae
+from c_gae import compute_segment_gae
 
 
 def create(config, vecenv, policy, optimizer=None, wandb=None):
@@ -43,10 +45,18 @@ def create(config, vecenv, policy, optimizer=None, wandb=None):
     atn_dtype = vecenv.single_action_space.dtype
     total_agents = vecenv.num_agents
 
+    # Workers write observations straight into a CPU experience buffer
+    obs_rows = getattr(vecenv, 'obs_rows', None)
+    if obs_rows is not None and (len(obs_rows) < config.batch_size + 2*total_agents
+            or (config.device != 'cpu' and not config.cpu_offload)):
+        obs_rows = None
+
     lstm = policy.lstm if hasattr(policy, 'lstm') else None
     experience = Experience(config.batch_size, config.bptt_horizon,
         config.minibatch_size, obs_shape, obs_dtype, atn_shape, atn_dtype,
-        config.cpu_offload, config.device, lstm, total_agents)
+        config.cpu_offload, config.device, lstm, total_agents,
+        segment_agents=total_agents if config.segment_major else 0,
+        obs_rows=obs_rows)
 
     uncompiled_policy = policy
 
@@ -72,6 +82,7 @@ def create(config, vecenv, policy, optimizer=None, wandb=None):
         msg=msg,
         last_log_time=0,
         utilization=utilization,
+        vec_stats=None,
     )
 
 @pufferlib.utils.profile
@@ -83,18 +94,72 @@ def evaluate(data):
         infos = defaultdict(list)
         lstm_h, lstm_c = experience.lstm_h, experience.lstm_c
 
-    while not experience.full:
+        # Policies that sample with pufferlib.cleanrl write actions straight
+        # into the vecenv's shared action buffer, which send then skips
+        action_buffer = None
+        if isinstance(data.uncompiled_policy, (pufferlib.cleanrl.Policy,
+                pufferlib.cleanrl.RecurrentPolicy)):
+            action_buffer = getattr(data.vecenv, 'action_buffer', None)
+
+    # Actor mode: workers ran the policy themselves and return whole segments
+    while getattr(data.vecenv, 'segment_length', None) and not experience.full:
         with profile.env:
+            seg = data.vecenv.recv_segment()
+            env_id = seg.env_ids.tolist()
+
+        with profile.eval_misc:
+            data.global_step += int(seg.masks.sum())
+            for t in range(data.vecenv.segment_length):
+                experience.store(torch.as_tensor(seg.observations[t]),
+                    torch.as_tensor(seg.values[t]), seg.actions[t],
+                    torch.as_tensor(seg.logprobs[t]), torch.as_tensor(seg.rewards[t]),
+                    torch.as_tensor(seg.terminals[t]), torch.as_tensor(seg.truncations[t]),
+                    env_id, torch.as_tensor(seg.masks[t]))
+
+            for i in seg.infos:
+                unroll_info(infos, i)
+
+    # Once the batch is full, keep stepping for up to one round of env
+    # batches until every agent has sent the step after its last row. The
+    # policy's values for those steps bootstrap the rows, and the steps
+    # themselves start the next batch. Skipped on the last batch, which
+    # has no next batch to start, and without bootstrap_boundary, where
+    # rows cut by the batch end get no bootstrap
+    bootstrap_rounds = 0
+    last_batch = data.global_step + config.batch_size >= config.total_timesteps
+    if (config.bootstrap_boundary and not last_batch
+            and not getattr(data.vecenv, 'segment_length', None)):
+        bootstrap_rounds = -(-data.vecenv.num_agents
+            // getattr(data.vecenv, 'agents_per_batch', data.vecenv.num_agents))
+
+    # With env_batch_size < num_envs, the other env batches step while this
+    # one runs the policy. Send as soon as the batch is stored, since the
+    # arrays recv returns may be views that workers overwrite once stepped,
+    # and do the remaining bookkeeping while this batch steps too
+    while not experience.full or (experience.bootstrap_pending and bootstrap_rounds > 0):
+        bootstrap_rounds -= experience.full
+        with profile.env, profile.env_wait:
             o, r, d, t, info, env_id, mask = data.vecenv.recv()
             env_id = env_id.tolist()
 
         with profile.eval_misc:
+            if data.global_step == 0 and getattr(data.vecenv, 'time_to_first_batch', None):
+                data.msg = f'Time to first batch: {data.vecenv.time_to_first_batch:.2f}s'
+
             data.global_step += sum(mask)
 
             o = torch.as_tensor(o)
             o_device = o.to(config.device)
             r = torch.as_tensor(r)
             d = torch.as_tensor(d)
+            t = torch.as_tensor(t)
+
+            obs_rows = None
+            if experience.obs_index is not None:
+                obs_rows = data.vecenv.observation_rows()
+
+            atn_np = action_buffer() if action_buffer is not None else None
+            out = {} if atn_np is None else {'out': torch.from_numpy(atn_np)}
 
         with profile.eval_forward, torch.no_grad():
             # TODO: In place-update should be faster. Leaking 7% speed max
@@ -102,28 +167,38 @@ def evaluate(data):
             if lstm_h is not None:
                 h = lstm_h[:, env_id]
                 c = lstm_c[:, env_id]
-                actions, logprob, _, value, (h, c) = policy(o_device, (h, c))
-                lstm_h[:, env_id] = h
-                lstm_c[:, env_id] = c
+                actions, logprob, _, value, (h, c) = policy(o_device, (h, c), **out)
+
+                # Masked rows (late or respawned workers) hold stale
+                # observations, so those agents keep their state
+                live = torch.as_tensor(np.flatnonzero(mask), device=h.device)
+                idx = torch.as_tensor(env_id, device=h.device)[live]
+                lstm_h[:, idx] = h[:, live]
+                lstm_c[:, idx] = c[:, live]
             else:
-                actions, logprob, _, value = policy(o_device)
+                actions, logprob, _, value = policy(o_device, **out)
 
             if config.device == 'cuda':
                 torch.cuda.synchronize()
 
         with profile.eval_misc:
             value = value.flatten()
-            actions = actions.cpu().numpy()
+            actions = actions.cpu().numpy() if atn_np is None else atn_np
             mask = torch.as_tensor(mask)# * policy.mask)
             o = o if config.cpu_offload else o_device
-            experience.store(o, value, actions, logprob, r, d, env_id, mask)
+            experience.store(o, value, actions, logprob, r, d, t, env_id, mask, obs_rows)
 
-            for i in info:
-                for k, v in pufferlib.utils.unroll_nested_dict(i):
-                    infos[k].append(v)
+            send_kwargs = {}
+            if experience.obs_index is not None:
+                send_kwargs['obs_rows'] = experience.reserve_obs_rows(len(env_id),
+                    len(env_id) // data.vecenv.workers_per_batch)
 
         with profile.env:
-            data.vecenv.send(actions)
+            data.vecenv.send(actions, **send_kwargs)
+
+        with profile.eval_misc:
+            for i in info:
+                unroll_info(infos, i)
 
     with profile.eval_misc:
         for k, v in infos.items():
@@ -145,6 +220,19 @@ def evaluate(data):
     data.experience.step = 0
     return data.stats, infos
 
+def unroll_info(infos, info):
+    # Columnar infos are kept as one array per key, nan marking missing keys
+    if pufferlib.environment.is_columnar(info):
+        for k in info.dtype.names:
+            col = info[k]
+            col = col[~np.isnan(col)]
+            if len(col) > 0:
+                infos[k].append(col)
+        return
+
+    for k, v in pufferlib.utils.unroll_nested_dict(info):
+        infos[k].append(v)
+
 @pufferlib.utils.profile
 def train(data):
     config, profile, experience = data.config, data.profile, data.experience
@@ -153,12 +241,8 @@ def train(data):
 
     with profile.train_misc:
         idxs = experience.sort_training_data()
-        dones_np = experience.dones_np[idxs]
-        values_np = experience.values_np[idxs]
-        rewards_np = experience.rewards_np[idxs]
-        # TODO: bootstrap between segment bounds
-        advantages_np = compute_gae(dones_np, values_np,
-            rewards_np, config.gamma, config.gae_lambda)
+        advantages_np = compute_segment_gae(*experience.gae_segments(idxs),
+            config.gamma, config.gae_lambda).ravel()
         experience.flatten_batch(advantages_np)
 
     # Optimizing the policy and value network
@@ -256,6 +340,9 @@ def train(data):
             lrnow = frac * config.learning_rate
             data.optimizer.param_groups[0]["lr"] = lrnow
 
+        if getattr(data.vecenv, 'segment_length', None):
+            data.vecenv.update_policy(data.uncompiled_policy)
+
         y_pred = experience.values_np
         y_true = experience.returns_np
         var_y = np.var(y_true)
@@ -267,9 +354,15 @@ def train(data):
         # TODO: beter way to get episode return update without clogging dashboard
         # TODO: make this appear faster
         if done_training or profile.update(data):
+            if hasattr(data.vecenv, 'stats'):
+                data.vec_stats = data.vecenv.stats()
+                data.vec_stats.recv_wait = profile.recv_wait(data.vec_stats.median)
+
             mean_and_log(data)
             print_dashboard(config.env, data.utilization, data.global_step, data.epoch,
-                profile, data.losses, data.stats, data.msg)
+                profile, data.losses, data.stats, data.msg,
+                restarts=sum(getattr(data.vecenv, 'restarts', [])),
+                vec_stats=data.vec_stats)
             data.stats = defaultdict(list)
 
         if data.epoch % config.checkpoint_interval == 0 or done_training:
@@ -280,7 +373,8 @@ def mean_and_log(data):
     for k in list(data.stats.keys()):
         v = data.stats[k]
         try:
-            v = np.mean(v)
+            # Stats are scalars and arrays from columnar infos
+            v = np.mean(np.concatenate([np.ravel(e) for e in v]))
         except:
             del data.stats[k]
 
@@ -289,19 +383,37 @@ def mean_and_log(data):
     if data.wandb is None:
         return
 
+    vec_stats = {}
+    if getattr(data, 'vec_stats', None) is not None:
+        vec_stats = {
+            'performance/worker_step_median': data.vec_stats.median,
+            'performance/worker_step_p99': data.vec_stats.step.p99.max(),
+            'performance/worker_stragglers': len(data.vec_stats.stragglers),
+        }
+        if not np.isnan(data.vec_stats.reset_pool.hit_rate):
+            vec_stats['performance/reset_pool_hit_rate'] = data.vec_stats.reset_pool.hit_rate
+        if not np.isnan(data.vec_stats.recv_wait):
+            vec_stats['performance/env_recv_wait'] = data.vec_stats.recv_wait
+        if not np.isnan(data.vec_stats.scheduler.passes_per_batch):
+            vec_stats['performance/scheduler_passes'] = data.vec_stats.scheduler.passes_per_batch
+
     data.last_log_time = time.time()
     data.wandb.log({
         '0verview/SPS': data.profile.SPS,
         '0verview/agent_steps': data.global_step,
         '0verview/epoch': data.epoch,
         '0verview/learning_rate': data.optimizer.param_groups[0]["lr"],
+        '0verview/worker_restarts': sum(getattr(data.vecenv, 'restarts', [])),
         **{f'environment/{k}': v for k, v in data.stats.items()},
         **{f'losses/{k}': v for k, v in data.losses.items()},
         **{f'performance/{k}': v for k, v in data.profile},
+        **vec_stats,
     })
 
-def close(data):
-    data.vecenv.close()
+def close(data, close_vecenv=True):
+    if close_vecenv:
+        data.vecenv.close()
+
     data.utilization.stop()
     config = data.config
     if data.wandb is not None:
@@ -318,6 +430,7 @@ class Profile:
     remaining: ... = 0
     eval_time: ... = 0
     env_time: ... = 0
+    env_wait_time: ... = 0
     eval_forward_time: ... = 0
     eval_misc_time: ... = 0
     train_time: ... = 0
@@ -327,12 +440,14 @@ class Profile:
     def __init__(self):
         self.start = time.time()
         self.env = pufferlib.utils.Profiler()
+        self.env_wait = pufferlib.utils.Profiler()
         self.eval_forward = pufferlib.utils.Profiler()
         self.eval_misc = pufferlib.utils.Profiler()
         self.train_forward = pufferlib.utils.Profiler()
         self.learn = pufferlib.utils.Profiler()
         self.train_misc = pufferlib.utils.Profiler()
         self.prev_steps = 0
+        self.prev_wait = (0, 0)
 
     def __iter__(self):
         yield 'SPS', self.SPS
@@ -340,6 +455,7 @@ class Profile:
         yield 'remaining', self.remaining
         yield 'eval_time', self.eval_time
         yield 'env_time', self.env_time
+        yield 'env_wait_time', self.env_wait_time
         yield 'eval_forward_time', self.eval_forward_time
         yield 'eval_misc_time', self.eval_misc_time
         yield 'train_time', self.train_time
@@ -347,6 +463,18 @@ class Profile:
         yield 'learn_time', self.learn_time
         yield 'train_misc_time', self.train_misc_time
 
+    def recv_wait(self, step_time):
+        '''Mean time blocked in recv since the last call as a fraction of
+        step_time. Lower means more of each worker step ran behind the policy'''
+        elapsed, calls = self.env_wait.elapsed, self.env_wait.calls
+        prev_elapsed, prev_calls = self.prev_wait
+        self.prev_wait = (elapsed, calls)
+        if calls == prev_calls or not step_time:
+            return float('nan')
+
+        wait = (elapsed - prev_elapsed) / (calls - prev_calls)
+        return float(np.clip(wait / step_time, 0, 1))
+
     @property
     def epoch_time(self):
         return self.train_time + self.eval_time
@@ -368,6 +496,7 @@ class Profile:
         self.eval_time = data._timers['evaluate'].elapsed
         self.eval_forward_time = self.eval_forward.elapsed
         self.env_time = self.env.elapsed
+        self.env_wait_time = self.env_wait.elapsed
         self.eval_misc_time = self.eval_misc.elapsed
         self.train_time = data._timers['train'].elapsed
         self.train_forward_time = self.train_forward.elapsed
@@ -387,9 +516,28 @@ def make_losses():
     )
 
 class Experience:
-    '''Flat tensor storage and array views for faster indexing'''
+    '''Flat tensor storage and array views for faster indexing
+
+    With segment_agents (the number of env ids recv can return), samples
+    are written straight into rows of bptt_horizon consecutive steps of one
+    agent as they arrive. Each agent takes the next free row when it starts
+    a segment, and steps of agents with no row left are dropped. There must
+    be a row for every agent. Minibatches are then reshapes of the storage,
+    with no sort.
+
+    With obs_rows, a shared array of observation rows from the vecenv (see
+    Multiprocessing obs_rows), workers write observations into the rows
+    reserved for them and obs_index maps samples to rows. Masked agents'
+    rows are reused for batches that have to be copied in.
+
+    Steps stored once the batch is full bootstrap the last row of their
+    agent (see bootstrap_pending) and are carried over to start the next
+    batch, so evaluate can keep stepping until every row has the step
+    after it.
+    '''
     def __init__(self, batch_size, bptt_horizon, minibatch_size, obs_shape, obs_dtype, atn_shape, atn_dtype,
-                 cpu_offload=False, device='cuda', lstm=None, lstm_total_agents=0):
+                 cpu_offload=False, device='cuda', lstm=None, lstm_total_agents=0,
+                 segment_agents=0, obs_rows=None):
         if minibatch_size is None:
             minibatch_size = batch_size
 
@@ -397,8 +545,16 @@ class Experience:
         atn_dtype = pufferlib.pytorch.numpy_to_torch_dtype_dict[atn_dtype]
         pin = device == 'cuda' and cpu_offload
         obs_device = device if not pin else 'cpu'
-        self.obs=torch.zeros(batch_size, *obs_shape, dtype=obs_dtype,
-            pin_memory=pin, device=device if not pin else 'cpu')
+        self.obs_index = None
+        if obs_rows is not None:
+            self.obs = torch.from_numpy(obs_rows)
+            self.obs_index = np.zeros(batch_size, dtype=np.int64)
+            self.obs_cursor = 0
+            self.obs_used = 0
+            self.obs_holes = np.zeros(0, dtype=np.int64)
+        else:
+            self.obs=torch.zeros(batch_size, *obs_shape, dtype=obs_dtype,
+                pin_memory=pin, device=device if not pin else 'cpu')
         self.actions=torch.zeros(batch_size, *atn_shape, dtype=atn_dtype, pin_memory=pin)
         self.logprobs=torch.zeros(batch_size, pin_memory=pin)
         self.rewards=torch.zeros(batch_size, pin_memory=pin)
@@ -439,27 +595,208 @@ class Experience:
         self.ptr = 0
         self.step = 0
 
+        # Steps that arrived after the batch filled, and for sorted batches
+        # the agents stored and the first such step of each of them
+        self.carry = []
+        self.seen = set()
+        self.after = {}
+
+        # Row and step within it of each agent's current segment, and the
+        # value, reward, done and truncation of the step after each row
+        self.num_segments = batch_size // bptt_horizon
+        self.segment_agents = segment_agents
+        if segment_agents > self.num_segments:
+            raise ValueError(f'batch_size / bptt_horizon ({self.num_segments}) must be at '
+                f'least the number of agents ({segment_agents}) with segment_major, '
+                'or agents without a row have all their steps dropped')
+        if segment_agents:
+            self.agent_row = np.full(segment_agents, -1, dtype=np.int64)
+            self.agent_step = np.full(segment_agents, bptt_horizon, dtype=np.int64)
+            self.next_row = 0
+            self.next_step = np.zeros((4, self.num_segments), dtype=np.float32)
+            self.bootstrap = np.zeros(self.num_segments, dtype=np.float32)
+
     @property
     def full(self):
         return self.ptr >= self.batch_size
 
-    def store(self, obs, value, action, logprob, reward, done, env_id, mask):
+    @property
+    def bootstrap_pending(self):
+        '''Whether some agent's last row still lacks the step after it'''
+        if self.segment_agents:
+            return not self.bootstrap.all()
+
+        return len(self.after) < len(self.seen)
+
+    def store(self, obs, value, action, logprob, reward, done, truncated, env_id, mask,
+            obs_rows=None):
+        if self.full:
+            return self.store_after(obs, value, action, logprob,
+                reward, done, truncated, env_id, mask)
+
+        if self.ptr == 0:
+            self.seen = set()
+            self.after = {}
+            if self.obs_index is not None:
+                # Rows reserved last batch and still in flight are not counted
+                self.obs_used = 0
+                self.obs_holes = self.obs_holes[:0]
+
+            # Steps left over from the last batch come first
+            carry, self.carry = self.carry, []
+            for step in carry:
+                self.store(*step)
+
+        if self.segment_agents:
+            return self.store_segments(obs, value, action, logprob,
+                reward, done, truncated, env_id, mask, obs_rows)
+
         # Mask learner and Ensure indices do not exceed batch size
         ptr = self.ptr
-        indices = torch.where(mask)[0].numpy()[:self.batch_size - ptr]
+        indices = torch.where(mask)[0].numpy()
+        indices, rest = indices[:self.batch_size - ptr], indices[self.batch_size - ptr:]
         end = ptr + len(indices)
  
-        self.obs[ptr:end] = obs.to(self.obs.device)[indices]
+        if self.obs_index is not None:
+            self.obs_index[ptr:end] = self.place_obs(obs, indices, obs_rows)
+        else:
+            self.obs[ptr:end] = obs.to(self.obs.device)[indices]
         self.values_np[ptr:end] = value.cpu().numpy()[indices]
         self.actions_np[ptr:end] = action[indices]
         self.logprobs_np[ptr:end] = logprob.cpu().numpy()[indices]
         self.rewards_np[ptr:end] = reward.cpu().numpy()[indices]
         self.dones_np[ptr:end] = done.cpu().numpy()[indices]
+        self.truncateds_np[ptr:end] = truncated.cpu().numpy()[indices]
         self.sort_keys.extend([(env_id[i], self.step) for i in indices])
+        self.seen.update(env_id[i] for i in indices)
         self.ptr = end
         self.step += 1
 
+        if len(rest) > 0:
+            rest_mask = torch.zeros_like(mask)
+            rest_mask[rest] = True
+            self.store_after(obs, value, action, logprob,
+                reward, done, truncated, env_id, rest_mask)
+
+    def store_after(self, obs, value, action, logprob, reward, done, truncated, env_id, mask):
+        '''Steps that arrive once the batch is full. Bootstraps the last row
+        of their agents and keeps them for the start of the next batch'''
+        if self.segment_agents:
+            # With no rows left, this only bootstraps and drops
+            self.store_segments(obs, value, action, logprob,
+                reward, done, truncated, env_id, mask)
+        else:
+            step = [v.cpu().numpy() for v in (value, reward, done, truncated)]
+            for i in torch.where(mask)[0].numpy():
+                agent = env_id[i]
+                if agent in self.seen and agent not in self.after:
+                    self.after[agent] = [v[i] for v in step]
+
+        self.carry.append((obs.clone(), value.clone(), np.array(action),
+            logprob.clone(), reward.clone(), done.clone(), truncated.clone(),
+            list(env_id), mask.clone()))
+
+    def store_segments(self, obs, value, action, logprob, reward, done, truncated, env_id, mask,
+            obs_rows=None):
+        if self.ptr == 0:
+            # New batch. Every agent starts a new segment
+            self.agent_row[:] = -1
+            self.agent_step[:] = self.bptt_horizon
+            self.next_row = 0
+            self.bootstrap[:] = 0
+
+        indices = torch.where(mask)[0].numpy()
+        agents = np.asarray(env_id)[indices]
+        value = value.cpu().numpy()[indices]
+        reward = reward.cpu().numpy()[indices]
+        done = done.cpu().numpy()[indices]
+        truncated = truncated.cpu().numpy()[indices]
+
+        # Agents done with their segment bootstrap its row from this step
+        # and take the next free rows, if any
+        start = np.flatnonzero(self.agent_step[agents] == self.bptt_horizon)
+        ended = start[self.agent_row[agents[start]] >= 0]
+        ended_rows = self.agent_row[agents[ended]]
+        for dst, src in zip(self.next_step, (value, reward, done, truncated)):
+            dst[ended_rows] = src[ended]
+        self.bootstrap[ended_rows] = 1
+        self.agent_row[agents[start]] = -1
+
+        start = start[:self.num_segments - self.next_row]
+        self.agent_row[agents[start]] = np.arange(
+            self.next_row, self.next_row + len(start))
+        self.agent_step[agents[start]] = 0
+        self.next_row += len(start)
+
+        keep = self.agent_step[agents] < self.bptt_horizon
+        indices, agents = indices[keep], agents[keep]
+        rows = self.agent_row[agents] * self.bptt_horizon + self.agent_step[agents]
+        self.agent_step[agents] += 1
+
+        if self.obs_index is not None:
+            self.obs_index[rows] = self.place_obs(obs, indices, obs_rows)
+        else:
+            self.obs[torch.as_tensor(rows, device=self.obs.device)] = obs.to(self.obs.device)[indices]
+        self.values_np[rows] = value[keep]
+        self.actions_np[rows] = action[indices]
+        self.logprobs_np[rows] = logprob.cpu().numpy()[indices]
+        self.rewards_np[rows] = reward[keep]
+        self.dones_np[rows] = done[keep]
+        self.truncateds_np[rows] = truncated[keep]
+        self.ptr += len(rows)
+        self.step += 1
+
+    def place_obs(self, obs, indices, obs_rows):
+        '''Rows of obs_rows holding the observations of agents indices.
+        Ones the workers did not write are copied into free rows'''
+        if obs_rows is None:
+            obs_rows = np.full(len(obs), -1, dtype=np.int64)
+
+        # Written rows of masked or dropped agents are free for copies
+        unused = np.ones(len(obs_rows), dtype=bool)
+        unused[indices] = False
+        self.obs_holes = np.concatenate((self.obs_holes, obs_rows[unused & (obs_rows >= 0)]))
+
+        rows = obs_rows[indices]
+        missing = rows < 0
+        if missing.any():
+            free = self.take_obs_rows(int(missing.sum()))
+            self.obs[torch.as_tensor(free)] = obs.cpu()[indices[missing]]
+            rows[missing] = free
+
+        return rows
+
+    def take_obs_rows(self, n):
+        holes, self.obs_holes = self.obs_holes[:n], self.obs_holes[n:]
+        fresh = (self.obs_cursor + np.arange(n - len(holes))) % len(self.obs)
+        self.obs_cursor = (self.obs_cursor + len(fresh)) % len(self.obs)
+        self.obs_used += len(fresh)
+        return np.concatenate((holes, fresh))
+
+    def reserve_obs_rows(self, num_agents, block):
+        '''Contiguous rows per block of agents for workers to write their next
+        observations into, or -1. Reserves at most batch_size rows per batch,
+        which keeps rows in use clear of the ring cursor'''
+        starts = np.full(num_agents // block, -1, dtype=np.int64)
+        for i in range(len(starts)):
+            if self.obs_used + block > self.batch_size:
+                break
+            if self.obs_cursor + block > len(self.obs):
+                break
+
+            starts[i] = self.obs_cursor
+            self.obs_cursor = (self.obs_cursor + block) % len(self.obs)
+            self.obs_used += block
+
+        rows = starts[:, None] + np.arange(block)
+        rows[starts < 0] = -1
+        return rows.ravel()
+
     def sort_training_data(self):
+        if self.segment_agents:
+            # Already in segment order
+            return slice(None)
+
         idxs = np.asarray(sorted(
             range(len(self.sort_keys)), key=self.sort_keys.__getitem__))
         self.b_idxs_obs = torch.as_tensor(idxs.reshape(
@@ -468,11 +805,62 @@ class Experience:
         self.b_idxs = self.b_idxs_obs.to(self.device)
         self.b_idxs_flat = self.b_idxs.reshape(
             self.num_minibatches, self.minibatch_size)
+        self.segment_env = np.asarray([k[0] for k in self.sort_keys])[idxs].reshape(
+            self.num_segments, self.bptt_horizon)
         self.sort_keys = []
         return idxs
 
+    def gae_segments(self, idxs):
+        '''Values, rewards, terminals and truncations as [segments, horizon + 1]
+        arrays, the last column being the step after each segment, and the
+        mask of segments that have one. Arguments to compute_segment_gae'''
+        segments, horizon = self.num_segments, self.bptt_horizon
+        arrays = [np.zeros((segments, horizon + 1), dtype=np.float32) for _ in range(4)]
+        values, rewards, terminals, truncations = arrays
+        for dst, src in zip(arrays, (self.values_np, self.rewards_np,
+                self.dones_np, self.truncateds_np)):
+            dst[:, :horizon] = src[idxs].reshape(segments, horizon)
+
+        if self.segment_agents:
+            for dst, src in zip(arrays, self.next_step):
+                dst[:, horizon] = src
+            return (*arrays, self.bootstrap)
+
+        # Sorted rows continue into the next row when it is the same agent
+        env = self.segment_env
+        for dst in arrays:
+            dst[:-1, horizon] = dst[1:, 0]
+        bootstrap = np.zeros(segments, dtype=np.float32)
+        bootstrap[:-1] = env[1:, 0] == env[:-1, -1]
+
+        # Each agent's last row continues into its first step after the
+        # batch filled, if it arrived
+        if self.after:
+            agents = np.fromiter(self.after, dtype=np.int64)
+            order = np.argsort(agents)
+            agents = agents[order]
+            after = np.asarray(list(self.after.values()), dtype=np.float32)[order]
+            rows = np.flatnonzero(bootstrap == 0)
+            pos = np.searchsorted(agents, env[rows, -1]).clip(max=len(agents) - 1)
+            found = agents[pos] == env[rows, -1]
+            rows, pos = rows[found], pos[found]
+            for dst, src in zip(arrays, after.T):
+                dst[rows, horizon] = src[pos]
+            bootstrap[rows] = 1
+
+        # Rows spanning two agents are cut as if truncated with no reward
+        switch = np.zeros((segments, horizon + 1), dtype=bool)
+        switch[:, 1:horizon] = env[:, 1:] != env[:, :-1]
+        rewards[switch] = 0
+        terminals[switch] = 0
+        truncations[switch] = 1
+        return (*arrays, bootstrap)
+
     def flatten_batch(self, advantages_np):
         advantages = torch.as_tensor(advantages_np).to(self.device)
+        if self.segment_agents:
+            return self.flatten_segments(advantages, advantages_np)
+
         b_idxs, b_flat = self.b_idxs, self.b_idxs_flat
         self.b_actions = self.actions.to(self.device, non_blocking=True)
         self.b_logprobs = self.logprobs.to(self.device, non_blocking=True)
@@ -482,13 +870,33 @@ class Experience:
             self.num_minibatches, self.bptt_horizon).transpose(0, 1).reshape(
             self.num_minibatches, self.minibatch_size)
         self.returns_np = advantages_np + self.values_np
-        self.b_obs = self.obs[self.b_idxs_obs]
+        if self.obs_index is not None:
+            self.b_obs = self.obs[torch.from_numpy(self.obs_index)[self.b_idxs_obs]]
+        else:
+            self.b_obs = self.obs[self.b_idxs_obs]
         self.b_actions = self.b_actions[b_idxs].contiguous()
         self.b_logprobs = self.b_logprobs[b_idxs]
         self.b_dones = self.b_dones[b_idxs]
         self.b_values = self.b_values[b_flat]
         self.b_returns = self.b_advantages + self.b_values
 
+    def flatten_segments(self, advantages, advantages_np):
+        # Minibatch mb is rows [mb*minibatch_rows, (mb+1)*minibatch_rows)
+        shape = (self.num_minibatches, self.minibatch_rows, self.bptt_horizon)
+        flat = (self.num_minibatches, self.minibatch_size)
+        if self.obs_index is not None:
+            self.b_obs = self.obs[torch.from_numpy(self.obs_index)].view(*shape, *self.obs.shape[1:])
+        else:
+            self.b_obs = self.obs.view(*shape, *self.obs.shape[1:])
+        self.b_actions = self.actions.to(self.device, non_blocking=True).view(
+            *shape, *self.actions.shape[1:])
+        self.b_logprobs = self.logprobs.to(self.device, non_blocking=True).view(shape)
+        self.b_dones = self.dones.to(self.device, non_blocking=True).view(shape)
+        self.b_values = self.values.to(self.device, non_blocking=True).view(flat)
+        self.b_advantages = advantages.view(flat)
+        self.returns_np = advantages_np + self.values_np
+        self.b_returns = self.b_advantages + self.b_values
+
 class Utilization(Thread):
     def __init__(self, delay=1, maxlen=20):
         super().__init__()
@@ -662,13 +1070,21 @@ def duration(seconds):
     s = seconds % 60
     return f"{b2}{h}{c2}h {b2}{m}{c2}m {b2}{s}{c2}s" if h else f"{b2}{m}{c2}m {b2}{s}{c2}s" if m else f"{b2}{s}{c2}s"
 
+def fmt_latency(seconds):
+    if seconds < 1e-3:
+        return f'{b2}{1e6*seconds:.0f}{c2}us'
+    elif seconds < 1:
+        return f'{b2}{1e3*seconds:.1f}{c2}ms'
+    return f'{b2}{seconds:.2f}{c2}s'
+
 def fmt_perf(name, time, uptime):
     percent = 0 if uptime == 0 else int(100*time/uptime - 1e-5)
     return f'{c1}{name}', duration(time), f'{b2}{percent:2d}%'
 
 # TODO: Add env name to print_dashboard
 def print_dashboard(env_name, utilization, global_step, epoch,
-        profile, losses, stats, msg, clear=False, max_stats=[0]):
+        profile, losses, stats, msg, clear=False, max_stats=[0], restarts=0,
+        vec_stats=None):
     console = Console()
     if clear:
         console.clear()
@@ -704,6 +1120,8 @@ def print_dashboard(env_name, utilization, global_step, epoch,
     s.add_row(f'{c2}Epoch', abbreviate(epoch))
     s.add_row(f'{c2}Uptime', duration(profile.uptime))
     s.add_row(f'{c2}Remaining', duration(profile.remaining))
+    if restarts:
+        s.add_row(f'{c2}Restarts', abbreviate(restarts))
 
     p = Table(box=None, expand=True, show_header=False)
     p.add_column(f"{c1}Performance", justify="left", width=10)
@@ -712,11 +1130,23 @@ def print_dashboard(env_name, utilization, global_step, epoch,
     p.add_row(*fmt_perf('Evaluate', profile.eval_time, profile.uptime))
     p.add_row(*fmt_perf('  Forward', profile.eval_forward_time, profile.uptime))
     p.add_row(*fmt_perf('  Env', profile.env_time, profile.uptime))
+    p.add_row(*fmt_perf('    Wait', profile.env_wait_time, profile.uptime))
     p.add_row(*fmt_perf('  Misc', profile.eval_misc_time, profile.uptime))
     p.add_row(*fmt_perf('Train', profile.train_time, profile.uptime))
     p.add_row(*fmt_perf('  Forward', profile.train_forward_time, profile.uptime))
     p.add_row(*fmt_perf('  Learn', profile.learn_time, profile.uptime))
     p.add_row(*fmt_perf('  Misc', profile.train_misc_time, profile.uptime))
+    if vec_stats is not None and vec_stats.step.count.sum() > 0:
+        # Worker step times from the vecenv, slowest worker's tail
+        slowest = int(vec_stats.step.p99.argmax())
+        p.add_row(f'{c1}Worker p50', fmt_latency(vec_stats.median), '')
+        p.add_row(f'{c1}  p99 #{slowest}', fmt_latency(vec_stats.step.p99[slowest]), '')
+        if vec_stats.stragglers:
+            p.add_row(f'{c1}  Stragglers', f'{b2}{len(vec_stats.stragglers)}', '')
+        if not np.isnan(vec_stats.reset_pool.hit_rate):
+            p.add_row(f'{c1}  Reset pool', f'{b2}{100*vec_stats.reset_pool.hit_rate:.0f}%', '')
+        if not np.isnan(vec_stats.recv_wait):
+            p.add_row(f'{c1}  Recv wait', f'{b2}{100*vec_stats.recv_wait:.0f}%', '')
 
     l = Table(box=None, expand=True, )
     l.add_column(f'{c1}Losses', justify="left", width=16)
@@ -4,6 +4,7 @@ import shutil
 import glob
 import uuid
 import ast
+import copy
 import os
 
 import pufferlib
@@ -204,16 +205,16 @@ def sweep_carbs(args, env_name, make_env, policy_cls, rnn_cls):
     )
     carbs = CARBS(carbs_params, param_spaces)
 
-    # GPUDrive doesn't let you reinit the vecenv, so we have to cache it
-    cache_vecenv = args['env_name'] == 'gpudrive'
+    # Keeps workers alive between trials so that uptime measures training.
+    # GPUDrive also doesn't let you reinit the vecenv
+    pool = pufferlib.vector.Pool()
 
     elos = {'model_random.pt': 1000}
-    vecenv = {'vecenv': None} # can't reassign otherwise
     shutil.rmtree('moba_elo', ignore_errors=True)
     os.mkdir('moba_elo')
     import time, torch
     def main():
-        print('Vecenv:', vecenv)
+        print('Vecenv pool:', pool.vecenv, f'({pool.hits} reused, {pool.misses} made)')
         # set torch and pytorch seeds to current time
         np.random.seed(int(time.time()))
         torch.manual_seed(int(time.time()))
@@ -252,12 +253,14 @@ def sweep_carbs(args, env_name, make_env, policy_cls, rnn_cls):
         print(wandb.config.env)
         print(wandb.config.policy)
         try:
-            stats, uptime, new_elos, vecenv['vecenv'] = train(args, make_env, policy_cls, rnn_cls,
-                wandb, elos=elos, vecenv=vecenv['vecenv'] if cache_vecenv else None)
+            stats, uptime, new_elos, _ = train(args, make_env, policy_cls, rnn_cls,
+                wandb, elos=elos, pool=pool)
             elos.update(new_elos)
         except Exception as e:
             import traceback
             traceback.print_exc()
+            # The pooled vecenv may be mid-step. Rebuild it next trial
+            pool.close()
         else:
             observed_value = stats[target_metric]
             print('Observed value:', observed_value)
@@ -271,10 +274,15 @@ def sweep_carbs(args, env_name, make_env, policy_cls, rnn_cls):
                 )
             )
 
-    wandb.agent(sweep_id, main, count=500)
+    # Pool workers are not daemons and would keep the interpreter alive
+    try:
+        wandb.agent(sweep_id, main, count=500)
+    finally:
+        pool.close()
 
 def train(args, make_env, policy_cls, rnn_cls, wandb,
-        eval_frac=0.1, elos={'model_random.pt': 1000}, vecenv=None, subprocess=False, queue=None):
+        eval_frac=0.1, elos={'model_random.pt': 1000}, vecenv=None, subprocess=False, queue=None,
+        pool=None):
     if subprocess:
         from multiprocessing import Process, Queue
         queue = Queue()
@@ -288,15 +296,36 @@ def train(args, make_env, policy_cls, rnn_cls, wandb,
         vec = pufferlib.vector.Serial
     elif args['vec'] == 'multiprocessing':
         vec = pufferlib.vector.Multiprocessing
+    elif args['vec'] == 'threaded':
+        vec = pufferlib.vector.Threaded
     elif args['vec'] == 'ray':
         vec = pufferlib.vector.Ray
     elif args['vec'] == 'native':
         vec = pufferlib.environment.PufferEnv
+    elif args['vec'] == 'auto':
+        vec = 'auto'
     else:
-        raise ValueError(f'Invalid --vec (serial/multiprocessing/ray/native).')
+        raise ValueError(f'Invalid --vec (serial/multiprocessing/threaded/ray/native/auto).')
+
+    policy = None
+    # The trainer takes one mean over each key's columnar infos
+    vec_kwargs = dict(columnar_infos=True)
+    if args['vec_segment_length'] > 0:
+        # Workers run CPU copies of the policy and return whole segments
+        driver = pufferlib.vector.probe_env(make_env, [], args['env'])
+        policy = make_policy(driver, policy_cls, rnn_cls, args)
+        vec_kwargs = dict(policy=copy.deepcopy(policy).cpu(),
+            segment_length=args['vec_segment_length'])
+    if args['vec_reset_pool'] > 0:
+        vec_kwargs['reset_pool'] = args['vec_reset_pool']
+    if args['vec_gather_thread']:
+        vec_kwargs['gather_thread'] = True
+    if args['vec_obs_rows']:
+        vec_kwargs['obs_rows'] = args['train']['batch_size']
 
     if vecenv is None:
-        vecenv = pufferlib.vector.make(
+        make_vecenv = pufferlib.vector.make if pool is None else pool.make
+        vecenv = make_vecenv(
             make_env,
             env_kwargs=args['env'],
             num_envs=args['train']['num_envs'],
@@ -305,9 +334,11 @@ def train(args, make_env, policy_cls, rnn_cls, wandb,
             zero_copy=args['train']['zero_copy'],
             overwork=args['vec_overwork'],
             backend=vec,
+            **vec_kwargs,
         )
 
-    policy = make_policy(vecenv.driver_env, policy_cls, rnn_cls, args)
+    if policy is None:
+        policy = make_policy(vecenv.driver_env, policy_cls, rnn_cls, args)
 
     '''
     if env_name == 'moba':
@@ -345,7 +376,7 @@ def train(args, make_env, policy_cls, rnn_cls, wandb,
             wandb.log({'environment/elo': elos[model_name]})
     '''
 
-    clean_pufferl.close(data)
+    clean_pufferl.close(data, close_vecenv=pool is None)
     if queue is not None:
         queue.put((stats, uptime, elos))
 
@@ -362,6 +393,14 @@ if __name__ == '__main__':
         choices='train eval evaluate sweep sweep-carbs autotune profile'.split())
     parser.add_argument('--vec-overwork', action='store_true',
         help='Allow vectorization to use >1 worker/core. Not recommended.')
+    parser.add_argument('--vec-segment-length', type=int, default=0,
+        help='Multiprocessing workers run a CPU copy of the policy for this many steps')
+    parser.add_argument('--vec-reset-pool', type=int, default=0,
+        help='Spare envs per worker that reset in the background')
+    parser.add_argument('--vec-gather-thread', action='store_true',
+        help='Gather the next zero_copy=False batch during the forward pass')
+    parser.add_argument('--vec-obs-rows', action='store_true',
+        help='Workers write observations into CPU experience storage')
     parser.add_argument('--eval-model-path', type=str, default=None,
         help='Path to a pretrained checkpoint')
     parser.add_argument('--baseline', action='store_true',
@@ -476,7 +515,8 @@ if __name__ == '__main__':
     elif args['mode'] == 'sweep-carbs':
         sweep_carbs(args, env_name, make_env, policy_cls, rnn_cls)
     elif args['mode'] == 'autotune':
-        pufferlib.vector.autotune(make_env, batch_size=args['train']['env_batch_size'])
+        pufferlib.vector.autotune(make_env, batch_size=args['train']['env_batch_size'],
+            env_kwargs=args['env'])
     elif args['mode'] == 'profile':
         import cProfile
         cProfile.run('train(args, make_env, policy_cls, rnn_cls, wandb=None)', 'stats.profile')
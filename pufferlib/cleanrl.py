@@ -23,12 +23,16 @@ def entropy(logits):
     return -p_log_p.sum(-1)
 
 def sample_logits(logits: Union[torch.Tensor, List[torch.Tensor]],
-        action=None, is_continuous=False):
+        action=None, is_continuous=False, out=None):
+    '''Samples actions, or scores the given ones. Sampled actions are also
+    written into out, e.g. a tensor over a vecenv's action_buffer'''
     is_discrete = isinstance(logits, torch.Tensor)
     if is_continuous:
         batch = logits.loc.shape[0]
         if action is None:
             action = logits.sample().view(batch, -1)
+            if out is not None:
+                out.copy_(action.view(out.shape))
 
         log_probs = logits.log_prob(action.view(batch, -1)).sum(1)
         logits_entropy = logits.entropy().view(batch, -1).sum(1)
@@ -40,7 +44,8 @@ def sample_logits(logits: Union[torch.Tensor, List[torch.Tensor]],
         normalized_logits = [l - l.logsumexp(dim=-1, keepdim=True) for l in logits]
 
 
-    if action is None:
+    sampled = action is None
+    if sampled:
         action = torch.stack([torch.multinomial(logits_to_probs(l), 1).squeeze() for l in logits])
     else:
         batch = logits[0].shape[0]
@@ -50,10 +55,14 @@ def sample_logits(logits: Union[torch.Tensor, List[torch.Tensor]],
     logprob = torch.stack([log_prob(l, a) for l, a in zip(normalized_logits, action)]).T.sum(1)
     logits_entropy = torch.stack([entropy(l) for l in normalized_logits]).T.sum(1)
 
+    action = action.squeeze(0) if is_discrete else action.T
+    if sampled and out is not None:
+        out.copy_(action.reshape(out.shape))
+
     if is_discrete:
-        return action.squeeze(0), logprob.squeeze(0), logits_entropy.squeeze(0)
+        return action, logprob.squeeze(0), logits_entropy.squeeze(0)
 
-    return action.T, logprob, logits_entropy
+    return action, logprob, logits_entropy
 
 
 class Policy(torch.nn.Module):
@@ -67,13 +76,13 @@ class Policy(torch.nn.Module):
         _, value = self.policy(x)
         return value
 
-    def get_action_and_value(self, x, action=None):
+    def get_action_and_value(self, x, action=None, out=None):
          logits, value = self.policy(x)
-         action, logprob, entropy = sample_logits(logits, action, self.is_continuous)
+         action, logprob, entropy = sample_logits(logits, action, self.is_continuous, out)
          return action, logprob, entropy, value
 
-    def forward(self, x, action=None):
-        return self.get_action_and_value(x, action)
+    def forward(self, x, action=None, out=None):
+        return self.get_action_and_value(x, action, out)
 
 
 class RecurrentPolicy(torch.nn.Module):
@@ -95,10 +104,10 @@ class RecurrentPolicy(torch.nn.Module):
     def get_value(self, x, state=None):
         _, value, _ = self.policy(x, state)
 
-    def get_action_and_value(self, x, state=None, action=None):
+    def get_action_and_value(self, x, state=None, action=None, out=None):
         logits, value, state = self.policy(x, state)
-        action, logprob, entropy = sample_logits(logits, action, self.is_continuous)
+        action, logprob, entropy = sample_logits(logits, action, self.is_continuous, out)
         return action, logprob, entropy, value, state
 
-    def forward(self, x, state=None, action=None):
-        return self.get_action_and_value(x, state, action)
+    def forward(self, x, state=None, action=None, out=None):
+        return self.get_action_and_value(x, state, action, out)
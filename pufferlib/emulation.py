@@ -196,7 +196,9 @@ class GymnasiumPufferEnv(gymnasium.Env):
 
         # Unpack actions from multidiscrete into the original action space
         if self.is_atn_emulated:
-            action = nativize(action, self.env.action_space, self.atn_dtype)
+            # Emulated action structs are int32, sampled MultiDiscrete int64
+            action = nativize(np.asarray(action, dtype=np.int32),
+                self.env.action_space, self.atn_dtype)
         elif isinstance(action, np.ndarray):
             action = action.ravel()
             # TODO: profile or speed up
@@ -360,7 +362,8 @@ class PettingZooPufferEnv:
                 continue
 
             if self.is_atn_emulated:
-                atn = nativize(atn, self.env_single_action_space, self.atn_dtype)
+                atn = nativize(np.asarray(atn, dtype=np.int32),
+                    self.env_single_action_space, self.atn_dtype)
 
             unpacked_actions[agent] = atn
 
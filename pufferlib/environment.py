@@ -1,4 +1,6 @@
 import numpy as np
+import pickle
+import io
 
 from pufferlib.exceptions import APIUsageError
 import pufferlib.spaces
@@ -31,6 +33,76 @@ def set_buffers(env, buf=None):
         env.masks = buf.masks
         env.actions = buf.actions
 
+def stats_dtype(log_schema):
+    '''Structured dtype of columnar infos for a log schema'''
+    return np.dtype([(k, np.float64) for k in log_schema])
+
+def is_columnar(info):
+    '''Columnar infos are structured arrays with one record per row and one
+    field per log_schema key. Envs can return them in their info lists
+    instead of one dict per record. Vecenvs expand them back into dicts
+    unless made with columnar_infos=True'''
+    return isinstance(info, np.ndarray) and info.dtype.names is not None
+
+BUFFERS = ('observations', 'rewards', 'terminals', 'truncations', 'masks', 'actions')
+
+class _SharedView(Exception):
+    pass
+
+class _StatePickler(pickle.Pickler):
+    '''Refuses arrays that view the env's buffers'''
+    def __init__(self, file, buffers):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.buffers = buffers
+
+    def persistent_id(self, obj):
+        if isinstance(obj, np.ndarray) and any(
+                np.may_share_memory(obj, b) for b in self.buffers):
+            raise _SharedView
+        return None
+
+def get_state(env):
+    '''Snapshot of an env for set_state
+
+    Envs can define get_state() and set_state(state) themselves, e.g. to copy
+    C structs. Otherwise attributes are pickled, except ones that reference
+    the env's buffers. Those are bindings that set_state keeps, and the
+    buffer contents are copied instead.
+    '''
+    if hasattr(env, 'get_state'):
+        return env.get_state()
+
+    buffers = [getattr(env, k) for k in BUFFERS if hasattr(env, k)]
+    attrs = {}
+    for k, v in vars(env).items():
+        if any(v is b for b in buffers):
+            continue
+
+        f = io.BytesIO()
+        try:
+            _StatePickler(f, buffers).dump(v)
+        except _SharedView:
+            continue
+        except (TypeError, pickle.PicklingError, AttributeError) as e:
+            raise APIUsageError(f'{type(env).__name__}.{k} cannot be pickled ({e}). '
+                'Define get_state and set_state on the env to snapshot it') from e
+
+        attrs[k] = f.getvalue()
+
+    return (attrs, {k: getattr(env, k).copy() for k in BUFFERS if hasattr(env, k)})
+
+def set_state(env, state):
+    '''Restores an env to a state from get_state'''
+    if hasattr(env, 'set_state'):
+        return env.set_state(state)
+
+    attrs, buffers = state
+    for k, v in attrs.items():
+        setattr(env, k, pickle.loads(v))
+
+    for k, v in buffers.items():
+        getattr(env, k)[:] = v
+
 class PufferEnv:
     def __init__(self, buf=None):
         if not hasattr(self, 'single_observation_space'):
@@ -24,6 +24,7 @@ class Breakout(pufferlib.PufferEnv):
         self.report_interval = report_interval
         self.render_mode = render_mode
         self.num_agents = num_envs
+        self.log_schema = ('episode_return', 'episode_length', 'score')
 
         super().__init__(buf)
         self.c_envs = CyBreakout(self.observations, self.actions, self.rewards,
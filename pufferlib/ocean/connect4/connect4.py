@@ -22,6 +22,7 @@ class Connect4(pufferlib.PufferEnv):
         self.report_interval = report_interval
         self.render_mode = render_mode
         self.num_agents = num_envs
+        self.log_schema = ('episode_return', 'episode_length', 'score')
 
         super().__init__(buf=buf)
         self.c_envs = CyConnect4(self.observations, self.actions, self.rewards,
@@ -20,17 +20,27 @@ class Moba(pufferlib.PufferEnv):
 
         self.report_interval = report_interval
         self.render_mode = render_mode
-        self.num_agents = 5*num_envs if script_opponents else 10*num_envs
 
-        self.single_observation_space = gymnasium.spaces.Box(low=0, high=255,
-            shape=(MAP_OBS_N + PLAYER_OBS_N,), dtype=np.uint8)
-        self.single_action_space = gymnasium.spaces.MultiDiscrete([7, 7, 3, 2, 2, 2])
+        spaces = Moba.probe(num_envs=num_envs, script_opponents=script_opponents)
+        self.num_agents = spaces.num_agents
+        self.single_observation_space = spaces.single_observation_space
+        self.single_action_space = spaces.single_action_space
 
         super().__init__(buf=buf)
         self.c_envs = CyMOBA(self.observations, self.actions, self.rewards,
             self.terminals, num_envs, vision_range, agent_speed, True,
             reward_death, reward_xp, reward_distance, reward_tower, script_opponents)
 
+    @staticmethod
+    def probe(num_envs=4, script_opponents=True, **kwargs):
+        '''Spaces and agent count without allocating any games'''
+        return pufferlib.namespace(
+            num_agents=5*num_envs if script_opponents else 10*num_envs,
+            single_observation_space=gymnasium.spaces.Box(low=0, high=255,
+                shape=(MAP_OBS_N + PLAYER_OBS_N,), dtype=np.uint8),
+            single_action_space=gymnasium.spaces.MultiDiscrete([7, 7, 3, 2, 2, 2]),
+        )
+
     def reset(self, seed=0):
         self.c_envs.reset()
         self.tick = 0
@@ -25,6 +25,7 @@ class Pong(pufferlib.PufferEnv):
         self.single_action_space = gymnasium.spaces.Discrete(3)
         self.render_mode = render_mode
         self.num_agents = num_envs
+        self.log_schema = ('episode_return', 'episode_length', 'score')
 
         self.report_interval = report_interval
         self.human_action = None
@@ -26,6 +26,8 @@ class Rware(pufferlib.PufferEnv):
 
         # env
         self.num_agents = num_envs*num_agents
+        self.log_schema = ('episode_return', 'episode_length',
+            'shelves_delivered', 'score')
         self.render_mode = render_mode
         self.report_interval = report_interval
         
@@ -38,6 +38,7 @@ class Snake(pufferlib.PufferEnv):
             low=0, high=2, shape=(2*vision+1, 2*vision+1), dtype=np.int8)
         self.single_action_space = gymnasium.spaces.Discrete(4)
         self.num_agents = sum(num_snakes)
+        self.log_schema = ('episode_return', 'episode_length', 'score')
         self.render_mode = render_mode
         self.tick = 0
 
@@ -5,10 +5,15 @@ from pdb import set_trace as T
 import numpy as np
 import time
 import psutil
+import os
+import struct
+import copy
+from multiprocessing.connection import wait
 
 from pufferlib import namespace
 from pufferlib.emulation import GymnasiumPufferEnv, PettingZooPufferEnv
-from pufferlib.environment import PufferEnv, set_buffers
+from pufferlib.environment import (PufferEnv, set_buffers, get_state, set_state,
+    stats_dtype, is_columnar)
 from pufferlib.exceptions import APIUsageError
 from pufferlib.namespace import Namespace
 import pufferlib.spaces
@@ -19,8 +24,33 @@ STEP = 1
 SEND = 2
 RECV = 3
 CLOSE = 4
-MAIN = 5
-INFO = 6
+SNAPSHOT = 5
+RESTORE = 6
+MAIN = 7
+INFO = 8
+
+# Seconds between liveness checks of spinning workers
+HEALTH_CHECK_INTERVAL = 0.1
+
+# Batches before Threaded checks whether envs release the GIL
+GIL_CHECK_BATCHES = 100
+
+# Bytes per worker slice for Multiprocessing(padding=...)
+PADDING = {None: 0, 'cacheline': 64, 'page': os.sysconf('SC_PAGE_SIZE')}
+
+# Worker telemetry: log-bucketed nanosecond histograms with 4 buckets per
+# power of two, one per worker and command kind
+TELEMETRY_KINDS = ('step', 'reset', 'info')
+TELEMETRY_BUCKETS = 4 * 41
+
+# Workers whose p99 step time exceeds this multiple of the median step time
+# across all workers are reported as stragglers
+STRAGGLER_RATIO = 3.0
+
+# Per-agent outputs that recv returns from worker buffers
+GATHER_KEYS = ('observations', 'rewards', 'terminals', 'truncations', 'masks')
+
+AUTOTUNE_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'pufferlib', 'autotune.json')
 
 def recv_precheck(vecenv):
     if vecenv.flag != RECV:
@@ -60,8 +90,14 @@ class Serial:
     def num_envs(self):
         return self.agents_per_batch
  
-    def __init__(self, env_creators, env_args, env_kwargs, num_envs, buf=None, **kwargs):
+    def __init__(self, env_creators, env_args, env_kwargs, num_envs, buf=None,
+            reset_pool=0, reset_pool_counts=None, columnar_infos=False, **kwargs):
+        self.columnar_infos = columnar_infos
         self.driver_env = env_creators[0](*env_args[0], **env_kwargs[0])
+
+        # Native envs reset internally and are never done
+        if isinstance(self.driver_env, PufferEnv):
+            reset_pool = 0
         self.agents_per_batch = self.driver_env.num_agents * num_envs
         self.num_agents = self.agents_per_batch
 
@@ -73,7 +109,11 @@ class Serial:
 
         set_buffers(self, buf)
 
+        # Envs in the reset pool are swapped between slots, so they keep
+        # their own buffers and copy outputs into their slot after each call
+        self.reset_pool = reset_pool
         self.envs = []
+        self.bufs = []
         ptr = 0
         for i in range(num_envs):
             end = ptr + self.driver_env.num_agents
@@ -86,8 +126,10 @@ class Serial:
                 actions=self.actions[ptr:end]
             )
             ptr = end
-            env = env_creators[i](*env_args[i], buf=buf_i, **env_kwargs[i])
+            env_buf = None if reset_pool else buf_i
+            env = env_creators[i](*env_args[i], buf=env_buf, **env_kwargs[i])
             self.envs.append(env)
+            self.bufs.append(buf_i)
 
         self.driver_env = driver = self.envs[0]
         self.emulated = self.driver_env.emulated
@@ -98,6 +140,64 @@ class Serial:
         self.initialized = False
         self.flag = RESET
 
+        # Hits and misses of the reset pool. Workers pass a shared array
+        if reset_pool_counts is None:
+            reset_pool_counts = np.zeros(2, dtype=np.int64)
+        self.reset_pool_counts = reset_pool_counts
+
+        # Futures of (env, info) for spares resetting in the background
+        self.spares = []
+        if reset_pool:
+            from concurrent.futures import ThreadPoolExecutor
+            self.reset_executor = ThreadPoolExecutor(max_workers=reset_pool)
+            for i in range(reset_pool):
+                j = i % num_envs
+                env = env_creators[j](*env_args[j], **env_kwargs[j])
+                self.spares.append(self._done_future((env, {})))
+
+    @property
+    def reset_pool_hit_rate(self):
+        '''Fraction of episode ends served by an already reset spare env'''
+        hits, misses = self.reset_pool_counts
+        total = hits + misses
+        return hits / total if total else float('nan')
+
+    def _done_future(self, result):
+        from concurrent.futures import Future
+        future = Future()
+        future.set_result(result)
+        return future
+
+    def _reset_spare(self, env, seed=None):
+        _, info = env.reset(seed=seed)
+        return env, info
+
+    def _swap_spare(self, idx):
+        '''Puts a spare that finished resetting into slot idx and starts
+        resetting the env it replaces. Returns its reset info or None'''
+        for k, future in enumerate(self.spares):
+            if future.done():
+                break
+        else:
+            self.reset_pool_counts[1] += 1
+            return None
+
+        spare, info = self.spares.pop(k).result()
+        self.spares.append(self.reset_executor.submit(
+            self._reset_spare, self.envs[idx]))
+        self.envs[idx] = spare
+        self.reset_pool_counts[0] += 1
+        return info
+
+    def _copy_outputs(self, idx):
+        env = self.envs[idx]
+        buf = self.bufs[idx]
+        buf.observations[:] = env.observations
+        buf.rewards[:] = env.rewards
+        buf.terminals[:] = env.terminals
+        buf.truncations[:] = env.truncations
+        buf.masks[:] = env.masks
+
     def async_reset(self, seed=42):
         self.flag = RECV
         seed = make_seeds(seed, len(self.envs))
@@ -111,7 +211,17 @@ class Serial:
             else:
                 infos.append(i)
 
-        self.infos = infos
+        if self.reset_pool:
+            for idx in range(len(self.envs)):
+                self._copy_outputs(idx)
+
+        # Which spare replaces which env depends on timing, so spares are
+        # not seeded
+        spares = [f.result()[0] for f in self.spares]
+        self.spares = [self.reset_executor.submit(self._reset_spare, env)
+            for env in spares]
+
+        self.infos = _finish_infos(infos, self.columnar_infos)
 
     def send(self, actions):
         if not actions.flags.contiguous:
@@ -123,11 +233,22 @@ class Serial:
         for idx, env in enumerate(self.envs):
             end = ptr + self.agents_per_env[idx]
             atns = actions[ptr:end]
-            if env.done:
+            i = None
+            if env.done and self.reset_pool:
+                i = self._swap_spare(idx)
+
+            if i is not None:
+                env = self.envs[idx]
+            elif env.done:
                 o, i = env.reset()
             else:
+                if self.reset_pool:
+                    env.actions[:] = atns
                 o, r, d, t, i = env.step(atns)
 
+            if self.reset_pool:
+                self._copy_outputs(idx)
+
             if i:
                 if isinstance(i, list):
                     self.infos.extend(i)
@@ -136,68 +257,488 @@ class Serial:
 
             ptr = end
 
+        self.infos = _finish_infos(self.infos, self.columnar_infos)
+
     def recv(self):
         recv_precheck(self)
         return (self.observations, self.rewards, self.terminals, self.truncations,
             self.infos, self.agent_ids, self.masks)
 
+    def snapshot(self):
+        '''Handle to the state of every env, for restore'''
+        spares = [f.result() for f in self.spares]
+        self.spares = [self._done_future(s) for s in spares]
+        return ([get_state(env) for env in self.envs]
+            + [(get_state(env), info) for env, info in spares])
+
+    def restore(self, handle):
+        '''Restores a snapshot. The next recv returns its observations'''
+        for env, state in zip(self.envs, handle):
+            set_state(env, state)
+
+        if self.reset_pool:
+            for idx in range(len(self.envs)):
+                self._copy_outputs(idx)
+
+        spares = [f.result()[0] for f in self.spares]
+        self.spares = []
+        for env, (state, info) in zip(spares, handle[len(self.envs):]):
+            set_state(env, state)
+            self.spares.append(self._done_future((env, info)))
+
+        self.infos = []
+        self.flag = RECV
+
     def close(self):
         for env in self.envs:
             env.close()
 
+        if self.reset_pool:
+            for future in self.spares:
+                future.result()[0].close()
+
+            self.reset_executor.shutdown(wait=True)
+
+def _merge_columnar(infos):
+    '''Concatenates columnar infos with the same dtype into one array at the
+    end of the list. Dict infos are left in place'''
+    columns = {}
+    merged = []
+    for info in infos:
+        if is_columnar(info):
+            columns.setdefault(info.dtype, []).append(info)
+        else:
+            merged.append(info)
+
+    if not columns:
+        return infos
+
+    for arrays in columns.values():
+        merged.append(arrays[0] if len(arrays) == 1 else np.concatenate(arrays))
+
+    return merged
+
+def _columnar_to_dicts(infos):
+    '''Expands columnar infos into one dict per record, leaving out nan
+    fields (keys a ring record did not have). Dict infos are left in place'''
+    expanded = []
+    for info in infos:
+        if not is_columnar(info):
+            expanded.append(info)
+            continue
+
+        names = info.dtype.names
+        for record in info.tolist():
+            expanded.append({k: v for k, v in zip(names, record)
+                if not (isinstance(v, float) and v != v)})
+
+    return expanded
+
+def _finish_infos(infos, columnar):
+    '''Infos as recv returns them: columnar infos merged into one array per
+    dtype with columnar_infos=True, otherwise a list of dicts'''
+    if columnar:
+        return _merge_columnar(infos)
+
+    return _columnar_to_dicts(infos)
+
+def _write_info_ring(ring, infos):
+    '''Writes numeric infos matching the log schema to the shared-memory
+    ring and returns the rest, which still have to be sent over the pipe'''
+    remaining = []
+    size = len(ring.data)
+    for info in infos:
+        head = ring.head[0]
+        if is_columnar(info) and set(info.dtype.names) <= ring.keys:
+            # Columnar infos are copied a field at a time. Rows that do
+            # not fit go over the pipe
+            n = min(len(info), size - (head - ring.tail[0]))
+            rows = np.full((n, len(ring.schema)), np.nan)
+            try:
+                for k in info.dtype.names:
+                    rows[:, ring.schema.index(k)] = info[k][:n]
+            except (TypeError, ValueError):
+                remaining.append(info)
+                continue
+
+            ring.data[np.arange(head, head + n) % size] = rows
+            ring.head[0] = head + n
+            if n < len(info):
+                remaining.append(info[n:])
+            continue
+
+        if (not isinstance(info, dict) or head - ring.tail[0] >= size
+                or not info.keys() <= ring.keys):
+            remaining.append(info)
+            continue
+
+        try:
+            ring.data[head % size] = [info.get(k, np.nan) for k in ring.schema]
+        except (TypeError, ValueError):
+            remaining.append(info)
+            continue
+
+        ring.head[0] = head + 1
+
+    return remaining
+
+def _time_bucket(ns):
+    bits = ns.bit_length()
+    if bits < 3:
+        return ns
+
+    return min(4*bits + (ns >> (bits - 3)) - 4, TELEMETRY_BUCKETS - 1)
+
+def hist_quantile(counts, q):
+    '''Approximate quantile in seconds of a telemetry histogram'''
+    total = counts.sum()
+    if total == 0:
+        return 0.0
+
+    idx = int(np.searchsorted(np.cumsum(counts), q * total))
+    if idx < 8:
+        return idx * 1e-9
+
+    bits, sub = divmod(idx, 4)
+    width = 1 << (bits - 3)
+    return ((4 + sub) * width + width / 2) * 1e-9
+
+def segment_views(shm, num_workers, agents_per_worker, obs_shape, obs_dtype, atn_shape, atn_dtype):
+    '''Time-major views of actor mode segments, (T, num_workers, agents, ...)'''
+    shape = (shm.segment_length, num_workers, agents_per_worker)
+    return namespace(
+        observations=np.ndarray((*shape, *obs_shape), dtype=obs_dtype,
+            buffer=shm.seg_observations),
+        actions=np.ndarray((*shape, *atn_shape), dtype=atn_dtype,
+            buffer=shm.seg_actions),
+        logprobs=np.ndarray(shape, dtype=np.float32, buffer=shm.seg_logprobs),
+        values=np.ndarray(shape, dtype=np.float32, buffer=shm.seg_values),
+        rewards=np.ndarray(shape, dtype=np.float32, buffer=shm.seg_rewards),
+        terminals=np.ndarray(shape, dtype=bool, buffer=shm.seg_terminals),
+        truncations=np.ndarray(shape, dtype=bool, buffer=shm.seg_truncations),
+        masks=np.ndarray(shape, dtype=bool, buffer=shm.seg_masks),
+    )
+
+class TorchActor:
+    '''Runs a non-recurrent CleanRL policy on CPU inside a worker
+
+    Other actors (e.g. puffernet forward passes) implement the same members:
+    num_params, load_weights(flat float32 parameters in named_parameters
+    order), get_weights() returning the same flat array, and
+    __call__(obs) -> (actions, logprobs, values).
+    '''
+    def __init__(self, policy):
+        import torch
+        # One thread per worker process. Workers already use every core
+        torch.set_num_threads(1)
+        self.policy = policy.cpu()
+        self.num_params = sum(p.numel() for p in policy.parameters())
+
+    def load_weights(self, flat):
+        import torch
+        torch.nn.utils.vector_to_parameters(torch.from_numpy(flat), self.policy.parameters())
+
+    def get_weights(self):
+        import torch
+        return torch.nn.utils.parameters_to_vector(
+            self.policy.parameters()).detach().numpy()
+
+    def __call__(self, obs):
+        import torch
+        with torch.no_grad():
+            actions, logprobs, _, values = self.policy(torch.from_numpy(obs))
+
+        return actions.numpy(), logprobs.numpy(), values.numpy().ravel()
+
 def _worker_process(env_creators, env_args, env_kwargs, obs_shape, obs_dtype, atn_shape, atn_dtype,
-        num_envs, num_agents, num_workers, worker_idx, send_pipe, recv_pipe, shm, is_native):
+        num_envs, num_agents, num_workers, worker_idx, send_pipe, recv_pipe, shm, is_native,
+        events=None, log_schema=None, double_buffer=False, cpus=None, numa=False,
+        actor=None, reset_pool=0, reset_seed=None, slot=0):
+
+    # Pin before creating envs so that their allocations and the first touch
+    # of this worker's shared memory slice land on the local NUMA node
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
 
     # Environments read and write directly to shared memory
     shape = (num_workers, num_envs*num_agents)
-    atn_arr = np.ndarray((*shape, *atn_shape),
-        dtype=atn_dtype, buffer=shm.actions)[worker_idx]
+    agents = num_envs*num_agents
+    align = shm.data_align
+    atn_arr = worker_rows(shm.actions, num_workers,
+        (agents, *atn_shape), atn_dtype, align)[worker_idx]
     buf = namespace(
-        observations=np.ndarray((*shape, *obs_shape),
-            dtype=obs_dtype, buffer=shm.observations)[worker_idx],
-        rewards=np.ndarray(shape, dtype=np.float32, buffer=shm.rewards)[worker_idx],
-        terminals=np.ndarray(shape, dtype=bool, buffer=shm.terminals)[worker_idx],
-        truncations=np.ndarray(shape, dtype=bool, buffer=shm.truncateds)[worker_idx],
-        masks=np.ndarray(shape, dtype=bool, buffer=shm.masks)[worker_idx],
+        observations=worker_rows(shm.observations, num_workers,
+            (agents, *obs_shape), obs_dtype, align)[worker_idx],
+        rewards=worker_rows(shm.rewards, num_workers, (agents,), np.float32, align)[worker_idx],
+        terminals=worker_rows(shm.terminals, num_workers, (agents,), bool, align)[worker_idx],
+        truncations=worker_rows(shm.truncateds, num_workers, (agents,), bool, align)[worker_idx],
+        masks=worker_rows(shm.masks, num_workers, (agents,), bool, align)[worker_idx],
         actions=atn_arr,
     )
     buf.masks[:] = True
+    if numa:
+        buf.actions[:] = 0
+        buf.observations[:] = 0
+
+    # Envs hold pointers to a single buffer, so the worker publishes each
+    # result into whichever of the two output slots the main process is not
+    # currently reading from. Native envs bind their buffers once at init
+    # and cannot be re-pointed per step, so this costs one copy of the
+    # worker's outputs per step
+    out = None
+    if double_buffer:
+        out_shape = (2, *shape)
+        out = namespace(
+            observations=np.ndarray((*out_shape, *obs_shape),
+                dtype=obs_dtype, buffer=shm.out_observations)[:, worker_idx],
+            rewards=np.ndarray(out_shape, dtype=np.float32,
+                buffer=shm.out_rewards)[:, worker_idx],
+            terminals=np.ndarray(out_shape, dtype=bool,
+                buffer=shm.out_terminals)[:, worker_idx],
+            truncations=np.ndarray(out_shape, dtype=bool,
+                buffer=shm.out_truncateds)[:, worker_idx],
+            masks=np.ndarray(out_shape, dtype=bool,
+                buffer=shm.out_masks)[:, worker_idx],
+            slots=np.ndarray(num_workers, dtype=np.uint8, buffer=shm.out_slots),
+        )
+        if numa:
+            for v in out.values():
+                if v is not out.slots:
+                    v[:] = 0
+
+    def make_envs(env_kwargs):
+        if is_native and num_envs == 1:
+            return env_creators[0](*env_args[0], **env_kwargs[0], buf=buf)
+
+        return Serial(env_creators, env_args, env_kwargs, num_envs, buf=buf,
+            reset_pool=reset_pool, reset_pool_counts=reset_pool_counts,
+            columnar_infos=True)
+
+    reset_pool_counts = np.ndarray((num_workers, 2), dtype=np.int64,
+        buffer=shm.reset_pool)[worker_idx]
+    envs = make_envs(env_kwargs)
+
+    # Observations are also written to the learner's rows the main process
+    # picked for this command, if any
+    obs_rows = obs_targets = None
+    if shm.obs_rows is not None:
+        obs_rows = np.frombuffer(shm.obs_rows, dtype=obs_dtype).reshape(-1, *obs_shape)
+        obs_targets = np.ndarray(num_workers, dtype=np.int64, buffer=shm.obs_targets)
+
+    # Respawned workers start from a fresh episode. The main process has
+    # already masked this worker's agents out of the batch in flight
+    if reset_seed is not None:
+        envs.reset(seed=reset_seed)
+
+    ring = None
+    if log_schema is not None:
+        ring_size = len(shm.info_ring) // (num_workers * len(log_schema))
+        ring = namespace(
+            schema=log_schema,
+            keys=set(log_schema),
+            data=np.ndarray((num_workers, ring_size, len(log_schema)),
+                dtype=np.float64, buffer=shm.info_ring)[worker_idx],
+            head=np.ndarray(num_workers, dtype=np.int64,
+                buffer=shm.info_head)[worker_idx:worker_idx+1],
+            tail=np.ndarray(num_workers, dtype=np.int64,
+                buffer=shm.info_tail)[worker_idx:worker_idx+1],
+        )
 
-    if is_native and num_envs == 1:
-        envs = env_creators[0](*env_args[0], **env_kwargs[0], buf=buf)
-    else:
-        envs = Serial(env_creators, env_args, env_kwargs, num_envs, buf=buf)
-
-    semaphores=np.ndarray(num_workers, dtype=np.uint8, buffer=shm.semaphores)
+    # Actor mode: each command runs the policy for a whole segment here
+    # instead of a single step driven by the main process
+    if actor is not None:
+        if not hasattr(actor, 'load_weights'):
+            actor = TorchActor(actor)
+
+        seg = segment_views(shm, num_workers, agents, obs_shape, obs_dtype,
+            atn_shape, atn_dtype)
+        seg = namespace(**{k: v[:, worker_idx] for k, v in seg.items()})
+        weights = np.frombuffer(shm.weights, dtype=np.float32)
+        weights_version = np.frombuffer(shm.weights_version, dtype=np.int64)
+        loaded_version = 0
+
+    def run_segment(infos):
+        # Seqlock: the main process makes the version odd while writing
+        nonlocal loaded_version
+        version = int(weights_version[0])
+        if version != loaded_version and version % 2 == 0:
+            flat = weights.copy()
+            if weights_version[0] == version:
+                actor.load_weights(flat)
+                loaded_version = version
+
+        infos = list(infos)
+        for t in range(shm.segment_length):
+            actions, logprobs, values = actor(buf.observations)
+            seg.observations[t] = buf.observations
+            seg.rewards[t] = buf.rewards
+            seg.terminals[t] = buf.terminals
+            seg.truncations[t] = buf.truncations
+            seg.masks[t] = buf.masks
+            seg.actions[t] = actions
+            seg.logprobs[t] = logprobs
+            seg.values[t] = values
+            atn_arr[:] = actions
+            _, _, _, _, step_infos = envs.step(atn_arr)
+            infos.extend(step_infos)
+
+        return infos
+
+    # Indexing the ctypes array directly is cheaper than a numpy view
+    telemetry = shm.telemetry
+    step_hist, reset_hist, info_hist = (TELEMETRY_BUCKETS*(3*worker_idx + k)
+        for k in range(3))
+
+    semaphores=worker_rows(shm.semaphores, num_workers, (), np.uint8, shm.sem_align)
     start = time.time()
     while True:
         sem = semaphores[worker_idx]
         if sem >= MAIN:
-            if time.time() - start > 0.5:
+            if events is not None:
+                # Blocks until the main process writes a new semaphore
+                os.eventfd_read(events.workers[worker_idx])
+            elif time.time() - start > 0.5:
                 time.sleep(0.01)
             continue
 
         start = time.time()
+        t0 = time.perf_counter_ns()
+        hist = reset_hist if sem == RESET else step_hist if sem == STEP else None
         if sem == RESET:
             seeds = recv_pipe.recv()
+            if isinstance(seeds, Namespace):
+                # Rebuild envs with new kwargs in place (see reconfigure)
+                envs.close()
+                envs = make_envs(seeds.env_kwargs)
+                seeds = seeds.seeds
+
             _, infos = envs.reset(seed=seeds)
+            if actor is not None:
+                infos = run_segment(infos)
+        elif sem == STEP and actor is not None:
+            infos = run_segment([])
         elif sem == STEP:
             _, _, _, _, infos = envs.step(atn_arr)
+        elif sem == SNAPSHOT:
+            send_pipe.send(envs.snapshot() if isinstance(envs, Serial) else get_state(envs))
+            infos = []
+        elif sem == RESTORE:
+            state = recv_pipe.recv()
+            if isinstance(envs, Serial):
+                # Restored observations are already in shared memory
+                envs.restore(state)
+                envs.recv()
+            else:
+                set_state(envs, state)
+            infos = []
         elif sem == CLOSE:
             envs.close()
             send_pipe.send(None)
             break
 
+        if hist is not None:
+            telemetry[hist + _time_bucket(time.perf_counter_ns() - t0)] += 1
+        if obs_rows is not None and hist is not None:
+            row = obs_targets[worker_idx]
+            if row >= 0:
+                obs_rows[row:row + agents] = buf.observations
+        if out is not None:
+            out.observations[slot] = buf.observations
+            out.rewards[slot] = buf.rewards
+            out.terminals[slot] = buf.terminals
+            out.truncations[slot] = buf.truncations
+            out.masks[slot] = buf.masks
+            out.slots[worker_idx] = slot
+            slot ^= 1
+
+        if infos and ring is not None:
+            infos = _write_info_ring(ring, infos)
+
         if infos:
+            t0 = time.perf_counter_ns()
             semaphores[worker_idx] = INFO
             send_pipe.send(infos)
+            telemetry[info_hist + _time_bucket(time.perf_counter_ns() - t0)] += 1
         else:
             semaphores[worker_idx] = MAIN
 
+        if events is not None:
+            os.eventfd_write(events.main, 1)
+
 class Multiprocessing:
     '''Runs environments in parallel using multiprocessing
 
     Use this vectorization module for most applications
+
+    If the env declares a log_schema (a tuple of numeric info keys), infos
+    made up only of those keys are passed through a per-worker shared-memory
+    ring of info_ring_size records instead of being pickled over a pipe.
+    This includes columnar infos (see pufferlib.environment.is_columnar).
+    recv returns them as dicts, like every other backend, unless
+    columnar_infos=True. Then they come back as a single structured array
+    at the end of infos, with nan for keys that a record did not have.
+
+    With double_buffer=True, each worker alternates between two output
+    buffers. The views returned by recv stay valid until the next recv of the
+    same workers, so actions can be sent before the batch is consumed.
+
+    placement pins workers and the main process to cores. 'cores' gives each
+    worker its own physical core. 'numa' also keeps consecutive workers on
+    the same NUMA node and lets each worker allocate its own shared memory
+    slice there. The chosen layout is stored in self.layout and can be
+    passed back as placement to reproduce it.
+
+    Workers that die are detected in recv. Each worker is respawned onto its
+    own shared memory slice up to max_restarts times, with its envs reset and
+    its agents masked out of the batch that was in flight. Its next batch
+    is marked truncated with zero reward, since it starts new episodes.
+    self.restarts counts restarts per worker. With the default of 0, recv
+    raises instead.
+
+    padding ('cacheline' or 'page') aligns each worker's semaphore, and its
+    data slices if batches are single workers or zero_copy=False, to its own
+    cache line or page so that workers do not false-share.
+
+    If the env creator has a probe(*args, **kwargs) attribute returning a
+    namespace with single_observation_space, single_action_space and
+    num_agents, it is used instead of building a full driver env. With
+    start_method='forkserver', workers fork from a server that has already
+    imported the env's module. startup_time and time_to_first_batch are
+    recorded in seconds.
+
+    With a CPU policy and segment_length, workers act as IMPALA-style actors:
+    each runs the policy itself (a TorchActor wraps torch policies) for
+    segment_length steps per command. Use recv_segment instead of
+    recv/send, and update_policy to push new weights through shared memory.
+
+    Workers record step, reset and info send times into shared memory
+    histograms. stats() summarizes them per worker and flags stragglers.
+
+    When every batch is all workers, batch_timeout (seconds) bounds how long
+    recv waits for them. Workers still busy at the deadline have their
+    agents masked out of the batch, are skipped by send, and rejoin the
+    batch once they finish. self.late_counts counts this per worker.
+
+    With zero_copy=False, batches of non-contiguous workers are gathered
+    into two reusable buffers that recv returns in turn. gather_thread=True
+    selects and gathers the next batch on a helper thread while the caller
+    runs its policy on the current one.
+
+    reset_pool spare envs per worker reset on a background thread, and one
+    that has finished is swapped in when an episode ends instead of
+    resetting inline. This hides resets that release the GIL (emulators,
+    simulators, IO). stats() reports the pool hit rate.
+
+    snapshot() returns the state of every worker's envs and restore(handle)
+    rolls them back to it. Envs may define get_state/set_state; otherwise
+    their attributes are pickled (see pufferlib.environment.get_state).
+
+    obs_rows=N allocates self.obs_rows, a shared ring of observation rows
+    that a learner storing N samples per batch can use as its storage.
+    It has 2 * num_agents extra rows for agents in flight. send(actions,
+    obs_rows) has each worker also write its next observations into the
+    given rows, and observation_rows() returns where each agent of the
+    last recv was written.
     '''
     reset = reset
     step = step
@@ -208,12 +749,39 @@ class Multiprocessing:
  
     def __init__(self, env_creators, env_args, env_kwargs,
             num_envs, num_workers=None, batch_size=None,
-            zero_copy=True, overwork=False, **kwargs):
+            zero_copy=True, overwork=False, blocking=False, info_ring_size=64,
+            double_buffer=False, placement=None, max_restarts=0, padding=None,
+            start_method=None, policy=None, segment_length=None,
+            batch_timeout=None, reset_pool=0, gather_thread=False, obs_rows=0,
+            columnar_infos=False, **kwargs):
+        self.init_start = time.time()
+        self.columnar_infos = columnar_infos
         if batch_size is None:
             batch_size = num_envs
         if num_workers is None:
             num_workers = num_envs
 
+        # Only fork shares eventfds and mmap buffers with workers
+        if start_method not in (None, 'fork', 'forkserver', 'spawn'):
+            raise APIUsageError(f'Invalid start_method: {start_method} (fork/forkserver/spawn)')
+        if start_method not in (None, 'fork') and (blocking or padding or placement == 'numa'):
+            raise APIUsageError(f'start_method={start_method} does not support '
+                'blocking, padding or placement=numa')
+
+        if batch_timeout is not None and double_buffer:
+            # Late workers would fall out of phase with their block's slot
+            raise APIUsageError('batch_timeout does not support double_buffer')
+        if gather_thread and (zero_copy or policy is not None):
+            raise APIUsageError('gather_thread requires zero_copy=False and no policy')
+        if obs_rows and policy is not None:
+            raise APIUsageError('obs_rows does not support policy')
+
+        if blocking and not hasattr(os, 'eventfd'):
+            raise APIUsageError(
+                'blocking=True requires os.eventfd (Linux, Python 3.10+)')
+        if placement is not None and not hasattr(os, 'sched_setaffinity'):
+            raise APIUsageError('placement requires os.sched_setaffinity (Linux)')
+
         import psutil
         cpu_cores = psutil.cpu_count(logical=False)
         if num_workers > cpu_cores and not overwork:
@@ -223,17 +791,11 @@ class Multiprocessing:
                 'If you really want to do this, set overwork=True (--vec-overwork in our demo.py).',
             ]))
 
-        num_batches = num_envs / batch_size
-        if zero_copy and num_batches != int(num_batches):
-            # This is so you can have n equal buffers
-            raise APIUsageError(
-                'zero_copy: num_envs must be divisible by batch_size')
-
         self.num_environments = num_envs
         envs_per_worker = num_envs // num_workers
         self.envs_per_worker = envs_per_worker
-        self.workers_per_batch = batch_size // envs_per_worker
         self.num_workers = num_workers
+        self.zero_copy = zero_copy
 
         # I really didn't want to need a driver process... with mp.shared_memory
         # we can fetch this data from the worker processes and ever perform
@@ -241,11 +803,11 @@ class Multiprocessing:
         # with the resource tracker that spams warnings and does not work with
         # forked processes. So for now, RawArray is much more reliable.
         # You can't send a RawArray through a pipe.
-        self.driver_env = driver_env = env_creators[0](*env_args[0], **env_kwargs[0])
-        is_native = isinstance(driver_env, PufferEnv)
+        self.driver_env = driver_env = probe_env(env_creators[0], env_args[0], env_kwargs[0])
+        is_native = isinstance(driver_env, PufferEnv) or (
+            isinstance(driver_env, Namespace) and not getattr(driver_env, 'emulated', False))
         self.emulated = False if is_native else driver_env.emulated
         self.num_agents = num_agents = driver_env.num_agents * num_envs
-        self.agents_per_batch = driver_env.num_agents * batch_size
         agents_per_worker = driver_env.num_agents * envs_per_worker
         obs_space = driver_env.single_observation_space
         obs_shape = obs_space.shape
@@ -257,170 +819,868 @@ class Multiprocessing:
         if isinstance(atn_space, (pufferlib.spaces.Discrete, pufferlib.spaces.MultiDiscrete)):
             atn_dtype = np.int32
 
-        atn_ctype = np.ctypeslib.as_ctypes_type(atn_dtype)
 
         self.single_observation_space = driver_env.single_observation_space
         self.single_action_space = driver_env.single_action_space
-        self.action_space = pufferlib.spaces.joint_space(self.single_action_space, self.agents_per_batch)
-        self.observation_space = pufferlib.spaces.joint_space(self.single_observation_space, self.agents_per_batch)
+        self._set_batch_size(batch_size)
         self.agent_ids = np.arange(num_agents).reshape(num_workers, agents_per_worker)
 
+        self.layout = make_layout(placement, num_workers)
+        lazy = self.layout is not None and self.layout.numa
+
+        # Padding gives each worker's semaphore its own cache line or page.
+        # Data rows are only padded when every batch is either a single
+        # worker or copied anyway, since zero-copy blocks must be contiguous
+        if padding not in PADDING:
+            raise APIUsageError(f'Invalid padding: {padding} (cacheline/page)')
+
+        sem_align = PADDING[padding]
+        data_align = sem_align
+        if zero_copy and self.workers_per_batch > 1:
+            data_align = 0
+
+        # mmap is page aligned, so padded rows land on real boundaries
+        padded = lazy or data_align > 0
+        def rows(row_shape, dtype):
+            nbytes = worker_rows_nbytes(num_workers, row_shape, dtype, data_align)
+            return shared_array('B', nbytes, padded)
+
         from multiprocessing import RawArray
         self.shm = namespace(
-            observations=RawArray(obs_ctype, num_agents * int(np.prod(obs_shape))),
-            actions=RawArray(atn_ctype, num_agents * int(np.prod(atn_shape))),
-            rewards=RawArray('f', num_agents),
-            terminals=RawArray('b', num_agents),
-            truncateds=RawArray('b', num_agents),
-            masks=RawArray('b', num_agents),
-            semaphores=RawArray('c', num_workers),
+            observations=rows((agents_per_worker, *obs_shape), obs_dtype),
+            actions=rows((agents_per_worker, *atn_shape), atn_dtype),
+            rewards=rows((agents_per_worker,), np.float32),
+            terminals=rows((agents_per_worker,), bool),
+            truncateds=rows((agents_per_worker,), bool),
+            masks=rows((agents_per_worker,), bool),
+            semaphores=shared_array('B', worker_rows_nbytes(
+                num_workers, (), np.uint8, sem_align), sem_align > 0),
+            data_align=data_align,
+            sem_align=sem_align,
         )
+        self.padding = padding
+
+        log_schema = getattr(driver_env, 'log_schema', None)
+        if info_ring_size <= 0 or not log_schema:
+            log_schema = None
+        else:
+            log_schema = tuple(log_schema)
+            self.shm.info_ring = RawArray('d',
+                num_workers * info_ring_size * len(log_schema))
+            self.shm.info_head = RawArray('q', num_workers)
+            self.shm.info_tail = RawArray('q', num_workers)
+            self.info_ring = namespace(
+                data=np.ndarray((num_workers, info_ring_size, len(log_schema)),
+                    dtype=np.float64, buffer=self.shm.info_ring),
+                head=np.ndarray(num_workers, dtype=np.int64, buffer=self.shm.info_head),
+                tail=np.ndarray(num_workers, dtype=np.int64, buffer=self.shm.info_tail),
+            )
+
+        self.log_schema = log_schema
+        self.stats_dtype = None if log_schema is None else stats_dtype(log_schema)
+        self.shm.telemetry = RawArray('q', num_workers * 3 * TELEMETRY_BUCKETS)
+        self.telemetry = np.ndarray((num_workers, 3, TELEMETRY_BUCKETS),
+            dtype=np.int64, buffer=self.shm.telemetry)
+        self.telemetry_seen = np.zeros_like(self.telemetry)
+        self.shm.reset_pool = RawArray('q', num_workers * 2)
+        self.reset_pool_counts = np.ndarray((num_workers, 2),
+            dtype=np.int64, buffer=self.shm.reset_pool)
+        self.reset_pool_seen = np.zeros_like(self.reset_pool_counts)
+        self.scheduler_batches = 0
+        self.scheduler_passes = 0
+
+        # Ring of observation rows for a learner batch of obs_rows samples,
+        # plus room for two rounds of every agent in flight
+        self.obs_rows = None
+        self.shm.obs_rows = self.shm.obs_targets = None
+        if obs_rows:
+            obs_rows += 2 * num_agents
+            self.shm.obs_rows = shared_array('B', obs_rows
+                * int(np.prod(obs_shape)) * obs_dtype.itemsize, lazy)
+            self.shm.obs_targets = RawArray('q', num_workers)
+            self.obs_rows = np.ndarray((obs_rows, *obs_shape),
+                dtype=obs_dtype, buffer=self.shm.obs_rows)
+            self.obs_targets = np.ndarray(num_workers,
+                dtype=np.int64, buffer=self.shm.obs_targets)
+            self.obs_targets[:] = -1
+            self.batch_obs_rows = None
+
         shape = (num_workers, agents_per_worker)
-        self.obs_batch_shape = (self.agents_per_batch, *obs_shape)
-        self.atn_batch_shape = (self.workers_per_batch, agents_per_worker, *atn_shape)
-        self.actions = np.ndarray((*shape, *atn_shape),
-            dtype=atn_dtype, buffer=self.shm.actions)
+        self.actions = worker_rows(self.shm.actions, num_workers,
+            (agents_per_worker, *atn_shape), atn_dtype, data_align)
         self.buf = namespace(
-            observations=np.ndarray((*shape, *obs_shape),
-                dtype=obs_dtype, buffer=self.shm.observations),
-            rewards=np.ndarray(shape, dtype=np.float32, buffer=self.shm.rewards),
-            terminals=np.ndarray(shape, dtype=bool, buffer=self.shm.terminals),
-            truncations=np.ndarray(shape, dtype=bool, buffer=self.shm.truncateds),
-            masks=np.ndarray(shape, dtype=bool, buffer=self.shm.masks),
-            semaphores=np.ndarray(num_workers, dtype=np.uint8, buffer=self.shm.semaphores),
+            observations=worker_rows(self.shm.observations, num_workers,
+                (agents_per_worker, *obs_shape), obs_dtype, data_align),
+            rewards=worker_rows(self.shm.rewards, num_workers,
+                (agents_per_worker,), np.float32, data_align),
+            terminals=worker_rows(self.shm.terminals, num_workers,
+                (agents_per_worker,), bool, data_align),
+            truncations=worker_rows(self.shm.truncateds, num_workers,
+                (agents_per_worker,), bool, data_align),
+            masks=worker_rows(self.shm.masks, num_workers,
+                (agents_per_worker,), bool, data_align),
+            semaphores=worker_rows(self.shm.semaphores, num_workers,
+                (), np.uint8, sem_align),
         )
         self.buf.semaphores[:] = MAIN
 
-        from multiprocessing import Pipe, Process
+        # Helper thread that selects and gathers the next full async batch
+        self.gather_thread = gather_thread
+        self.prefetch = None
+        self.prefetch_stop = False
+        self.unsent = np.zeros(num_workers, dtype=bool)
+        if gather_thread:
+            from concurrent.futures import ThreadPoolExecutor
+            self.gather_pool = ThreadPoolExecutor(max_workers=1)
+
+        if double_buffer:
+            out_shape = (2, *shape)
+            self.shm.out_observations = shared_array(obs_ctype,
+                2 * num_agents * int(np.prod(obs_shape)), lazy)
+            self.shm.out_rewards = shared_array('f', 2 * num_agents, lazy)
+            self.shm.out_terminals = shared_array('b', 2 * num_agents, lazy)
+            self.shm.out_truncateds = shared_array('b', 2 * num_agents, lazy)
+            self.shm.out_masks = shared_array('b', 2 * num_agents, lazy)
+            self.shm.out_slots = RawArray('c', num_workers)
+            namespace(self.buf,
+                observations=np.ndarray((*out_shape, *obs_shape),
+                    dtype=obs_dtype, buffer=self.shm.out_observations),
+                rewards=np.ndarray(out_shape, dtype=np.float32, buffer=self.shm.out_rewards),
+                terminals=np.ndarray(out_shape, dtype=bool, buffer=self.shm.out_terminals),
+                truncations=np.ndarray(out_shape, dtype=bool, buffer=self.shm.out_truncateds),
+                masks=np.ndarray(out_shape, dtype=bool, buffer=self.shm.out_masks),
+                slots=np.ndarray(num_workers, dtype=np.uint8, buffer=self.shm.out_slots),
+            )
+
+        # Rows that _gather takes from. With double_buffer, row
+        # slot * num_workers + worker
+        self.gather_src = {k: getattr(self.buf, k) for k in GATHER_KEYS}
+        if double_buffer:
+            self.gather_src = {k: v.reshape(2 * num_workers, *v.shape[2:])
+                for k, v in self.gather_src.items()}
+
+        self.segment_length = None
+        if policy is not None:
+            if not segment_length or segment_length < 1:
+                raise APIUsageError('policy requires segment_length >= 1')
+            if double_buffer:
+                raise APIUsageError('policy does not support double_buffer')
+            if getattr(policy, 'lstm', None) is not None:
+                raise APIUsageError('policy does not support recurrent policies')
+
+            num_params = getattr(policy, 'num_params', None)
+            if num_params is None:
+                num_params = sum(p.numel() for p in policy.parameters())
+
+            def segment(row_shape, dtype):
+                nbytes = segment_length * num_agents * int(np.prod(row_shape))
+                return shared_array('B', nbytes * np.dtype(dtype).itemsize, lazy)
+
+            namespace(self.shm,
+                segment_length=segment_length,
+                seg_observations=segment(obs_shape, obs_dtype),
+                seg_actions=segment(atn_shape, atn_dtype),
+                seg_logprobs=segment((), np.float32),
+                seg_values=segment((), np.float32),
+                seg_rewards=segment((), np.float32),
+                seg_terminals=segment((), bool),
+                seg_truncations=segment((), bool),
+                seg_masks=segment((), bool),
+                weights=RawArray('f', num_params),
+                weights_version=RawArray('q', 1),
+            )
+            self.segments = segment_views(self.shm, num_workers, agents_per_worker,
+                obs_shape, obs_dtype, atn_shape, atn_dtype)
+            self.weights = np.frombuffer(self.shm.weights, dtype=np.float32)
+            self.weights_version = np.frombuffer(self.shm.weights_version, dtype=np.int64)
+            self.segment_length = segment_length
+
+        # Optional eventfd wake-ups so that idle workers and the main process
+        # sleep in the kernel instead of spin-polling the semaphores
+        self.events = None
+        if blocking:
+            self.events = namespace(
+                main=os.eventfd(0, os.EFD_CLOEXEC),
+                workers=[os.eventfd(0, os.EFD_CLOEXEC) for _ in range(num_workers)],
+            )
+
+        import multiprocessing
+        self.ctx = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver':
+            module = getattr(env_creators[0], '__module__', None)
+            self.ctx.set_forkserver_preload([m for m in ('pufferlib.vector', module) if m])
+
+        Pipe = self.ctx.Pipe
         self.send_pipes, w_recv_pipes = zip(*[Pipe() for _ in range(num_workers)])
         w_send_pipes, self.recv_pipes = zip(*[Pipe() for _ in range(num_workers)])
         self.recv_pipe_dict = {p: i for i, p in enumerate(self.recv_pipes)}
+        self.w_recv_pipes = w_recv_pipes
 
-        self.processes = []
+        if self.layout is not None:
+            os.sched_setaffinity(0, self.layout.main)
+
+        # Kept so that dead workers can be respawned with the same arguments.
+        # Seeds are those of async_reset's default until it is called
+        self.seeds = make_seeds(42, num_envs)
+        self.infos = [[] for _ in range(num_workers)]
+        self.worker_args = []
         for i in range(num_workers):
             start = i * envs_per_worker
             end = start + envs_per_worker
-            p = Process(
-                target=_worker_process,
-                args=(env_creators[start:end], env_args[start:end],
-                    env_kwargs[start:end], obs_shape, obs_dtype,
-                    atn_shape, atn_dtype, envs_per_worker, driver_env.num_agents,
-                    num_workers, i, w_send_pipes[i], w_recv_pipes[i],
-                    self.shm, is_native)
-            )
-            p.start()
-            self.processes.append(p)
-
+            cpus = None if self.layout is None else self.layout.workers[i]
+            self.worker_args.append((env_creators[start:end], env_args[start:end],
+                env_kwargs[start:end], obs_shape, obs_dtype,
+                atn_shape, atn_dtype, envs_per_worker, driver_env.num_agents,
+                num_workers, i, w_send_pipes[i], w_recv_pipes[i],
+                self.shm, is_native, self.events, log_schema, double_buffer,
+                cpus, lazy, policy, reset_pool))
+
+        self.processes = [self._spawn(i) for i in range(num_workers)]
+        self.max_restarts = max_restarts
+        self.restarts = [0 for _ in range(num_workers)]
+        self.respawned = set()
+        self.truncate_next = set()
+        self.last_health_check = time.time()
+
+        self.pending_kwargs = {}
+        self.batch_timeout = batch_timeout
+        self.late_counts = np.zeros(num_workers, dtype=np.int64)
         self.flag = RESET
         self.initialized = False
-        self.zero_copy = zero_copy
+        self.double_buffer = double_buffer
+        self.startup_time = time.time() - self.init_start
+        self.time_to_first_batch = None
 
     def recv(self):
         recv_precheck(self)
-        while True:
-            worker = self.waiting_workers.pop(0)
-            sem = self.buf.semaphores[worker]
-            if sem >= MAIN:
-                self.ready_workers.append(worker)
-            else:
-                self.waiting_workers.append(worker)
+        if self.prefetch is not None:
+            batch = self.prefetch.result()
+            self.prefetch = None
+        else:
+            batch = self._select()
+
+        w_slice, s_range, late = batch[:3]
+        self.w_send = w_slice
+        if late:
+            # Late workers are still running their last command
+            self.late_counts[late] += 1
+            self.w_send = [w for w in range(self.num_workers) if w not in late]
+        if self.time_to_first_batch is None:
+            self.time_to_first_batch = time.time() - self.init_start
+
+        self.w_slice = w_slice
+        buf = self.buf
+
+        out, idx = buf, w_slice
+        if isinstance(w_slice, list):
+            # Non-contiguous workers are copied into a reusable buffer
+            out = batch[3] if len(batch) > 3 else self._gather(w_slice)
+            idx = slice(None)
+        elif self.double_buffer:
+            # Workers in a zero-copy block always step together,
+            # so they share the same output slot
+            idx = (int(np.ravel(buf.slots[w_slice])[0]), w_slice)
+
+        o = out.observations[idx].reshape(self.obs_batch_shape)
+        r = out.rewards[idx].ravel()
+        d = out.terminals[idx].ravel()
+        t = out.truncations[idx].ravel()
+
+        infos = []
+        for i in s_range:
+            if self.infos[i]:
+                infos.extend(self.infos[i])
+                self.infos[i] = []
+
+        if self.log_schema is not None:
+            stats = self._read_info_ring(s_range)
+            if stats is not None:
+                infos.append(stats)
+
+        infos = _finish_infos(infos, self.columnar_infos)
+
+        agent_ids = self.agent_ids[w_slice].ravel()
+        m = out.masks[idx].ravel()
+        self.masked_workers = []
+        if self.respawned or late:
+            # Copy so that respawned and late workers cannot unmask their
+            # agents while this batch is still in use
+            m = m.reshape(len(s_range), -1).copy()
+            for pos, w in enumerate(s_range):
+                if w in late or w in self.respawned:
+                    m[pos] = False
+                    self.respawned.discard(w)
+                    self.masked_workers.append(pos)
+            m = m.ravel()
+
+        # The first batch a respawned worker steps from its reset ends the
+        # episodes its agents were in when it died, with no reward
+        truncate = [pos for pos, w in enumerate(s_range)
+            if w in self.truncate_next and pos not in self.masked_workers]
+        if truncate:
+            r = r.reshape(len(s_range), -1).copy()
+            t = t.reshape(len(s_range), -1).copy()
+            r[truncate] = 0
+            t[truncate] = True
+            r, t = r.ravel(), t.ravel()
+            self.truncate_next.difference_update(s_range[pos] for pos in truncate)
+
+        self.batch_mask = m
+
+        if self.obs_rows is not None:
+            # Late workers have not written theirs yet and are masked out
+            starts = np.array([-1 if w in late else self.obs_targets[w] for w in s_range])
+            self.obs_targets[[w for w in s_range if w not in late]] = -1
+            rows = starts[:, None] + np.arange(len(m) // len(s_range))
+            rows[starts < 0] = -1
+            self.batch_obs_rows = rows.ravel()
 
-            if sem == INFO:
+        # Select and gather the next batch from the other workers while the
+        # caller runs its policy on this one
+        if self.gather_thread and isinstance(w_slice, list):
+            self.unsent[w_slice] = True
+            self.prefetch = self.gather_pool.submit(self._prefetch)
+
+        return o, r, d, t, infos, agent_ids, m
+
+    def _select(self, exclude=None):
+        '''Waits for the next batch of workers. Returns (w_slice, s_range,
+        late). With exclude, those workers are not picked and the wait gives
+        up and returns None once self.prefetch_stop is set'''
+        sems = self.buf.semaphores
+        workers_per_batch = self.workers_per_batch
+        iterations = 0
+        late = []
+        deadline = None
+        if self.batch_timeout is not None and workers_per_batch == self.num_workers:
+            deadline = time.time() + self.batch_timeout
+
+        while True:
+            # One vectorized pass over a snapshot of the semaphores. Workers
+            # that finish mid-pass are picked up on the next iteration
+            iterations += 1
+            snapshot = sems.copy()
+            for worker in np.flatnonzero(snapshot == INFO):
                 self.infos[worker] = self.recv_pipes[worker].recv()
+                sems[worker] = MAIN
 
-            if not self.ready_workers:
-                continue
+            ready = snapshot >= MAIN
+            if exclude is not None:
+                if self.prefetch_stop:
+                    return None
+
+                ready &= ~exclude
 
-            if self.workers_per_batch == 1:
+            if workers_per_batch == 1:
                 # Fastest path. Zero-copy optimized for batch size 1
-                w_slice = self.ready_workers[0]
-                s_range = [w_slice]
-                self.waiting_workers.append(w_slice)
-                self.ready_workers.pop(0)
-                break
-            elif self.workers_per_batch == self.num_workers:
+                idxs = np.flatnonzero(ready)
+                if len(idxs) > 0:
+                    # Round-robin from the last worker served for fairness
+                    pos = np.searchsorted(idxs, self.cursor) % len(idxs)
+                    w_slice = int(idxs[pos])
+                    s_range = [w_slice]
+                    self.cursor = w_slice + 1
+                    break
+            elif workers_per_batch == self.num_workers:
                 # Slowest path. Zero-copy synchornized for all workers
-                if len(self.ready_workers) < self.num_workers:
-                    continue
-
-                w_slice = slice(0, self.num_workers)
-                s_range = range(0, self.num_workers)
-                self.waiting_workers.extend(s_range)
-                self.ready_workers = []
-                break
+                if ready.all():
+                    w_slice = slice(0, self.num_workers)
+                    s_range = range(0, self.num_workers)
+                    break
+
+                # Past the deadline, serve the workers that are done
+                if deadline is not None and ready.any() and time.time() > deadline:
+                    w_slice = slice(0, self.num_workers)
+                    s_range = range(0, self.num_workers)
+                    late = np.flatnonzero(~ready).tolist()
+                    break
             elif self.zero_copy:
                 # Zero-copy for batch size > 1. Has to wait for
-                # a contiguous block of workers and adds a few
-                # microseconds of extra index processing time
-                completed = np.zeros(self.num_workers, dtype=bool)
-                completed[self.ready_workers] = True
-                buffers = completed.reshape(
-                    -1, self.workers_per_batch).all(axis=1)
+                # a contiguous block of workers
+                buffers = ready.reshape(-1, workers_per_batch).all(axis=1)
                 start = buffers.argmax()
-                if not buffers[start]:
-                    continue
-
-                start *= self.workers_per_batch
-                end = start + self.workers_per_batch
-                w_slice = slice(start, end)
-                s_range = range(start, end)
-                self.waiting_workers.extend(s_range)
-                self.ready_workers = [e for e in self.ready_workers
-                    if e not in s_range]
-                break
-            elif len(self.ready_workers) >= self.workers_per_batch:
+                if buffers[start]:
+                    start *= workers_per_batch
+                    end = start + workers_per_batch
+                    w_slice = slice(start, end)
+                    s_range = range(start, end)
+                    break
+            else:
                 # Full async path for batch size > 1. Alawys copies
                 # data because of non-contiguous worker indices
                 # Can be faster for envs with small observations
-                w_slice = self.ready_workers[:self.workers_per_batch]
-                s_range = w_slice
-                self.waiting_workers.extend(s_range)
-                self.ready_workers = self.ready_workers[self.workers_per_batch:]
-                break
+                idxs = np.flatnonzero(ready)
+                if len(idxs) >= workers_per_batch:
+                    pos = np.searchsorted(idxs, self.cursor)
+                    idxs = np.concatenate([idxs[pos:], idxs[:pos]])
+                    w_slice = idxs[:workers_per_batch].tolist()
+                    s_range = w_slice
+                    self.cursor = w_slice[-1] + 1
+                    break
+
+            # No batch ready. Sleep until a worker finishes or dies
+            if self.events is not None:
+                timeout = None if deadline is None else max(0, deadline - time.time())
+                if exclude is not None:
+                    # Wake up now and then to check for prefetch_stop
+                    timeout = 0.05
+                ready = wait([self.events.main, *self.sentinels], timeout=timeout)
+                if self.events.main in ready:
+                    os.eventfd_read(self.events.main)
+                if ready and (len(ready) > 1 or self.events.main not in ready):
+                    self._check_workers()
+            else:
+                if exclude is not None:
+                    # Spinning would hold the GIL from the main thread
+                    time.sleep(0)
+                if time.time() - self.last_health_check > HEALTH_CHECK_INTERVAL:
+                    self._check_workers()
+
+        self.scheduler_iterations = iterations
+        self.scheduler_batches += 1
+        self.scheduler_passes += iterations
+        return w_slice, s_range, late
+
+    def _gather(self, workers):
+        '''Copies the outputs of a non-contiguous batch of workers into the
+        next of two reusable buffers, so that a batch stays valid until the
+        one after it is received'''
+        idxs = np.asarray(workers)
+        if self.double_buffer:
+            idxs = self.buf.slots[idxs] * self.num_workers + idxs
+
+        self.gather_slot ^= 1
+        out = self.gather[self.gather_slot]
+        for k in GATHER_KEYS:
+            np.take(self.gather_src[k], idxs, axis=0, out=out[k])
+
+        return out
+
+    def _prefetch(self):
+        batch = self._select(exclude=self.unsent)
+        if batch is None:
+            return None
+
+        return (*batch, self._gather(batch[0]))
+
+    def _cancel_prefetch(self):
+        '''Stops the helper thread. Workers it picked stay ready for recv'''
+        if self.prefetch is None:
+            return
+
+        self.prefetch_stop = True
+        try:
+            self.prefetch.result()
+        except Exception:
+            # Dead workers are found again by the next health check
+            pass
+
+        self.prefetch = None
+        self.prefetch_stop = False
+        self.unsent[:] = False
+
+    def recv_segment(self):
+        '''Returns the next batch of actor mode segments
+
+        Arrays are (segment_length, agents_per_batch, ...) views into shared
+        memory, valid until the next call. Row t holds the observation, the
+        reward and done flags that came with it, and the actor's action,
+        logprob and value for it. Calling again restarts the previous
+        batch's workers on their next segment.
+        '''
+        if self.segment_length is None:
+            raise APIUsageError('recv_segment requires policy and segment_length')
+
+        if self.flag == SEND:
+            self.buf.semaphores[self.w_send] = STEP
+            self._notify(self.w_send)
+            self.flag = RECV
+
+        _, _, _, _, infos, env_ids, _ = self.recv()
+        shape = (self.segment_length, self.agents_per_batch)
+        seg = namespace(**{k: v[:, self.w_slice].reshape(*shape, *v.shape[3:])
+            for k, v in self.segments.items()})
+        if self.masked_workers:
+            # Segments of respawned workers were never written
+            masks = seg.masks.reshape(self.segment_length,
+                self.workers_per_batch, -1).copy()
+            masks[:, self.masked_workers] = False
+            seg.masks = masks.reshape(shape)
+
+        seg.env_ids = env_ids
+        seg.infos = infos
+        return seg
+
+    def stats(self):
+        '''Per-worker command times in seconds since the last call
+
+        Returns a namespace with count, p50 and p99 arrays over workers for
+        each of step, reset and info (pipe sends of infos), the median step
+        time across all workers, and stragglers: the workers whose p99 step
+        time exceeds STRAGGLER_RATIO times that median. In actor mode a step
+        is a whole segment. reset_pool has per-worker hits and misses of the
+        reset pool and the overall hit_rate (nan without episode ends).
+        scheduler has the number of batches selected, the semaphore passes
+        it took to find them, and passes_per_batch (1 when a batch was always
+        ready on the first pass).
+        '''
+        counts = self.telemetry.copy()
+        window = counts - self.telemetry_seen
+        self.telemetry_seen = counts
+
+        stats = {}
+        for k, kind in enumerate(TELEMETRY_KINDS):
+            hists = window[:, k]
+            stats[kind] = namespace(
+                count=hists.sum(axis=1),
+                p50=np.array([hist_quantile(h, 0.5) for h in hists]),
+                p99=np.array([hist_quantile(h, 0.99) for h in hists]),
+            )
 
-        self.w_slice = w_slice
-        buf = self.buf
+        median = hist_quantile(window[:, 0].sum(axis=0), 0.5)
+        stragglers = np.flatnonzero(stats['step'].p99 > STRAGGLER_RATIO * median)
+
+        counts = self.reset_pool_counts.copy()
+        hits, misses = (counts - self.reset_pool_seen).T
+        self.reset_pool_seen = counts
+        total = hits.sum() + misses.sum()
+        reset_pool = namespace(hits=hits, misses=misses,
+            hit_rate=float(hits.sum() / total) if total else float('nan'))
+
+        batches, passes = self.scheduler_batches, self.scheduler_passes
+        self.scheduler_batches = self.scheduler_passes = 0
+        scheduler = namespace(batches=batches, passes=passes,
+            passes_per_batch=passes / batches if batches else float('nan'))
+        return namespace(**stats, median=median, stragglers=stragglers.tolist(),
+            reset_pool=reset_pool, scheduler=scheduler)
+
+    def update_policy(self, policy):
+        '''Publishes policy weights to actors. Accepts a torch policy, an
+        actor with get_weights or a flat float32 array in named_parameters
+        order'''
+        if self.segment_length is None:
+            raise APIUsageError('update_policy requires policy and segment_length')
+
+        if hasattr(policy, 'get_weights'):
+            policy = np.asarray(policy.get_weights(), dtype=np.float32)
+        elif not isinstance(policy, np.ndarray):
+            import torch
+            policy = torch.nn.utils.parameters_to_vector(
+                policy.parameters()).detach().cpu().numpy()
+
+        if policy.size != self.weights.size:
+            raise APIUsageError(f'update_policy: {policy.size} weights, '
+                f'actors have {self.weights.size}')
+
+        self.weights_version[0] += 1
+        self.weights[:] = policy
+        self.weights_version[0] += 1
+
+    def _set_batch_size(self, batch_size):
+        if self.zero_copy and self.num_environments % batch_size != 0:
+            # This is so you can have n equal buffers
+            raise APIUsageError(
+                'zero_copy: num_envs must be divisible by batch_size')
+        if batch_size % self.envs_per_worker != 0:
+            raise APIUsageError(
+                'batch_size must be divisible by (num_envs / num_workers)')
 
-        o = buf.observations[w_slice].reshape(self.obs_batch_shape)
-        r = buf.rewards[w_slice].ravel()
-        d = buf.terminals[w_slice].ravel()
-        t = buf.truncations[w_slice].ravel()
+        agents_per_env = self.driver_env.num_agents
+        self.workers_per_batch = batch_size // self.envs_per_worker
+        self.agents_per_batch = agents_per_env * batch_size
+        self.action_space = pufferlib.spaces.joint_space(self.single_action_space, self.agents_per_batch)
+        self.observation_space = pufferlib.spaces.joint_space(self.single_observation_space, self.agents_per_batch)
+        self.obs_batch_shape = (self.agents_per_batch, *self.single_observation_space.shape)
+        self.atn_batch_shape = (self.workers_per_batch,
+            agents_per_env * self.envs_per_worker, *self.single_action_space.shape)
+
+        # Two output buffers for the full async path, used in turn
+        self.gather = None
+        self.gather_slot = 0
+        if not self.zero_copy and 1 < self.workers_per_batch < self.num_workers:
+            shape = (self.workers_per_batch, agents_per_env * self.envs_per_worker)
+            obs_space = self.single_observation_space
+            self.gather = [namespace(
+                observations=np.zeros((*shape, *obs_space.shape), dtype=obs_space.dtype),
+                rewards=np.zeros(shape, dtype=np.float32),
+                terminals=np.zeros(shape, dtype=bool),
+                truncations=np.zeros(shape, dtype=bool),
+                masks=np.zeros(shape, dtype=bool),
+            ) for _ in range(2)]
+
+    def reconfigure(self, env_kwargs=None, batch_size=None):
+        '''Reuses the running workers with new env_kwargs and/or batch_size
+
+        env_kwargs is a dict or a list with one dict per env. Only workers
+        whose kwargs changed rebuild their envs, on the next async_reset.
+        Shared memory is sized per worker, so a new batch_size only re-slices
+        it. Raises APIUsageError if the new envs have different spaces.
+        '''
+        self.init_start = time.time()
+        self._drain()
+
+        if env_kwargs is not None:
+            if not isinstance(env_kwargs, (list, tuple)):
+                env_kwargs = [env_kwargs] * self.num_environments
+            if len(env_kwargs) != self.num_environments:
+                raise APIUsageError('env_kwargs must be a list of length num_envs')
+
+            changed = {}
+            for i, args in enumerate(self.worker_args):
+                start = i * self.envs_per_worker
+                kwargs = list(env_kwargs[start:start + self.envs_per_worker])
+                if kwargs != list(args[2]):
+                    changed[i] = kwargs
+
+            if changed:
+                i = next(iter(changed))
+                args = self.worker_args[i]
+                probe = probe_env(args[0][0], args[1][0], changed[i][0])
+                if (probe.single_observation_space != self.single_observation_space
+                        or probe.single_action_space != self.single_action_space
+                        or probe.num_agents != self.driver_env.num_agents):
+                    raise APIUsageError('reconfigure: env_kwargs change the '
+                        'observation or action space. Make a new vecenv instead')
+
+            for i, kwargs in changed.items():
+                args = self.worker_args[i]
+                self.worker_args[i] = (*args[:2], kwargs, *args[3:])
+                self.pending_kwargs[i] = kwargs
+
+        if batch_size is not None:
+            workers_per_batch = batch_size // self.envs_per_worker
+            if (self.zero_copy and self.shm.data_align > 0
+                    and workers_per_batch > 1):
+                raise APIUsageError('reconfigure: padded worker slices are not '
+                    'contiguous. Use zero_copy=False or make a new vecenv')
+
+            if self.double_buffer and workers_per_batch != self.workers_per_batch:
+                # Workers only share an output slot phase within a block
+                raise APIUsageError('reconfigure: double_buffer cannot change '
+                    'workers per batch. Make a new vecenv instead')
+
+            self._set_batch_size(batch_size)
 
-        infos = []
-        for i in s_range:
-            if self.infos[i]:
-                infos.extend(self.infos[i])
-                self.infos[i] = []
+        self.flag = RESET
+        self.startup_time = time.time() - self.init_start
+        self.time_to_first_batch = None
 
-        agent_ids = self.agent_ids[w_slice].ravel()
-        m = buf.masks[w_slice].ravel()
-        self.batch_mask = m
+    def _drain(self, keep_infos=False):
+        '''Waits for every in-flight command. Results stay in shared memory'''
+        self._cancel_prefetch()
+        sems = self.buf.semaphores
+        while True:
+            for worker in np.flatnonzero(sems == INFO):
+                infos = self.recv_pipes[worker].recv()
+                if keep_infos:
+                    self.infos[worker].extend(infos)
+                sems[worker] = MAIN
 
-        return o, r, d, t, infos, agent_ids, m
+            if (sems == MAIN).all():
+                break
 
-    def send(self, actions):
+            if self.events is not None:
+                ready = wait([self.events.main, *self.sentinels])
+                if self.events.main in ready:
+                    os.eventfd_read(self.events.main)
+                if len(ready) > 1 or self.events.main not in ready:
+                    self._check_workers()
+            elif time.time() - self.last_health_check > HEALTH_CHECK_INTERVAL:
+                self._check_workers()
+
+    def snapshot(self):
+        '''Handle to the state of every env, for restore
+
+        Waits for in-flight commands first. Their results are still returned
+        by the following recv calls
+        '''
+        self._drain(keep_infos=True)
+        self.buf.semaphores[:] = SNAPSHOT
+        self._notify(range(self.num_workers))
+        handle = []
+        for i, pipe in enumerate(self.recv_pipes):
+            wait([pipe, self.processes[i].sentinel])
+            if not pipe.poll():
+                raise RuntimeError(f'Worker {i} died during snapshot')
+
+            handle.append(pipe.recv())
+
+        self._drain()
+        return handle
+
+    def restore(self, handle):
+        '''Restores a snapshot, discarding in-flight commands. The next
+        recv calls return the snapshot's observations'''
+        self._drain()
+        self.buf.semaphores[:] = RESTORE
+        self._notify(range(self.num_workers))
+        for pipe, state in zip(self.send_pipes, handle):
+            pipe.send(state)
+
+        self._drain()
+        self.infos = [[] for _ in range(self.num_workers)]
+        self.respawned = set()
+        self.truncate_next = set()
+        self.flag = RECV
+
+    @property
+    def sentinels(self):
+        return [p.sentinel for p in self.processes]
+
+    def _spawn(self, idx, **kwargs):
+        p = self.ctx.Process(target=_worker_process, args=self.worker_args[idx], kwargs=kwargs)
+        p.start()
+        return p
+
+    def _check_workers(self):
+        self.last_health_check = time.time()
+        dead = wait(self.sentinels, timeout=0)
+        for idx, p in enumerate(self.processes):
+            if p.sentinel in dead:
+                self._respawn(idx)
+
+    def _respawn(self, idx):
+        p = self.processes[idx]
+        p.join()
+        if self.restarts[idx] >= self.max_restarts:
+            raise RuntimeError(f'Worker {idx} died with exit code {p.exitcode} '
+                f'after {self.restarts[idx]} restarts (max_restarts={self.max_restarts})')
+
+        # Drop messages the dead worker sent or never read
+        for pipe in (self.recv_pipes[idx], self.w_recv_pipes[idx]):
+            while pipe.poll():
+                pipe.recv()
+
+        self.restarts[idx] += 1
+        self.infos[idx] = []
+        kwargs = {}
+        if self.double_buffer:
+            # A worker that died mid-command never published its slot. Pretend
+            # it did so that it stays in phase with the rest of its block
+            slots = self.buf.slots
+            if self.buf.semaphores[idx] < MAIN:
+                slots[idx] ^= 1
+            kwargs['slot'] = int(slots[idx]) ^ 1
+
+        # Serve the worker's current (masked) data as if it had finished
+        self.respawned.add(idx)
+        self.truncate_next.add(idx)
+        self.buf.semaphores[idx] = MAIN
+
+        start = idx * self.envs_per_worker
+        end = start + self.envs_per_worker
+        offset = self.num_environments * sum(self.restarts)
+        kwargs['reset_seed'] = [s + offset for s in self.seeds[start:end]]
+        self.processes[idx] = self._spawn(idx, **kwargs)
+
+    def _read_info_ring(self, workers):
+        ring = self.info_ring
+        size = ring.data.shape[1]
+        rows = []
+        for w in workers:
+            head, tail = ring.head[w], ring.tail[w]
+            if head == tail:
+                continue
+
+            rows.append(ring.data[w, np.arange(tail, head) % size])
+            ring.tail[w] = head
+
+        if not rows:
+            return None
+
+        # Rows are float64 in schema order, so they view as records
+        rows = np.ascontiguousarray(np.concatenate(rows))
+        return rows.view(self.stats_dtype).reshape(-1)
+
+    def action_buffer(self):
+        '''Writable (agents, *action_shape) view of the shared actions of the
+        batch from the last recv, or None when the batch is not one
+        contiguous block (gathered, padded or partial). Actions written
+        into it and passed to send are not copied again'''
+        if self.flag != SEND or self.w_send is not self.w_slice:
+            return None
+        if not isinstance(self.w_slice, (int, slice)):
+            return None
+
+        view = self.actions[self.w_slice]
+        if not view.flags.c_contiguous:
+            return None
+
+        return view.reshape(-1, *self.single_action_space.shape)
+
+    def observation_rows(self):
+        '''Row of obs_rows holding each agent's observation from the last
+        recv, or -1 where the worker was not asked to write one'''
+        return self.batch_obs_rows
+
+    def send(self, actions, obs_rows=None):
+        '''obs_rows (with obs_rows set at construction) are rows of obs_rows
+        per agent of the batch, contiguous for each worker's agents, where
+        workers also write the observations of this step, or -1'''
         actions = send_precheck(self, actions).reshape(self.atn_batch_shape)
         # TODO: What shape?
         
-        idxs = self.w_slice
-        self.actions[idxs] = actions
+        idxs = self.w_send
+        if idxs is not self.w_slice:
+            # Only on-time workers of a partial batch
+            actions = actions[idxs]
+
+        # Already in place when written through action_buffer
+        if not np.may_share_memory(actions, self.actions):
+            self.actions[idxs] = actions
+        if obs_rows is not None:
+            starts = np.asarray(obs_rows).reshape(self.workers_per_batch, -1)[:, 0]
+            if idxs is not self.w_slice:
+                starts = starts[idxs]
+            self.obs_targets[np.atleast_1d(np.arange(self.num_workers)[idxs])] = starts
         self.buf.semaphores[idxs] = STEP
+        # After the semaphores, so the helper never sees these workers as
+        # both eligible and holding the batch that was just consumed
+        self.unsent[idxs] = False
+        self._notify(idxs)
+
+    def _notify(self, idxs):
+        if self.events is None:
+            return
+
+        if isinstance(idxs, slice):
+            idxs = range(self.num_workers)[idxs]
+        elif not isinstance(idxs, (list, tuple, range)):
+            idxs = [idxs]
+
+        for i in idxs:
+            os.eventfd_write(self.events.workers[i], 1)
 
     def async_reset(self, seed=42):
+        self._cancel_prefetch()
         self.flag = RECV
         seed = make_seeds(seed, self.num_environments)
+        self.seeds = seed
         self.prev_env_id = []
         self.flag = RECV
 
-        self.ready_workers = []
-        self.waiting_workers = list(range(self.num_workers))
+        self.cursor = 0
+        self.scheduler_iterations = 0
         self.infos = [[] for _ in range(self.num_workers)]
+        self.respawned = set()
+        self.truncate_next = set()
+
+        if self.log_schema is not None:
+            self.info_ring.tail[:] = self.info_ring.head
+        if self.obs_rows is not None:
+            self.obs_targets[:] = -1
 
         self.buf.semaphores[:] = RESET
         for i in range(self.num_workers):
             start = i*self.envs_per_worker
             end = (i+1)*self.envs_per_worker
-            self.send_pipes[i].send(seed[start:end])
+            if i in self.pending_kwargs:
+                self.send_pipes[i].send(namespace(seeds=seed[start:end],
+                    env_kwargs=self.pending_kwargs.pop(i)))
+            else:
+                self.send_pipes[i].send(seed[start:end])
+
+        self._notify(range(self.num_workers))
 
     def close(self):
         '''
@@ -449,28 +1709,344 @@ class Multiprocessing:
                 self.waiting_workers.append(worker)
         '''
 
+        self._cancel_prefetch()
+        if self.gather_thread:
+            self.gather_pool.shutdown(wait=True)
+
         for p in self.processes:
             p.terminate()
 
-class Ray():
-    '''Runs environments in parallel on multiple processes using Ray
+        if self.events is not None:
+            for fd in [self.events.main, *self.events.workers]:
+                os.close(fd)
+
+            self.events = None
+
+class Threaded:
+    '''Runs environments in parallel on a pool of threads
 
-    Use this module for distributed simulation on a cluster.
+    Use this vectorization module for envs that release the GIL while
+    stepping, such as most C and C++ envs. Workers are groups of envs that
+    share one set of numpy buffers, with the same num_workers and batch_size
+    semantics as Multiprocessing. parallelism is the average number of cores
+    busy while any env is stepping. Envs that hold the GIL keep it near 1
+    regardless of num_threads, in which case a warning is shown.
     '''
     reset = reset
     step = step
 
+    @property
+    def num_envs(self):
+        return self.agents_per_batch
+
+    @property
+    def parallelism(self):
+        if self.busy_time == 0:
+            return 0.0
+
+        return self.step_cpu_time / self.busy_time
+
     def __init__(self, env_creators, env_args, env_kwargs, num_envs,
-            num_workers=None, batch_size=None, **kwargs):
+            num_workers=None, batch_size=None, zero_copy=True, num_threads=None,
+            reset_pool=0, columnar_infos=False, **kwargs):
+        self.columnar_infos = columnar_infos
         if batch_size is None:
             batch_size = num_envs
         if num_workers is None:
             num_workers = num_envs
+        if num_threads is None:
+            num_threads = min(num_workers, psutil.cpu_count(logical=False))
+
+        num_batches = num_envs / batch_size
+        if zero_copy and num_batches != int(num_batches):
+            raise APIUsageError(
+                'zero_copy: num_envs must be divisible by batch_size')
 
-        self.env_pool = num_envs != batch_size
+        self.num_environments = num_envs
         envs_per_worker = num_envs // num_workers
+        self.envs_per_worker = envs_per_worker
         self.workers_per_batch = batch_size // envs_per_worker
         self.num_workers = num_workers
+        self.num_threads = num_threads
+        self.zero_copy = zero_copy
+
+        self.driver_env = driver_env = env_creators[0](*env_args[0], **env_kwargs[0])
+        self.emulated = False if isinstance(driver_env, PufferEnv) else driver_env.emulated
+        self.num_agents = num_agents = driver_env.num_agents * num_envs
+        self.agents_per_batch = driver_env.num_agents * batch_size
+        agents_per_worker = driver_env.num_agents * envs_per_worker
+        obs_space = driver_env.single_observation_space
+        obs_shape = obs_space.shape
+        atn_space = driver_env.single_action_space
+        atn_shape = atn_space.shape
+        atn_dtype = atn_space.dtype
+        if isinstance(atn_space, (pufferlib.spaces.Discrete, pufferlib.spaces.MultiDiscrete)):
+            atn_dtype = np.int32
+
+        self.single_observation_space = driver_env.single_observation_space
+        self.single_action_space = driver_env.single_action_space
+        self.action_space = pufferlib.spaces.joint_space(self.single_action_space, self.agents_per_batch)
+        self.observation_space = pufferlib.spaces.joint_space(self.single_observation_space, self.agents_per_batch)
+        self.agent_ids = np.arange(num_agents).reshape(num_workers, agents_per_worker)
+
+        shape = (num_workers, agents_per_worker)
+        self.obs_batch_shape = (self.agents_per_batch, *obs_shape)
+        self.atn_batch_shape = (self.workers_per_batch, agents_per_worker, *atn_shape)
+        self.actions = np.zeros((*shape, *atn_shape), dtype=atn_dtype)
+        self.buf = namespace(
+            observations=np.zeros((*shape, *obs_shape), dtype=obs_space.dtype),
+            rewards=np.zeros(shape, dtype=np.float32),
+            terminals=np.zeros(shape, dtype=bool),
+            truncations=np.zeros(shape, dtype=bool),
+            masks=np.ones(shape, dtype=bool),
+        )
+
+        self.envs = []
+        for i in range(num_workers):
+            start = i * envs_per_worker
+            end = start + envs_per_worker
+            buf = namespace(
+                observations=self.buf.observations[i],
+                rewards=self.buf.rewards[i],
+                terminals=self.buf.terminals[i],
+                truncations=self.buf.truncations[i],
+                masks=self.buf.masks[i],
+                actions=self.actions[i],
+            )
+            self.envs.append(Serial(env_creators[start:end], env_args[start:end],
+                env_kwargs[start:end], envs_per_worker, buf=buf,
+                reset_pool=reset_pool, columnar_infos=True))
+
+        from concurrent.futures import ThreadPoolExecutor
+        self.pool = ThreadPoolExecutor(max_workers=num_threads)
+        self.futures = {}
+        self.ready = []
+        import threading
+        self.lock = threading.Lock()
+        self.active = 0
+        self.busy_start = 0
+        self.busy_time = 0
+        self.step_cpu_time = 0
+        self.batches = 0
+        self.warned = False
+        self.initialized = False
+        self.flag = RESET
+
+    def _run(self, worker, seed=None):
+        # Tracks the time during which at least one worker is stepping
+        with self.lock:
+            if self.active == 0:
+                self.busy_start = time.perf_counter()
+            self.active += 1
+
+        envs = self.envs[worker]
+        start_cpu = time.thread_time()
+        try:
+            if seed is None:
+                envs.send(self.actions[worker])
+            else:
+                envs.async_reset(seed)
+
+            infos = envs.recv()[4]
+        finally:
+            cpu = time.thread_time() - start_cpu
+            with self.lock:
+                self.active -= 1
+                self.step_cpu_time += cpu
+                if self.active == 0:
+                    self.busy_time += time.perf_counter() - self.busy_start
+
+        return infos
+
+    def _submit(self, worker, seed=None):
+        self.futures[worker] = self.pool.submit(self._run, worker, seed)
+
+    def _collect(self):
+        from concurrent.futures import wait, FIRST_COMPLETED
+        done, _ = wait(self.futures.values(), return_when=FIRST_COMPLETED)
+        for worker, future in list(self.futures.items()):
+            if future not in done:
+                continue
+
+            del self.futures[worker]
+            self.infos[worker] = future.result()
+            self.ready.append(worker)
+
+    def _next_batch(self):
+        workers_per_batch = self.workers_per_batch
+        if workers_per_batch == self.num_workers:
+            if len(self.ready) == self.num_workers:
+                self.ready = []
+                return slice(0, self.num_workers), range(self.num_workers)
+        elif self.zero_copy:
+            # Wait for a contiguous block of workers to return views. Blocks
+            # are served in the order their first worker finished
+            ready = set(self.ready)
+            for w in self.ready:
+                start = w - w % workers_per_batch
+                block = range(start, start + workers_per_batch)
+                if ready.issuperset(block):
+                    self.ready = [w for w in self.ready if w not in block]
+                    return slice(start, start + workers_per_batch), block
+        elif len(self.ready) >= workers_per_batch:
+            w_slice = self.ready[:workers_per_batch]
+            self.ready = self.ready[workers_per_batch:]
+            return w_slice, w_slice
+
+        return None
+
+    def _check_gil(self):
+        self.batches += 1
+        if self.warned or self.batches < GIL_CHECK_BATCHES or self.num_threads < 2:
+            return
+
+        # Only meaningful if every thread could have had its own core. Envs
+        # that mostly sleep or wait on IO use well under one core
+        self.warned = True
+        cores = psutil.cpu_count(logical=False)
+        if self.num_threads <= cores and 0.5 < self.parallelism < 1.25:
+            import warnings
+            warnings.warn(f'{self.num_threads} env threads kept only '
+                f'{self.parallelism:.2f} cores busy. The env likely holds the GIL '
+                'and will not scale with threads. Use Multiprocessing instead.')
+
+    def recv(self):
+        recv_precheck(self)
+        batch = self._next_batch()
+        while batch is None:
+            self._collect()
+            batch = self._next_batch()
+
+        self._check_gil()
+        w_slice, s_range = batch
+        self.w_slice = w_slice
+        buf = self.buf
+        o = buf.observations[w_slice].reshape(self.obs_batch_shape)
+        r = buf.rewards[w_slice].ravel()
+        d = buf.terminals[w_slice].ravel()
+        t = buf.truncations[w_slice].ravel()
+        m = buf.masks[w_slice].ravel()
+
+        infos = []
+        for i in s_range:
+            infos.extend(self.infos[i])
+            self.infos[i] = []
+
+        infos = _finish_infos(infos, self.columnar_infos)
+        agent_ids = self.agent_ids[w_slice].ravel()
+        return o, r, d, t, infos, agent_ids, m
+
+    def send(self, actions):
+        actions = send_precheck(self, actions).reshape(self.atn_batch_shape)
+        self.actions[self.w_slice] = actions
+        workers = self.w_slice
+        if isinstance(workers, slice):
+            workers = range(self.num_workers)[workers]
+
+        for w in workers:
+            self._submit(w)
+
+    def async_reset(self, seed=42):
+        self.flag = RECV
+        seed = make_seeds(seed, self.num_environments)
+
+        # Let steps still in flight finish before resetting their envs
+        for future in self.futures.values():
+            future.result()
+
+        self.futures = {}
+        self.ready = []
+        self.infos = [[] for _ in range(self.num_workers)]
+        for i in range(self.num_workers):
+            start = i * self.envs_per_worker
+            end = start + self.envs_per_worker
+            self._submit(i, seed[start:end])
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        for envs in self.envs:
+            envs.close()
+
+def packed_views(packed, obs_shape, obs_dtype, num_agents):
+    """Views of the per-step outputs of num_agents agents in one flat uint8
+    buffer. Rewards go first so that float fields stay aligned"""
+    fields = [
+        ('rewards', (num_agents,), np.float32),
+        ('observations', (num_agents, *obs_shape), obs_dtype),
+        ('terminals', (num_agents,), bool),
+        ('truncations', (num_agents,), bool),
+        ('masks', (num_agents,), bool),
+    ]
+    views = namespace()
+    offset = 0
+    for name, shape, dtype in fields:
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if packed is not None:
+            setattr(views, name, np.ndarray(shape, dtype=dtype, buffer=packed, offset=offset))
+        offset += nbytes
+
+    views.nbytes = offset
+    return views
+
+class RayWorker(Serial):
+    """Serial envs that write into a single packed buffer, so that each step
+    is returned from the actor as one object"""
+    def __init__(self, env_creators, env_args, env_kwargs, num_envs):
+        driver_env = env_creators[0](*env_args[0], **env_kwargs[0])
+        obs_space = driver_env.single_observation_space
+        atn_space = driver_env.single_action_space
+        num_agents = driver_env.num_agents * num_envs
+        driver_env.close()
+
+        nbytes = packed_views(None, obs_space.shape, obs_space.dtype, num_agents).nbytes
+        self.packed = np.zeros(nbytes, dtype=np.uint8)
+        buf = packed_views(self.packed, obs_space.shape, obs_space.dtype, num_agents)
+        buf.masks[:] = True
+        atn_dtype = atn_space.dtype
+        if not isinstance(atn_space, pufferlib.spaces.Box):
+            atn_dtype = np.int32
+
+        buf.actions = np.zeros((num_agents, *atn_space.shape), dtype=atn_dtype)
+        super().__init__(env_creators, env_args, env_kwargs, num_envs, buf=buf,
+            columnar_infos=True)
+
+    def reset_packed(self, seed):
+        self.async_reset(seed)
+        infos = self.recv()[4]
+        return self.packed, infos
+
+    def step_packed(self, actions):
+        self.send(actions)
+        infos = self.recv()[4]
+        return self.packed, infos
+
+class Ray():
+    """Runs environments in parallel on multiple processes using Ray
+
+    Use this module for distributed simulation on a cluster. Each worker
+    returns one packed buffer per step, which is read zero-copy from the
+    object store and copied straight into preallocated batch buffers.
+    """
+    reset = reset
+    step = step
+
+    @property
+    def num_envs(self):
+        return self.agents_per_batch
+
+    def __init__(self, env_creators, env_args, env_kwargs, num_envs,
+            num_workers=None, batch_size=None, columnar_infos=False, **kwargs):
+        self.columnar_infos = columnar_infos
+        if batch_size is None:
+            batch_size = num_envs
+        if num_workers is None:
+            num_workers = num_envs
+
+        envs_per_worker = num_envs // num_workers
+        self.envs_per_worker = envs_per_worker
+        self.workers_per_batch = batch_size // envs_per_worker
+        self.num_workers = num_workers
+        self.num_environments = num_envs
 
         driver_env = env_creators[0](*env_args[0], **env_kwargs[0])
         self.driver_env = driver_env
@@ -483,7 +2059,6 @@ class Ray():
         atn_space = driver_env.single_action_space
         atn_shape = atn_space.shape
 
-        shape = (num_workers, agents_per_worker)
         self.obs_batch_shape = (self.agents_per_batch, *obs_shape)
         self.atn_batch_shape = (self.workers_per_batch, agents_per_worker, *atn_shape)
 
@@ -494,6 +2069,19 @@ class Ray():
  
         self.agent_ids = np.arange(num_agents).reshape(num_workers, agents_per_worker)
 
+        # Batch outputs are allocated once and filled worker by worker
+        shape = (self.workers_per_batch, agents_per_worker)
+        self.buf = namespace(
+            observations=np.zeros((*shape, *obs_shape), dtype=obs_space.dtype),
+            rewards=np.zeros(shape, dtype=np.float32),
+            terminals=np.zeros(shape, dtype=bool),
+            truncations=np.zeros(shape, dtype=bool),
+            masks=np.ones(shape, dtype=bool),
+        )
+        self.obs_shape = obs_shape
+        self.obs_dtype = obs_space.dtype
+        self.agents_per_worker = agents_per_worker
+
         import ray
         if not ray.is_initialized():
             import logging
@@ -507,7 +2095,7 @@ class Ray():
             start = i * envs_per_worker
             end = start + envs_per_worker
             self.envs.append(
-                ray.remote(Serial).remote(
+                ray.remote(RayWorker).remote(
                     env_creators[start:end],
                     env_args[start:end],
                     env_kwargs[start:end],
@@ -515,7 +2103,7 @@ class Ray():
                 )
             )
 
-        self.async_handles = None
+        self.async_handles = {}
         self.initialized = False
         self.flag = RESET
         self.ray = ray
@@ -523,64 +2111,527 @@ class Ray():
 
     def recv(self):
         recv_precheck(self)
-        recvs = []
-        next_env_id = []
-        workers_per_batch = self.workers_per_batch
-        if self.env_pool:
-            recvs = self.ray.get(self.async_handles[:workers_per_batch])
-            env_id = [_ for _ in range(workers_per_batch)]
-        else:
-            ready, busy = self.ray.wait(
-                self.async_handles, num_returns=workers_per_batch)
-            env_id = [self.async_handles.index(e) for e in ready]
-            recvs = self.ray.get(ready)
+        handles = list(self.async_handles)
+        if self.workers_per_batch < len(handles):
+            handles, _ = self.ray.wait(handles, num_returns=self.workers_per_batch)
 
-        o, r, d, t, infos, ids, m = zip(*recvs)
+        # Keep worker order stable within the batch
+        handles = sorted(handles, key=self.async_handles.get)
+        env_id = [self.async_handles.pop(h) for h in handles]
         self.prev_env_id = env_id
 
-        infos = [i for ii in infos for i in ii]
-
-        o = np.stack(o, axis=0).reshape(self.obs_batch_shape)
-        r = np.stack(r, axis=0).ravel()
-        d = np.stack(d, axis=0).ravel()
-        t = np.stack(t, axis=0).ravel()
-        m = np.stack(m, axis=0).ravel()
+        buf = self.buf
+        infos = []
+        for i, (packed, info) in enumerate(self.ray.get(handles)):
+            src = packed_views(packed, self.obs_shape, self.obs_dtype, self.agents_per_worker)
+            buf.observations[i] = src.observations
+            buf.rewards[i] = src.rewards
+            buf.terminals[i] = src.terminals
+            buf.truncations[i] = src.truncations
+            buf.masks[i] = src.masks
+            infos.extend(info)
+
+        infos = _finish_infos(infos, self.columnar_infos)
+        o = buf.observations.reshape(self.obs_batch_shape)
+        r = buf.rewards.ravel()
+        d = buf.terminals.ravel()
+        t = buf.truncations.ravel()
+        m = buf.masks.ravel()
         agent_ids = self.agent_ids[env_id].ravel()
         return o, r, d, t, infos, agent_ids, m
 
     def send(self, actions):
         actions = send_precheck(self, actions).reshape(self.atn_batch_shape)
-        # TODO: What shape?
-
-        handles = []
         for i, e in enumerate(self.prev_env_id):
-            atns = actions[i]
-            env = self.envs[e]
-            env.send.remote(atns)
-            handles.append(env.recv.remote())
-
-        self.async_handles = handles
+            handle = self.envs[e].step_packed.remote(actions[i])
+            self.async_handles[handle] = e
 
     def async_reset(self, seed=42):
         self.flag = RECV
-        if seed is None:
-            kwargs = {}
-        else:
-            kwargs = {"seed": seed}
+        seed = make_seeds(seed, self.num_environments)
 
-        handles = []
-        for idx, e in enumerate(self.envs):
-            e.async_reset.remote(**kwargs)
-            handles.append(e.recv.remote())
+        # Results still in flight belong to the previous episode
+        if self.async_handles:
+            self.ray.wait(list(self.async_handles), num_returns=len(self.async_handles))
 
-        self.async_handles = handles
+        self.async_handles = {}
+        for i, e in enumerate(self.envs):
+            start = i * self.envs_per_worker
+            end = start + self.envs_per_worker
+            handle = e.reset_packed.remote(seed[start:end])
+            self.async_handles[handle] = i
 
     def close(self):
         self.ray.get([e.close.remote() for e in self.envs])
         self.ray.shutdown()
 
 
-def make(env_creator_or_creators, env_args=None, env_kwargs=None, backend=PufferEnv, num_envs=1, **kwargs):
+# Socket backend commands (client to server)
+SOCKET_RESET = 0
+SOCKET_STEP = 1
+SOCKET_CLOSE = 2
+SOCKET_CONFIG = 3
+
+SOCKET_PORT = 7777
+SOCKET_AUTHKEY_ENV = 'PUFFERLIB_AUTHKEY'
+SOCKET_AUTH_TIMEOUT = 10
+
+def parse_address(address):
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port or SOCKET_PORT)
+
+def socket_authkey(authkey=None):
+    '''authkey as bytes, read from $PUFFERLIB_AUTHKEY if not given'''
+    if authkey is None:
+        authkey = os.environ.get(SOCKET_AUTHKEY_ENV)
+    if isinstance(authkey, str):
+        authkey = authkey.encode()
+    return authkey
+
+def _recv_exact(sock, view):
+    # Zero-size views (e.g. emulated Discrete obs) cannot be cast
+    view = memoryview(view)
+    if view.nbytes == 0:
+        return
+    view = view.cast('B')
+    while len(view) > 0:
+        n = sock.recv_into(view)
+        if n == 0:
+            raise ConnectionError('Socket closed by peer')
+        view = view[n:]
+
+def _authenticate(sock, authkey, server):
+    '''Mutual HMAC challenge-response. Each side signs the other's random
+    nonce along with its role, so that challenges cannot be reflected back,
+    and the server checks the client before it signs anything itself'''
+    import hmac
+    from multiprocessing import AuthenticationError
+    nonce = os.urandom(32)
+    peer_nonce = bytearray(32)
+    digest = bytearray(32)
+    role, peer_role = (b'server', b'client') if server else (b'client', b'server')
+    if server:
+        _recv_exact(sock, peer_nonce)
+        sock.sendall(nonce)
+        _recv_exact(sock, digest)
+    else:
+        sock.sendall(nonce)
+        _recv_exact(sock, peer_nonce)
+        sock.sendall(hmac.digest(authkey, role + peer_nonce, 'sha256'))
+        _recv_exact(sock, digest)
+
+    if not hmac.compare_digest(digest, hmac.digest(authkey, peer_role + nonce, 'sha256')):
+        raise AuthenticationError(f'Socket {peer_role.decode()} failed authentication')
+
+    if server:
+        sock.sendall(hmac.digest(authkey, role + peer_nonce, 'sha256'))
+
+def _sendmsg_all(sock, buffers):
+    # Scatter-gather send straight from the numpy buffers
+    buffers = [memoryview(b) for b in buffers]
+    buffers = [b.cast('B') for b in buffers if b.nbytes > 0]
+    while buffers:
+        sent = sock.sendmsg(buffers)
+        while buffers and sent >= len(buffers[0]):
+            sent -= len(buffers[0])
+            buffers.pop(0)
+        if buffers:
+            buffers[0] = buffers[0][sent:]
+
+def _codec(compression):
+    if compression is None:
+        return None
+    elif compression == 'zlib':
+        import zlib
+        return namespace(compress=lambda b: zlib.compress(b, 1),
+            decompress=zlib.decompress)
+    elif compression == 'lz4':
+        try:
+            import lz4.frame
+        except ImportError:
+            raise APIUsageError('compression=lz4 requires the lz4 package')
+        return namespace(compress=lz4.frame.compress, decompress=lz4.frame.decompress)
+
+    raise APIUsageError(f'Invalid compression: {compression} (zlib/lz4)')
+
+def _socket_session(conn):
+    import pickle
+    import traceback
+    header = bytearray(9)
+    try:
+        _recv_exact(conn, header)
+        _, size = struct.unpack('!BQ', header)
+        payload = bytearray(size)
+        _recv_exact(conn, payload)
+        config = pickle.loads(payload)
+        codec = _codec(config['compression'])
+        vec_kwargs = dict(columnar_infos=True)
+        backend = Serial
+        if config['num_workers'] is not None:
+            backend = Multiprocessing
+            vec_kwargs.update(num_workers=config['num_workers'], overwork=config['overwork'])
+
+        vecenv = make(config['env_creators'], config['env_args'], config['env_kwargs'],
+            backend=backend, num_envs=len(config['env_creators']), **vec_kwargs)
+    except Exception:
+        msg = pickle.dumps(traceback.format_exc())
+        _sendmsg_all(conn, [struct.pack('!Q', len(msg)), msg])
+        conn.close()
+        return
+
+    msg = pickle.dumps(None)
+    _sendmsg_all(conn, [struct.pack('!Q', len(msg)), msg])
+
+    atn_space = vecenv.single_action_space
+    atn_dtype = atn_space.dtype
+    if isinstance(atn_space, (pufferlib.spaces.Discrete, pufferlib.spaces.MultiDiscrete)):
+        atn_dtype = np.int32
+
+    obs_dtype = vecenv.single_observation_space.dtype
+    while True:
+        try:
+            _recv_exact(conn, header)
+            cmd, size = struct.unpack('!BQ', header)
+            payload = bytearray(size)
+            _recv_exact(conn, payload)
+        except ConnectionError:
+            # Client went away without closing. Shut down the envs anyway
+            cmd = SOCKET_CLOSE
+
+        if cmd == SOCKET_RESET:
+            vecenv.async_reset(pickle.loads(payload))
+        elif cmd == SOCKET_STEP:
+            vecenv.send(np.frombuffer(payload, dtype=atn_dtype).reshape(vecenv.action_space.shape))
+        elif cmd == SOCKET_CLOSE:
+            vecenv.close()
+            conn.close()
+            return
+
+        o, r, d, t, infos, _, m = vecenv.recv()
+        data = [np.ascontiguousarray(o, dtype=obs_dtype), np.ascontiguousarray(r, dtype=np.float32),
+            np.ascontiguousarray(d, dtype=bool), np.ascontiguousarray(t, dtype=bool),
+            np.ascontiguousarray(m, dtype=bool)]
+        if codec is not None:
+            data = [codec.compress(b''.join(memoryview(a).cast('B') for a in data if a.nbytes))]
+
+        infos = pickle.dumps(infos) if infos else b''
+        data_size = sum(memoryview(a).nbytes for a in data)
+        _sendmsg_all(conn, [struct.pack('!QQ', data_size, len(infos)), *data, infos])
+
+def serve(address=None, listener=None, max_sessions=None, authkey=None):
+    """Serves worker groups to Socket backends. Each connection runs its envs
+    in a separate process on this host. Run on each remote host with
+    PUFFERLIB_AUTHKEY=<secret> python -m pufferlib.vector [host:port]
+
+    Trust model: sessions unpickle the env creators that clients send, so a
+    client can run any code on this host. Only clients that prove they hold
+    authkey (default $PUFFERLIB_AUTHKEY) get that far. Peers that fail the
+    challenge are closed before anything is unpickled. Traffic is neither
+    encrypted nor integrity checked after the handshake, so only serve on
+    trusted networks. The default address is 127.0.0.1:7777; bind another
+    interface (e.g. 0.0.0.0:7777) explicitly to accept remote hosts."""
+    import socket
+    from multiprocessing import Process, AuthenticationError
+    authkey = socket_authkey(authkey)
+    if not authkey:
+        raise APIUsageError(f'serve requires an authkey (or ${SOCKET_AUTHKEY_ENV}) '
+            'shared with the Socket backends that connect to it')
+
+    if listener is None:
+        listener = socket.create_server(parse_address(address or f':{SOCKET_PORT}'))
+
+    sessions = []
+    while max_sessions is None or len(sessions) < max_sessions:
+        conn, _ = listener.accept()
+        conn.settimeout(SOCKET_AUTH_TIMEOUT)
+        try:
+            _authenticate(conn, authkey, server=True)
+        except (AuthenticationError, OSError):
+            conn.close()
+            continue
+
+        conn.settimeout(None)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        p = Process(target=_socket_session, args=(conn,))
+        p.start()
+        conn.close()
+        sessions.append(p)
+
+    listener.close()
+    for p in sessions:
+        p.join()
+
+class Socket:
+    """Runs groups of environments on remote hosts over TCP
+
+    Each of the num_workers groups is one connection to a host listed in
+    hosts (host:port strings, assigned round-robin) running serve(). Groups
+    step their envs with Serial, or with a local Multiprocessing pool of
+    remote_workers processes, and stream back packed observations, rewards,
+    terminals, truncations and masks. With compression (zlib/lz4), the
+    packed data is compressed before it is sent. Env creators are pickled to
+    the hosts, so they must be importable there. If hosts is None, a server
+    is started on localhost.
+
+    Connections authenticate both ways with authkey (default
+    $PUFFERLIB_AUTHKEY), which must match the one given to serve on the
+    hosts. See serve for the trust model.
+    """
+    reset = reset
+    step = step
+
+    @property
+    def num_envs(self):
+        return self.agents_per_batch
+
+    def __init__(self, env_creators, env_args, env_kwargs, num_envs,
+            num_workers=None, batch_size=None, hosts=None, remote_workers=None,
+            compression=None, overwork=False, columnar_infos=False, authkey=None,
+            **kwargs):
+        import pickle
+        import socket
+        self.columnar_infos = columnar_infos
+        if batch_size is None:
+            batch_size = num_envs
+        if num_workers is None:
+            num_workers = num_envs
+
+        self.codec = _codec(compression)
+        envs_per_worker = num_envs // num_workers
+        self.envs_per_worker = envs_per_worker
+        self.workers_per_batch = batch_size // envs_per_worker
+        self.num_workers = num_workers
+        self.num_environments = num_envs
+
+        driver_env = env_creators[0](*env_args[0], **env_kwargs[0])
+        self.driver_env = driver_env
+        self.emulated = False if isinstance(driver_env, PufferEnv) else driver_env.emulated
+        self.num_agents = num_agents = driver_env.num_agents * num_envs
+        self.agents_per_batch = driver_env.num_agents * batch_size
+        agents_per_worker = driver_env.num_agents * envs_per_worker
+        obs_space = driver_env.single_observation_space
+        obs_shape = obs_space.shape
+        atn_space = driver_env.single_action_space
+        atn_shape = atn_space.shape
+        self.atn_dtype = atn_space.dtype
+        if isinstance(atn_space, (pufferlib.spaces.Discrete, pufferlib.spaces.MultiDiscrete)):
+            self.atn_dtype = np.int32
+
+        shape = (num_workers, agents_per_worker)
+        self.obs_batch_shape = (self.agents_per_batch, *obs_shape)
+        self.atn_batch_shape = (self.workers_per_batch, agents_per_worker, *atn_shape)
+
+        self.single_observation_space = driver_env.single_observation_space
+        self.single_action_space = driver_env.single_action_space
+        self.action_space = pufferlib.spaces.joint_space(self.single_action_space, self.agents_per_batch)
+        self.observation_space = pufferlib.spaces.joint_space(self.single_observation_space, self.agents_per_batch)
+        self.agent_ids = np.arange(num_agents).reshape(num_workers, agents_per_worker)
+
+        # Responses are received straight into these buffers
+        self.buf = namespace(
+            observations=np.zeros((*shape, *obs_shape), dtype=obs_space.dtype),
+            rewards=np.zeros(shape, dtype=np.float32),
+            terminals=np.zeros(shape, dtype=bool),
+            truncations=np.zeros(shape, dtype=bool),
+            masks=np.ones(shape, dtype=bool),
+        )
+        self.header = bytearray(16)
+
+        self.server = None
+        authkey = socket_authkey(authkey)
+        if hosts is None:
+            # The local server only needs a key for this run
+            authkey = authkey or os.urandom(32)
+            listener = socket.create_server(('127.0.0.1', 0))
+            from multiprocessing import Process
+            self.server = Process(target=serve, kwargs=dict(listener=listener,
+                max_sessions=num_workers, authkey=authkey))
+            self.server.start()
+            hosts = ['127.0.0.1:%d' % listener.getsockname()[1]]
+            listener.close()
+        elif not authkey:
+            raise APIUsageError(f'Socket hosts require an authkey (or ${SOCKET_AUTHKEY_ENV}) '
+                'matching the one their servers were started with')
+
+        import selectors
+        self.selector = selectors.DefaultSelector()
+        self.socks = []
+        try:
+            for i in range(num_workers):
+                start = i * envs_per_worker
+                end = start + envs_per_worker
+                sock = socket.create_connection(parse_address(hosts[i % len(hosts)]))
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.socks.append(sock)
+                _authenticate(sock, authkey, server=False)
+                try:
+                    config = pickle.dumps(dict(env_creators=env_creators[start:end],
+                        env_args=env_args[start:end], env_kwargs=env_kwargs[start:end],
+                        num_workers=remote_workers, overwork=overwork, compression=compression))
+                except Exception as e:
+                    raise APIUsageError(f'Socket backend requires picklable env creators: {e}')
+
+                self._send_cmd(sock, SOCKET_CONFIG, config)
+                self.selector.register(sock, selectors.EVENT_READ, i)
+        except BaseException:
+            # The local server waits for num_workers sessions and would
+            # otherwise keep the process alive
+            for sock in self.socks:
+                sock.close()
+            if self.server is not None:
+                self.server.terminate()
+                self.server.join()
+            raise
+
+        for i, sock in enumerate(self.socks):
+            _recv_exact(sock, memoryview(self.header)[:8])
+            msg = bytearray(struct.unpack('!Q', self.header[:8])[0])
+            _recv_exact(sock, msg)
+            err = pickle.loads(msg)
+            if err is not None:
+                self.close()
+                raise RuntimeError(f'Worker group {i} failed to start:\n{err}')
+
+        self.pending = set()
+        self.ready = []
+        self.infos = [[] for _ in range(num_workers)]
+        self.initialized = False
+        self.flag = RESET
+
+    def _send_cmd(self, sock, cmd, payload):
+        _sendmsg_all(sock, [struct.pack('!BQ', cmd, memoryview(payload).nbytes), payload])
+
+    def _read_response(self, w):
+        import pickle
+        sock = self.socks[w]
+        _recv_exact(sock, self.header)
+        data_size, info_size = struct.unpack('!QQ', self.header)
+        buf = self.buf
+        rows = [buf.observations[w], buf.rewards[w], buf.terminals[w],
+            buf.truncations[w], buf.masks[w]]
+        if self.codec is None:
+            for row in rows:
+                _recv_exact(sock, row)
+        else:
+            data = bytearray(data_size)
+            _recv_exact(sock, data)
+            data = self.codec.decompress(data)
+            offset = 0
+            for row in rows:
+                row.reshape(-1).view(np.uint8)[:] = np.frombuffer(
+                    data, dtype=np.uint8, count=row.nbytes, offset=offset)
+                offset += row.nbytes
+
+        self.infos[w] = []
+        if info_size > 0:
+            infos = bytearray(info_size)
+            _recv_exact(sock, infos)
+            self.infos[w] = pickle.loads(infos)
+
+        self.pending.discard(w)
+        self.ready.append(w)
+
+    def recv(self):
+        recv_precheck(self)
+        workers_per_batch = self.workers_per_batch
+        while len(self.ready) < workers_per_batch:
+            for key, _ in self.selector.select():
+                if key.data in self.pending:
+                    self._read_response(key.data)
+
+        if workers_per_batch == self.num_workers:
+            w_slice = slice(0, self.num_workers)
+            s_range = range(self.num_workers)
+            self.ready = []
+        else:
+            w_slice = self.ready[:workers_per_batch]
+            s_range = w_slice
+            self.ready = self.ready[workers_per_batch:]
+
+        self.w_slice = w_slice
+        buf = self.buf
+        o = buf.observations[w_slice].reshape(self.obs_batch_shape)
+        r = buf.rewards[w_slice].ravel()
+        d = buf.terminals[w_slice].ravel()
+        t = buf.truncations[w_slice].ravel()
+        m = buf.masks[w_slice].ravel()
+
+        infos = []
+        for i in s_range:
+            infos.extend(self.infos[i])
+            self.infos[i] = []
+
+        infos = _finish_infos(infos, self.columnar_infos)
+        agent_ids = self.agent_ids[w_slice].ravel()
+        return o, r, d, t, infos, agent_ids, m
+
+    def send(self, actions):
+        actions = send_precheck(self, actions).reshape(self.atn_batch_shape)
+        actions = np.ascontiguousarray(actions, dtype=self.atn_dtype)
+        workers = range(self.num_workers)[self.w_slice] if isinstance(
+            self.w_slice, slice) else self.w_slice
+        for i, w in enumerate(workers):
+            self._send_cmd(self.socks[w], SOCKET_STEP, actions[i])
+            self.pending.add(w)
+
+    def async_reset(self, seed=42):
+        import pickle
+        self.flag = RECV
+        seed = make_seeds(seed, self.num_environments)
+
+        # Drain responses still in flight from before the reset
+        for w in list(self.pending):
+            self._read_response(w)
+
+        self.ready = []
+        self.infos = [[] for _ in range(self.num_workers)]
+        for i, sock in enumerate(self.socks):
+            start = i * self.envs_per_worker
+            end = start + self.envs_per_worker
+            self._send_cmd(sock, SOCKET_RESET, pickle.dumps(seed[start:end]))
+            self.pending.add(i)
+
+    def close(self):
+        for sock in self.socks:
+            try:
+                self._send_cmd(sock, SOCKET_CLOSE, b'')
+            except OSError:
+                pass
+
+        # Wait for the sessions to shut down their envs
+        for sock in self.socks:
+            try:
+                while sock.recv(4096):
+                    pass
+            except OSError:
+                pass
+            sock.close()
+
+        self.selector.close()
+        if self.server is not None:
+            self.server.join()
+
+BACKENDS = {b.__name__: b for b in (Serial, Multiprocessing, Threaded, Ray, Socket)}
+
+def make(env_creator_or_creators, env_args=None, env_kwargs=None, backend=PufferEnv, num_envs=1,
+        env_name=None, cache_path=AUTOTUNE_CACHE, **kwargs):
+    if backend == 'auto':
+        # Best config found by autotune for this env on this machine. Pass
+        # the same env_name and cache_path that autotune was given
+        if env_name is None:
+            env_name = creator_name(env_creator_or_creators)
+
+        config = best_config(env_name, env_kwargs, kwargs.get('batch_size'), cache_path)
+        if config is None:
+            raise APIUsageError('backend=auto: no autotune results for this env, '
+                'env_kwargs and machine. Run pufferlib.vector.autotune first')
+
+        backend = config.pop('backend')
+        num_envs = config.pop('num_envs')
+        kwargs = {k: v for k, v in kwargs.items()
+            if k not in ('num_workers', 'batch_size', 'zero_copy', 'double_buffer')}
+        kwargs.update(config)
+
     if num_envs < 1:
         raise APIUsageError('num_envs must be at least 1')
     if num_envs != int(num_envs):
@@ -651,13 +2702,102 @@ def make(env_creator_or_creators, env_args=None, env_kwargs=None, backend=Puffer
 
     # Sanity check args
     for k in kwargs:
-        if k not in ['num_workers', 'batch_size', 'zero_copy', 'overwork', 'backend']:
+        if k not in ['num_workers', 'batch_size', 'zero_copy', 'overwork', 'blocking',
+                'info_ring_size', 'double_buffer', 'placement', 'max_restarts',
+                'hosts', 'remote_workers', 'compression', 'num_threads', 'padding',
+                'start_method', 'policy', 'segment_length', 'batch_timeout',
+                'reset_pool', 'gather_thread', 'obs_rows', 'columnar_infos', 'authkey',
+                'backend']:
             raise APIUsageError(f'Invalid argument: {k}')
 
     # TODO: First step action space check
     
     return backend(env_creators, env_args, env_kwargs, num_envs, **kwargs)
 
+class Pool:
+    '''Keeps one vecenv alive across runs, e.g. hyperparameter sweep trials
+
+    make takes the same arguments as pufferlib.vector.make. If the backend,
+    creator, num_envs and options other than batch_size match the previous
+    call, the same vecenv is returned. Backends with a reconfigure method
+    (Multiprocessing) only rebuild envs whose kwargs changed and re-slice
+    their buffers for a new batch_size. Others are reused only if nothing
+    changed. Anything else closes the old vecenv and makes a new one. An
+    actor policy with the same type and parameter shapes as before does not
+    count as a change: its weights are published with update_policy.
+    '''
+    def __init__(self):
+        self.vecenv = None
+        self.key = None
+        self.config = None
+        self.hits = 0
+        self.misses = 0
+
+    def make(self, env_creator_or_creators, env_args=None, env_kwargs=None,
+            backend=PufferEnv, num_envs=1, **kwargs):
+        batch_size = kwargs.pop('batch_size', None)
+        # Actors take new weights of the same shapes through update_policy,
+        # so only the policy's architecture is part of the key
+        policy = kwargs.pop('policy', None)
+        key = (env_creator_or_creators, env_args, backend, num_envs, kwargs,
+            policy_key(policy))
+        # Callers often update the same kwargs dict in place between runs,
+        # so the vecenv gets its own copy to compare against
+        env_kwargs = copy.deepcopy(env_kwargs)
+        config = (env_kwargs, batch_size)
+        if self.vecenv is not None and self.key == key:
+            if config == self.config:
+                self.hits += 1
+                if hasattr(self.vecenv, 'reconfigure'):
+                    self.vecenv.reconfigure()
+                if policy is not None:
+                    self.vecenv.update_policy(policy)
+                return self.vecenv
+
+            if hasattr(self.vecenv, 'reconfigure'):
+                try:
+                    self.vecenv.reconfigure(env_kwargs, batch_size or num_envs)
+                except APIUsageError:
+                    pass
+                else:
+                    self.hits += 1
+                    self.config = config
+                    if policy is not None:
+                        self.vecenv.update_policy(policy)
+                    return self.vecenv
+
+        self.close()
+        self.misses += 1
+        if batch_size is not None:
+            kwargs = {**kwargs, 'batch_size': batch_size}
+        if policy is not None:
+            kwargs = {**kwargs, 'policy': policy}
+
+        self.vecenv = make(env_creator_or_creators, env_args, env_kwargs,
+            backend, num_envs, **kwargs)
+        self.key = key
+        self.config = config
+        return self.vecenv
+
+    def close(self):
+        if self.vecenv is not None:
+            self.vecenv.close()
+
+        self.vecenv = None
+        self.key = None
+        self.config = None
+
+def policy_key(policy):
+    '''Type and parameter shapes of an actor policy, or None'''
+    if policy is None:
+        return None
+
+    num_params = getattr(policy, 'num_params', None)
+    if num_params is not None:
+        return (type(policy), num_params)
+
+    return (type(policy), tuple(tuple(p.shape) for p in policy.parameters()))
+
 def make_seeds(seed, num_envs):
     if isinstance(seed, int):
         return [seed + i for i in range(num_envs)]
@@ -671,6 +2811,131 @@ def make_seeds(seed, num_envs):
 
     raise APIUsageError(err)
 
+def worker_rows_nbytes(num_workers, row_shape, dtype, align=0):
+    row = int(np.prod(row_shape)) * np.dtype(dtype).itemsize
+    if align:
+        row = -(-row // align) * align
+
+    return max(1, num_workers * row)
+
+def worker_rows(buffer, num_workers, row_shape, dtype, align=0):
+    '''(num_workers, *row_shape) view of a shared buffer. With align, each
+    worker's row starts on its own align-byte boundary'''
+    dtype = np.dtype(dtype)
+    inner = [dtype.itemsize * int(np.prod(row_shape[i+1:])) for i in range(len(row_shape))]
+    row = int(np.prod(row_shape)) * dtype.itemsize
+    if align:
+        row = -(-row // align) * align
+
+    return np.ndarray((num_workers, *row_shape), dtype=dtype,
+        buffer=buffer, strides=(row, *inner))
+
+def probe_env(env_creator, env_args, env_kwargs):
+    '''Spaces and num_agents of an env. Uses the creator's probe attribute
+    if it has one, so that no full env has to be built'''
+    probe = getattr(env_creator, 'probe', None)
+    if probe is None:
+        return env_creator(*env_args, **env_kwargs)
+
+    return probe(*env_args, **env_kwargs)
+
+def shared_array(ctype, size, lazy=False):
+    '''Shared memory for worker buffers. RawArray zero-fills from the calling
+    process, which places every page on the main process's NUMA node. A lazy
+    anonymous mmap is placed by whichever worker touches it first instead.'''
+    from multiprocessing import RawArray
+    if not lazy:
+        return RawArray(ctype, size)
+
+    import ctypes
+    import mmap
+    from multiprocessing.sharedctypes import typecode_to_type
+    ctype = typecode_to_type.get(ctype, ctype)
+    return mmap.mmap(-1, max(1, size * ctypes.sizeof(ctype)))
+
+def parse_cpulist(cpulist):
+    '''Parses a sysfs cpu list such as 0-3,8-11'''
+    cpus = []
+    for part in cpulist.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            lo, hi = part.split('-')
+            cpus.extend(range(int(lo), int(hi) + 1))
+        else:
+            cpus.append(int(part))
+
+    return cpus
+
+def cpu_topology():
+    '''Returns the physical cores available to this process, each as a list
+    of logical cpus, and the NUMA node of each core. Falls back to one core
+    per logical cpu on a single node if sysfs is unavailable.'''
+    allowed = sorted(os.sched_getaffinity(0))
+    sysfs = '/sys/devices/system'
+
+    node_of_cpu = {}
+    for node_dir in sorted(os.listdir(f'{sysfs}/node')) if os.path.isdir(f'{sysfs}/node') else []:
+        if not node_dir.startswith('node') or not node_dir[4:].isdigit():
+            continue
+        with open(f'{sysfs}/node/{node_dir}/cpulist') as f:
+            for cpu in parse_cpulist(f.read()):
+                node_of_cpu[cpu] = int(node_dir[4:])
+
+    cores = {}
+    for cpu in allowed:
+        try:
+            with open(f'{sysfs}/cpu/cpu{cpu}/topology/physical_package_id') as f:
+                package = int(f.read())
+            with open(f'{sysfs}/cpu/cpu{cpu}/topology/core_id') as f:
+                core = int(f.read())
+        except OSError:
+            package, core = 0, cpu
+
+        key = (node_of_cpu.get(cpu, 0), package, core)
+        cores.setdefault(key, []).append(cpu)
+
+    keys = sorted(cores, key=lambda k: (k[0], min(cores[k])))
+    return [cores[k] for k in keys], [k[0] for k in keys]
+
+def make_layout(placement, num_workers):
+    '''Assigns cpus to the main process and to each worker. placement is
+    None, 'cores', 'numa', or a layout returned by a previous call'''
+    if placement is None:
+        return None
+
+    if isinstance(placement, (dict, Namespace)):
+        if len(placement['workers']) != num_workers:
+            raise APIUsageError('placement must list cpus for every worker')
+
+        return namespace(
+            numa=bool(placement.get('numa', False)),
+            main=list(placement['main']),
+            workers=[list(c) for c in placement['workers']],
+            nodes=list(placement.get('nodes', [0] * num_workers)),
+        )
+
+    if placement not in ('cores', 'numa'):
+        raise APIUsageError(f'Invalid placement: {placement} (cores/numa)')
+
+    # Cores are ordered by NUMA node, so consecutive workers (and therefore
+    # contiguous zero-copy blocks) share a node where possible
+    cores, nodes = cpu_topology()
+
+    # Keep the first core for the learner if there are enough to go around
+    worker_cores = range(1, len(cores)) if len(cores) > num_workers else range(len(cores))
+    workers = [worker_cores[i % len(worker_cores)] for i in range(num_workers)]
+    main = [c for i in range(len(cores)) if i not in workers for c in cores[i]]
+    if not main:
+        main = cores[0]
+
+    return namespace(
+        numa=placement == 'numa',
+        main=main,
+        workers=[cores[i] for i in workers],
+        nodes=[nodes[i] for i in workers],
+    )
+
 def check_envs(envs, driver):
     valid = (PufferEnv, GymnasiumPufferEnv, PettingZooPufferEnv)
     if not isinstance(driver, valid):
@@ -688,24 +2953,87 @@ def check_envs(envs, driver):
         if atn_space != driver_atn:
             raise APIUsageError(f'\n{atn_space}\n{driver_atn} atn space mismatch')
 
-def autotune(env_creator, batch_size, max_envs=194, model_forward_s=0.0,
-        max_env_ram_gb=32, max_batch_vram_gb=0.05, time_per_test=5): 
-    '''Determine the optimal vectorization parameters for your system'''
-    # TODO: fix multiagent
+def hardware_fingerprint():
+    '''Identifies machines that should share autotune results'''
+    import platform
+    cpu = platform.processor()
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    cpu = line.split(':', 1)[1].strip()
+                    break
+    except OSError:
+        pass
+
+    cores = psutil.cpu_count(logical=False)
+    threads = psutil.cpu_count(logical=True)
+    ram = round(psutil.virtual_memory().total / 2**30)
+    return f'{platform.machine()} {cpu} {cores}c/{threads}t {ram}GB'
+
+def creator_name(env_creator):
+    if isinstance(env_creator, (list, tuple)):
+        env_creator = env_creator[0]
+
+    func = getattr(env_creator, 'func', env_creator) # functools.partial
+    return f'{func.__module__}.{func.__qualname__}'
+
+def autotune_key(env_name, env_kwargs):
+    import json
+    return json.dumps([env_name, env_kwargs or {}, hardware_fingerprint()],
+        sort_keys=True, default=str)
+
+def load_autotune(env_name, env_kwargs=None, cache_path=AUTOTUNE_CACHE):
+    '''Cached autotune entry for this env on this machine'''
+    import json
+    if not os.path.exists(cache_path):
+        return {}
+
+    with open(cache_path) as f:
+        cache = json.load(f)
+
+    return cache.get(autotune_key(env_name, env_kwargs), {})
+
+def save_autotune(entry, env_name, env_kwargs=None, cache_path=AUTOTUNE_CACHE):
+    import json
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cache = json.load(f)
+
+    entry['results'].sort(key=lambda r: -r['sps'])
+    cache[autotune_key(env_name, env_kwargs)] = entry
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+
+    # Write then rename so that an interrupted run never corrupts the cache
+    tmp = f'{cache_path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(cache, f, indent=2, default=str)
+
+    os.replace(tmp, cache_path)
+
+def best_config(env_name, env_kwargs=None, batch_size=None, cache_path=AUTOTUNE_CACHE):
+    '''Fastest cached config for make, or None if not yet tuned'''
+    for result in load_autotune(env_name, env_kwargs, cache_path).get('results', []):
+        if result['pruned']:
+            continue
+        if batch_size is not None and result['config'].get('batch_size',
+                result['config']['num_envs']) != batch_size:
+            continue
 
-    if batch_size is None:
-        raise ValueError('batch_size must not be None')
+        config = dict(result['config'])
+        config['backend'] = BACKENDS[config['backend']]
+        return config
 
-    if max_envs < batch_size:
-        raise ValueError('max_envs < min_batch_size')
+    return None
 
-    num_cores = psutil.cpu_count(logical=False)
+def profile_env(env_creator, env_kwargs, time_per_test):
+    '''Single-core performance of one env'''
     idle_ram = psutil.Process().memory_info().rss
     load_ram = idle_ram
 
-    # Initial profile to estimate single-core performance
     print('Profiling single-core performance for ~', time_per_test, 'seconds')
-    env = env_creator()
+    env = env_creator(**env_kwargs)
     env.reset()
     obs_space = env.single_observation_space
     actions = [
@@ -732,18 +3060,61 @@ def autotune(env_creator, batch_size, max_envs=194, model_forward_s=0.0,
 
     env.close()
     sum_time = sum(step_times) + sum(reset_times)
-    reset_percent = 100 * sum(reset_times) / sum_time
-    sps = steps * num_agents / sum_time
-    step_variance = 100 * np.std(step_times) / np.mean(step_times)
-    reset_mean = np.mean(reset_times)
-    ram_usage = max(1, (idle_ram - load_ram)) / 1e9
-
     obs_size_gb = (
         np.prod(obs_space.shape)
         * np.dtype(obs_space.dtype).itemsize
         * num_agents
         / 1e9
     )
+    return dict(
+        sps=steps * num_agents / sum_time,
+        std=100 * np.std(step_times) / np.mean(step_times),
+        reset=100 * sum(reset_times) / sum_time,
+        ram_gb=max(1, (idle_ram - load_ram)) / 1e9,
+        obs_gb=float(obs_size_gb),
+    )
+
+def autotune(env_creator, batch_size, max_envs=194, model_forward_s=0.0,
+        max_env_ram_gb=32, max_batch_vram_gb=0.05, time_per_test=5,
+        env_kwargs=None, env_name=None, cache_path=AUTOTUNE_CACHE,
+        refresh=False, prune=0.5):
+    '''Determine the optimal vectorization parameters for your system
+
+    Results are cached per env name, env kwargs and machine and saved after
+    every config, so an interrupted search resumes where it left off. Configs
+    slower than prune times the best SPS so far after a fifth of
+    time_per_test are stopped early. Returns the results, fastest first.
+    make(..., backend='auto') loads the fastest one.
+    '''
+    # TODO: fix multiagent
+
+    if batch_size is None:
+        raise ValueError('batch_size must not be None')
+
+    if max_envs < batch_size:
+        raise ValueError('max_envs < min_batch_size')
+
+    env_kwargs = env_kwargs or {}
+    if env_name is None:
+        env_name = creator_name(env_creator)
+
+    entry = {} if refresh else load_autotune(env_name, env_kwargs, cache_path)
+    entry.setdefault('env_name', env_name)
+    entry.setdefault('env_kwargs', env_kwargs)
+    entry.setdefault('hardware', hardware_fingerprint())
+    entry.setdefault('results', [])
+
+    num_cores = psutil.cpu_count(logical=False)
+    if 'profile' in entry:
+        print('Using cached single-core profile')
+    else:
+        entry['profile'] = profile_env(env_creator, env_kwargs, time_per_test)
+        save_autotune(entry, env_name, env_kwargs, cache_path)
+
+    profile = entry['profile']
+    ram_usage = profile['ram_gb']
+    obs_size_gb = profile['obs_gb']
+    sps = profile['sps']
 
     # Max bandwidth
     bandwidth = obs_size_gb * sps
@@ -751,8 +3122,8 @@ def autotune(env_creator, batch_size, max_envs=194, model_forward_s=0.0,
 
     print('Profile complete')
     print(f'    SPS: {sps:.3f}')
-    print(f'    STD: {step_variance:.3f}%')
-    print(f'    Reset: {reset_percent:.3f}%')
+    print(f'    STD: {profile["std"]:.3f}%')
+    print(f'    Reset: {profile["reset"]:.3f}%')
     print(f'    RAM: {1000*ram_usage:.3f} MB/env')
     print(f'    Bandwidth: {bandwidth:.3f} GB/s')
     print(f'    Throughput: {throughput:.3f} GB/s ({num_cores} cores)')
@@ -835,42 +3206,77 @@ def autotune(env_creator, batch_size, max_envs=194, model_forward_s=0.0,
             backend=Multiprocessing,
         ))
 
-    # Strategy 5: Serial
+    # Strategy 5: Double-buffered variants of the zero-copy strategies
+    configs += [dict(config, double_buffer=True) for config in configs
+        if config.get('zero_copy', True)]
+
+    # Strategy 6: Serial
     configs.append(dict(
         num_envs=batch_size,
         backend=Serial,
     ))
 
+    import json
+    results = entry['results']
+    tested = {json.dumps(r['config'], sort_keys=True): r for r in results}
+    best_sps = max([r['sps'] for r in results if not r['pruned']], default=0)
     for config in configs:
-        with pufferlib.utils.Suppress():
-            envs = make(env_creator, **config)
-            envs.reset()
-        actions = [envs.action_space.sample() for _ in range(1000)]
-        step_time = 0
-        steps = 0
-        start = time.time()
-        while time.time() - start < time_per_test:
-            s = time.time()
-            envs.send(actions[steps%1000])
-            step_time += time.time() - s
-
-            if model_forward_s > 0:
-                time.sleep(model_forward_s)
+        config = dict(config, backend=config['backend'].__name__)
+        key = json.dumps(config, sort_keys=True)
+        if key in tested:
+            result = tested[key]
+            print(f'SPS: {result["sps"]:.3f} (cached)')
+        else:
+            with pufferlib.utils.Suppress():
+                envs = make(env_creator, env_kwargs=env_kwargs,
+                    **dict(config, backend=BACKENDS[config['backend']]))
+                envs.reset()
+            actions = [envs.action_space.sample() for _ in range(1000)]
+            step_time = 0
+            steps = 0
+            pruned = False
+            start = time.time()
+            while time.time() - start < time_per_test:
+                s = time.time()
+                envs.send(actions[steps%1000])
+                step_time += time.time() - s
+
+                if model_forward_s > 0:
+                    time.sleep(model_forward_s)
+
+                s = time.time()
+                envs.recv()
+                step_time += time.time() - s
+
+                steps += 1
+
+                # Stop clearly losing configs early
+                if (not pruned and time.time() - start > time_per_test / 5
+                        and steps * envs.agents_per_batch / step_time < prune * best_sps):
+                    pruned = True
+                    break
 
-            s = time.time()
-            envs.recv()
-            step_time += time.time() - s
+            envs.close()
+            result = dict(
+                config=config,
+                sps=steps * envs.agents_per_batch / step_time,
+                pruned=pruned,
+            )
+            results.append(result)
+            tested[key] = result
+            save_autotune(entry, env_name, env_kwargs, cache_path)
+            print(f'SPS: {result["sps"]:.3f}' + (' (pruned)' if pruned else ''))
 
-            steps += 1
+        if not result['pruned']:
+            best_sps = max(best_sps, result['sps'])
 
-        end = time.time()
-        envs.close()
-        sps = steps * envs.agents_per_batch / step_time
-        print(f'SPS: {sps:.3f}')
         for k, v in config.items():
-            if k == 'backend':
-                v = v.__name__
-
             print(f'    {k}: {v}')
 
         print()
+
+    return entry['results']
+
+if __name__ == '__main__':
+    import sys
+    serve(sys.argv[1] if len(sys.argv) > 1 else None)
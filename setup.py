@@ -287,6 +287,11 @@ extensions = [Extension(
     extra_objects=[f'{RAYLIB_LIB}/libraylib.a']
 ) for path in extension_paths]
 
+# GAE runs segments in parallel with prange. Apple clang has no -fopenmp
+openmp = ['-fopenmp'] if system == 'Linux' else []
+c_gae = Extension('c_gae', ['c_gae.pyx'],
+    extra_compile_args=openmp, extra_link_args=openmp)
+
 # Prevent Conda from injecting garbage compile flags
 from distutils.sysconfig import get_config_vars
 cfg_vars = get_config_vars()
@@ -336,7 +341,7 @@ setup(
     },
     ext_modules = cythonize([
         "pufferlib/extensions.pyx",
-        "c_gae.pyx",
+        c_gae,
         "pufferlib/puffernet.pyx",
         "pufferlib/ocean/grid/c_grid.pyx",
         *extensions,
@@ -1,9 +1,12 @@
 from pdb import set_trace as T
 
+import functools
 import numpy as np
 
 import pufferlib
 import pufferlib.emulation
+import pufferlib.environment
+import pufferlib.exceptions
 import pufferlib.utils
 import pufferlib.vector
 from pufferlib.environments import test
@@ -13,6 +16,18 @@ import gymnasium
 import warnings
 warnings.filterwarnings("ignore")
 
+# Picklable creator of the first mock env, shared by the backend tests
+mock_env_creator = functools.partial(pufferlib.emulation.GymnasiumPufferEnv,
+    env_creator=test.MOCK_SINGLE_AGENT_ENVIRONMENTS[0])
+
+def make_mock_vecenv(env_creator=mock_env_creator,
+        backend=pufferlib.vector.Multiprocessing, **kwargs):
+    '''Vecenv for the backend tests. Multiprocessing overworks, since test
+    hosts often have fewer cores than workers'''
+    if backend is pufferlib.vector.Multiprocessing:
+        kwargs.setdefault('overwork', True)
+    return pufferlib.vector.make(env_creator, backend=backend, **kwargs)
+
 
 def test_gymnasium_emulation(env_cls, steps=100):
     raw_env = env_cls()
@@ -106,6 +121,15 @@ def test_puffer_vectorization(env_cls, puffer_cls, steps=100, num_envs=1, **kwar
     vec_envs = pufferlib.vector.make(puffer_cls,
         env_kwargs={'env_creator': env_cls}, num_envs=num_envs, **kwargs)
 
+    # Close in finally so that a failed assertion does not hang on workers
+    try:
+        check_puffer_vectorization(raw_envs, vec_envs, steps, num_envs)
+    finally:
+        vec_envs.close()
+        for raw_env in raw_envs:
+            raw_env.close()
+
+def check_puffer_vectorization(raw_envs, vec_envs, steps, num_envs):
     num_agents = sum(env.num_agents for env in raw_envs)
     assert num_agents == vec_envs.num_agents
 
@@ -113,11 +137,13 @@ def test_puffer_vectorization(env_cls, puffer_cls, steps=100, num_envs=1, **kwar
     vec_obs, _ = vec_envs.reset()
 
     for _ in range(steps):
-        # PettingZoo dict observations
+        # PettingZoo dict observations are one row per agent. Puffer envs
+        # already have a leading agent dimension
         if isinstance(raw_obs[0], dict):
-            raw_obs = [v for d in raw_obs for v in d.values()]
+            raw_obs = np.stack([v for d in raw_obs for v in d.values()], axis=0)
+        else:
+            raw_obs = np.concatenate(raw_obs, axis=0)
 
-        raw_obs = np.stack(raw_obs, axis=0)
         assert raw_obs.shape == vec_obs.shape
         assert np.all(raw_obs == vec_obs)
 
@@ -141,24 +167,19 @@ def test_puffer_vectorization(env_cls, puffer_cls, steps=100, num_envs=1, **kwar
                 
         vec_obs, vec_rewards, vec_terminals, vec_truncations, _ = vec_envs.step(actions)
 
-        rew = raw_rewards
         if isinstance(raw_rewards[0], dict):
             raw_rewards = [v for d in raw_rewards for v in d.values()]
             raw_terminals = [v for d in raw_terminals for v in d.values()]
             raw_truncations = [v for d in raw_truncations for v in d.values()]
 
-        raw_rewards = np.asarray(raw_rewards, dtype=np.float32)
-        raw_terminals = np.asarray(raw_terminals)
-        raw_truncations = np.asarray(raw_truncations)
+        raw_rewards = np.hstack(raw_rewards).astype(np.float32)
+        raw_terminals = np.hstack(raw_terminals)
+        raw_truncations = np.hstack(raw_truncations)
 
         assert np.all(raw_rewards == vec_rewards)
         assert np.all(raw_terminals == vec_terminals)
         assert np.all(raw_truncations == vec_truncations)
 
-    vec_envs.close()
-    for raw_env in raw_envs:
-        raw_env.close()
-
 def test_emulation():
     for env_cls in test.MOCK_SINGLE_AGENT_ENVIRONMENTS:
         test_gymnasium_emulation(env_cls)
@@ -174,6 +195,7 @@ def test_vectorization():
     for vectorization in [
             pufferlib.vector.Serial,
             pufferlib.vector.Multiprocessing,
+            pufferlib.vector.Threaded,
             pufferlib.vector.Ray]:
         for env_cls in test.MOCK_SINGLE_AGENT_ENVIRONMENTS:
             test_puffer_vectorization(
@@ -199,7 +221,817 @@ def test_vectorization():
 
         print(f'PettingZoo {vectorization.__name__} vectorization tests passed')
 
+def test_multiprocessing_blocking():
+    for env_cls in test.MOCK_SINGLE_AGENT_ENVIRONMENTS:
+        test_puffer_vectorization(
+            env_cls,
+            pufferlib.emulation.GymnasiumPufferEnv,
+            steps=10,
+            num_envs=4,
+            num_workers=4,
+            backend=pufferlib.vector.Multiprocessing,
+            blocking=True,
+            overwork=True,
+        )
+
+    print('Gymnasium Multiprocessing blocking tests passed')
+
+def test_multiprocessing_double_buffer():
+    for env_cls in test.MOCK_SINGLE_AGENT_ENVIRONMENTS:
+        test_puffer_vectorization(
+            env_cls,
+            pufferlib.emulation.GymnasiumPufferEnv,
+            steps=10,
+            num_envs=4,
+            num_workers=4,
+            backend=pufferlib.vector.Multiprocessing,
+            double_buffer=True,
+            overwork=True,
+        )
+
+    print('Gymnasium Multiprocessing double buffer tests passed')
+
+def test_ray(steps=10):
+    try:
+        import ray
+    except ImportError:
+        print('Ray not installed, skipping Ray tests')
+        return
+
+    for puffer_cls, env_cls in [
+            (pufferlib.emulation.GymnasiumPufferEnv, test.MOCK_SINGLE_AGENT_ENVIRONMENTS[0]),
+            (pufferlib.emulation.PettingZooPufferEnv, test.MOCK_MULTI_AGENT_ENVIRONMENTS[6])]:
+        env_creator = functools.partial(puffer_cls, env_creator=env_cls)
+        serial = make_mock_vecenv(env_creator, backend=pufferlib.vector.Serial, num_envs=4)
+        vecenv = make_mock_vecenv(env_creator, backend=pufferlib.vector.Ray,
+            num_envs=4, num_workers=2)
+        try:
+            serial.async_reset(1)
+            vecenv.async_reset(1)
+            for _ in range(steps):
+                expected = serial.recv()
+                actual = vecenv.recv()
+                for i in (0, 1, 2, 3, 5, 6):
+                    assert expected[i].shape == actual[i].shape
+                    assert np.all(expected[i] == actual[i])
+
+                # Both backends must accept the same actions
+                actions = serial.action_space.sample()
+                serial.send(actions)
+                vecenv.send(actions)
+        finally:
+            serial.close()
+            vecenv.close()
+
+    print('Ray tests passed')
+
+def test_multiprocessing_gather(steps=10):
+    for gather_thread in [False, True]:
+        vecenv = make_mock_vecenv(num_envs=4, num_workers=4, batch_size=2, zero_copy=False,
+            gather_thread=gather_thread)
+        vecenv.async_reset(1)
+        batches = []
+        for _ in range(steps):
+            o, r, d, t, infos, env_ids, m = vecenv.recv()
+            assert len(env_ids) == 2 and m.all()
+            batches.append(o)
+            vecenv.send(vecenv.action_space.sample())
+
+        # Batches alternate between two reusable buffers
+        assert np.shares_memory(batches[0], batches[2])
+        assert not np.shares_memory(batches[0], batches[1])
+        vecenv.close()
+
+    print('Multiprocessing gather tests passed')
+
+def test_action_buffer(steps=10):
+    for zero_copy in [True, False]:
+        vecenv = make_mock_vecenv(num_envs=4, num_workers=4, batch_size=2, zero_copy=zero_copy)
+        vecenv.async_reset(1)
+        for _ in range(steps):
+            vecenv.recv()
+            buf = vecenv.action_buffer()
+            actions = vecenv.action_space.sample()
+            if zero_copy:
+                # Written in place, so send does not copy
+                buf[:] = actions
+                vecenv.send(buf)
+            else:
+                # Gathered batches are not one shared block
+                assert buf is None
+                vecenv.send(actions)
+
+        assert vecenv.action_buffer() is None
+        vecenv.close()
+
+    print('Action buffer tests passed')
+
+def test_obs_rows(steps=10):
+    for zero_copy in [True, False]:
+        vecenv = make_mock_vecenv(num_envs=4, num_workers=4, batch_size=2, zero_copy=zero_copy,
+            obs_rows=8)
+        assert len(vecenv.obs_rows) == 8 + 2*vecenv.num_agents
+        vecenv.async_reset(1)
+        cursor = 0
+        sent = set()
+        for step in range(steps):
+            o, r, d, t, infos, env_ids, m = vecenv.recv()
+            rows = vecenv.observation_rows()
+
+            # Written by the workers into the rows sent with their last step
+            written = np.isin(env_ids, list(sent))
+            assert ((rows >= 0) == written).all()
+            assert (vecenv.obs_rows[rows[written]] == o[written]).all()
+
+            sent.update(env_ids.tolist())
+            rows = cursor + np.arange(len(env_ids))
+            cursor = (cursor + len(env_ids)) % len(vecenv.obs_rows)
+            vecenv.send(vecenv.action_space.sample(), obs_rows=rows)
+
+        vecenv.close()
+
+    print('Observation rows tests passed')
+
+def test_socket():
+    for compression in [None, 'zlib']:
+        for env_cls in test.MOCK_SINGLE_AGENT_ENVIRONMENTS:
+            test_puffer_vectorization(
+                env_cls,
+                pufferlib.emulation.GymnasiumPufferEnv,
+                steps=10,
+                num_envs=4,
+                num_workers=2,
+                backend=pufferlib.vector.Socket,
+                compression=compression,
+            )
+
+    # A failed setup must not leave the localhost server waiting for sessions
+    import multiprocessing
+    env_creator = lambda: pufferlib.emulation.GymnasiumPufferEnv(
+        env_creator=test.MOCK_SINGLE_AGENT_ENVIRONMENTS[0])
+    try:
+        pufferlib.vector.make(env_creator, num_envs=2, num_workers=2,
+            backend=pufferlib.vector.Socket)
+    except pufferlib.exceptions.APIUsageError:
+        pass
+    else:
+        raise AssertionError('Expected APIUsageError for unpicklable creator')
+
+    assert not multiprocessing.active_children()
+
+    # Servers need a shared key and close peers that do not prove they hold it
+    import socket
+    try:
+        pufferlib.vector.serve(listener=socket.create_server(('127.0.0.1', 0)))
+    except pufferlib.exceptions.APIUsageError:
+        pass
+    else:
+        raise AssertionError('Expected APIUsageError for serve without an authkey')
+
+    listener = socket.create_server(('127.0.0.1', 0))
+    host = '127.0.0.1:%d' % listener.getsockname()[1]
+    server = multiprocessing.Process(target=pufferlib.vector.serve,
+        kwargs=dict(listener=listener, max_sessions=1, authkey=b'secret'))
+    server.start()
+    listener.close()
+    try:
+        sock = socket.create_connection(pufferlib.vector.parse_address(host))
+        try:
+            pufferlib.vector._authenticate(sock, b'wrong', server=False)
+        except (multiprocessing.AuthenticationError, ConnectionError):
+            pass
+        else:
+            raise AssertionError('Expected the server to reject a wrong authkey')
+        sock.close()
+
+        try:
+            make_mock_vecenv(backend=pufferlib.vector.Socket, num_envs=2,
+                num_workers=1, hosts=[host])
+        except pufferlib.exceptions.APIUsageError:
+            pass
+        else:
+            raise AssertionError('Expected APIUsageError for hosts without an authkey')
+
+        vecenv = make_mock_vecenv(backend=pufferlib.vector.Socket, num_envs=2,
+            num_workers=1, hosts=[host], authkey='secret')
+        vecenv.reset()
+        vecenv.step(vecenv.action_space.sample())
+        vecenv.close()
+        server.join()
+    finally:
+        server.terminate()
+        server.join()
+
+    print('Gymnasium Socket localhost tests passed')
+
+def test_multiprocessing_stats():
+    vecenv = make_mock_vecenv(num_envs=4, num_workers=4, batch_size=4)
+    vecenv.async_reset(1)
+    vecenv.recv()
+    stats = vecenv.stats()
+    assert stats.reset.count.tolist() == [1, 1, 1, 1]
+    assert (stats.reset.p50 > 0).all() and (stats.reset.p99 >= stats.reset.p50).all()
+    assert stats.scheduler.batches == 1
+    assert stats.scheduler.passes_per_batch >= 1
+    stats = vecenv.stats()
+    assert stats.reset.count.sum() == 0 and stats.scheduler.batches == 0
+    vecenv.close()
+
+    print('Multiprocessing stats tests passed')
+
+def test_snapshot(steps=20):
+    for backend, kwargs in [(pufferlib.vector.Serial, {}),
+            (pufferlib.vector.Multiprocessing, dict(num_workers=2))]:
+        vecenv = make_mock_vecenv(backend=backend, num_envs=2, **kwargs)
+        vecenv.reset(seed=1)
+        actions = [vecenv.action_space.sample() for _ in range(steps)]
+        handle = vecenv.snapshot()
+        obs = [vecenv.step(a)[0].copy() for a in actions]
+        vecenv.restore(handle)
+        vecenv.recv()
+        for a, ob in zip(actions, obs):
+            assert np.array_equal(vecenv.step(a)[0], ob)
+
+        vecenv.close()
+
+    print('Snapshot tests passed')
+
+def test_reset_pool(steps=20):
+    vecenv = make_mock_vecenv(backend=pufferlib.vector.Serial, num_envs=2, reset_pool=2)
+    vecenv.reset(seed=1)
+    ends = 0
+    for _ in range(steps):
+        ends += sum(env.done for env in vecenv.envs)
+        obs = vecenv.step(vecenv.action_space.sample())[0]
+        for i, env in enumerate(vecenv.envs):
+            assert np.array_equal(obs[i], env.observations[0])
+
+    # Every episode end is served by a spare or reset inline
+    assert ends > 0 and vecenv.reset_pool_counts.sum() == ends
+    assert 0 <= vecenv.reset_pool_hit_rate <= 1
+    vecenv.close()
+
+    print('Reset pool tests passed')
+
+class ColumnarEnv(pufferlib.PufferEnv):
+    '''Reports one columnar record per agent per step'''
+    def __init__(self, num_agents=2, buf=None):
+        self.single_observation_space = gymnasium.spaces.Box(0, 1, (1,), np.float32)
+        self.single_action_space = gymnasium.spaces.Discrete(2)
+        self.num_agents = num_agents
+        self.log_schema = ('score', 'length')
+        super().__init__(buf)
+
+    def reset(self, seed=None):
+        self.tick = 0
+        return self.observations, []
+
+    def step(self, actions):
+        self.tick += 1
+        stats = np.zeros(self.num_agents, pufferlib.environment.stats_dtype(self.log_schema))
+        stats['score'] = self.tick
+        stats['length'] = 1
+        return self.observations, self.rewards, self.terminals, self.truncations, [stats]
+
+    def close(self):
+        pass
+
+def test_columnar_infos(steps=10):
+    for backend, kwargs in [(pufferlib.vector.Serial, {}),
+            (pufferlib.vector.Multiprocessing, dict(num_workers=2)),
+            (pufferlib.vector.Multiprocessing, dict(num_workers=2, info_ring_size=0))]:
+        vecenv = make_mock_vecenv(ColumnarEnv, backend=backend, num_envs=2,
+            columnar_infos=True, **kwargs)
+        vecenv.reset()
+        for tick in range(1, steps + 1):
+            infos = vecenv.step(vecenv.action_space.sample())[4]
+            # Records from all envs arrive as one structured array
+            assert len(infos) == 1 and pufferlib.environment.is_columnar(infos[0])
+            assert infos[0]['score'].tolist() == [tick] * 4
+            assert infos[0]['length'].sum() == 4
+
+        vecenv.close()
+
+        # By default they arrive as one dict per record
+        vecenv = make_mock_vecenv(ColumnarEnv, backend=backend, num_envs=2, **kwargs)
+        vecenv.reset()
+        infos = vecenv.step(vecenv.action_space.sample())[4]
+        assert infos == [{'score': 1.0, 'length': 1.0}] * 4
+        vecenv.close()
+
+    print('Columnar info tests passed')
+
+class WeightActor:
+    '''Tiny actor for actor mode tests. Always takes action 0 and reports
+    its first and last weights as the value and logprob'''
+    def __init__(self, weight=0.0, num_params=2):
+        self.num_params = num_params
+        self.weights = np.full(num_params, weight, dtype=np.float32)
+
+    def load_weights(self, flat):
+        self.weights = flat.copy()
+
+    def get_weights(self):
+        return self.weights
+
+    def __call__(self, obs):
+        n = len(obs)
+        return (np.zeros(n, dtype=np.int32), np.full(n, self.weights[-1], dtype=np.float32),
+            np.full(n, self.weights[0], dtype=np.float32))
+
+def test_vecenv_pool():
+    pool = pufferlib.vector.Pool()
+    vecenv = pool.make(mock_env_creator, backend=pufferlib.vector.Multiprocessing,
+        num_envs=4, num_workers=4, batch_size=4, overwork=True)
+    pids = [p.pid for p in vecenv.processes]
+    vecenv.async_reset(1)
+    assert len(vecenv.recv()[5]) == 4
+
+    # New batch size re-slices the same workers
+    assert pool.make(mock_env_creator, backend=pufferlib.vector.Multiprocessing,
+        num_envs=4, num_workers=4, batch_size=2, overwork=True) is vecenv
+    assert [p.pid for p in vecenv.processes] == pids
+    vecenv.async_reset(1)
+    assert len(vecenv.recv()[5]) == 2
+
+    # Different options make a new vecenv
+    assert pool.make(mock_env_creator, backend=pufferlib.vector.Multiprocessing,
+        num_envs=2, num_workers=2, batch_size=2, overwork=True) is not vecenv
+    assert pool.hits == 1 and pool.misses == 2
+
+    # A new actor policy of the same architecture is published to the
+    # running workers instead of restarting them
+    kwargs = dict(backend=pufferlib.vector.Multiprocessing, num_envs=2,
+        num_workers=2, segment_length=2, overwork=True)
+    vecenv = pool.make(mock_env_creator, policy=WeightActor(1.0), **kwargs)
+    pids = [p.pid for p in vecenv.processes]
+    vecenv.async_reset(1)
+    assert (vecenv.recv_segment().values == 1).all()
+    assert pool.make(mock_env_creator, policy=WeightActor(5.0), **kwargs) is vecenv
+    assert [p.pid for p in vecenv.processes] == pids
+    assert (vecenv.weights == 5).all()
+    vecenv.async_reset(1)
+    assert (vecenv.recv_segment().values == 5).all()
+
+    # A different architecture needs new actors
+    assert pool.make(mock_env_creator, policy=WeightActor(num_params=3), **kwargs) is not vecenv
+    assert pool.hits == 2 and pool.misses == 4
+    pool.close()
+
+    print('Vecenv pool tests passed')
+
+def test_placement():
+    import os
+    # 4 physical cores with 2 hyperthreads each, split over 2 NUMA nodes
+    cores = [[0, 4], [1, 5], [2, 6], [3, 7]]
+    nodes = [0, 0, 1, 1]
+    cpu_topology = pufferlib.vector.cpu_topology
+    pufferlib.vector.cpu_topology = lambda: (cores, nodes)
+    try:
+        # The learner keeps the first core and any cores left over
+        layout = pufferlib.vector.make_layout('cores', 2)
+        assert layout.workers == [[1, 5], [2, 6]]
+        assert layout.nodes == [0, 1]
+        assert layout.main == [0, 4, 3, 7]
+        assert not layout.numa
+
+        # One worker per core leaves the learner sharing the first core
+        layout = pufferlib.vector.make_layout('numa', 4)
+        assert layout.workers == cores
+        assert layout.nodes == nodes
+        assert layout.main == [0, 4]
+        assert layout.numa
+
+        # More workers than cores wrap around in node order
+        layout = pufferlib.vector.make_layout('cores', 6)
+        assert layout.workers == cores + cores[:2]
+        assert layout.nodes == nodes + nodes[:2]
+        assert layout.main == [0, 4]
+
+        # Layouts can be passed back as placement
+        assert pufferlib.vector.make_layout(dict(layout), 6) == layout
+        for placement, num_workers in [('sockets', 2), (dict(layout), 4)]:
+            try:
+                pufferlib.vector.make_layout(placement, num_workers)
+            except pufferlib.exceptions.APIUsageError:
+                pass
+            else:
+                raise AssertionError(f'Expected APIUsageError for {placement}')
+    finally:
+        pufferlib.vector.cpu_topology = cpu_topology
+
+    # The real topology only lists cpus this process may run on
+    cores, nodes = pufferlib.vector.cpu_topology()
+    assert len(cores) == len(nodes) > 0
+    assert set(c for core in cores for c in core) <= os.sched_getaffinity(0)
+
+    # Workers pin themselves to their cores before the first reset returns
+    affinity = os.sched_getaffinity(0)
+    cpu = min(affinity)
+    placement = dict(main=sorted(affinity), workers=[[cpu], [cpu]])
+    vecenv = make_mock_vecenv(num_envs=2, num_workers=2, placement=placement)
+    try:
+        vecenv.reset()
+        for p in vecenv.processes:
+            assert os.sched_getaffinity(p.pid) == {cpu}
+    finally:
+        vecenv.close()
+        os.sched_setaffinity(0, affinity)
+
+    print('Placement tests passed')
+
+def test_scheduler_select():
+    import time
+    # Drives _select on a bare Multiprocessing with hand-set semaphores
+    from pufferlib.vector import STEP, MAIN, INFO
+    class Pipe:
+        def recv(self):
+            return [{'score': 1}]
+
+    def scheduler(sems, workers_per_batch, zero_copy=False):
+        vecenv = object.__new__(pufferlib.vector.Multiprocessing)
+        vecenv.buf = pufferlib.namespace(semaphores=np.array(sems, dtype=np.uint8))
+        vecenv.num_workers = len(sems)
+        vecenv.workers_per_batch = workers_per_batch
+        vecenv.zero_copy = zero_copy
+        vecenv.batch_timeout = None
+        vecenv.events = None
+        vecenv.cursor = 0
+        vecenv.infos = [[] for _ in sems]
+        vecenv.recv_pipes = [Pipe() for _ in sems]
+        vecenv.last_health_check = time.time()
+        vecenv.scheduler_batches = vecenv.scheduler_passes = 0
+        return vecenv
+
+    # Batch size 1 round-robins over the ready workers
+    vecenv = scheduler([STEP, MAIN, STEP, MAIN], 1)
+    assert [vecenv._select()[0] for _ in range(3)] == [1, 3, 1]
+
+    # Async batches start from the cursor and wrap around
+    vecenv = scheduler([MAIN, STEP, MAIN, MAIN], 2)
+    vecenv.cursor = 3
+    assert vecenv._select()[0] == [3, 0]
+    assert vecenv.cursor == 1
+
+    # Zero-copy batches wait for a whole contiguous block
+    vecenv = scheduler([MAIN, STEP, MAIN, MAIN], 2, zero_copy=True)
+    assert vecenv._select()[0] == slice(2, 4)
+
+    # Workers with pending infos are drained and count as ready
+    vecenv = scheduler([INFO, STEP, INFO, STEP], 2)
+    assert vecenv._select()[0] == [0, 2]
+    assert vecenv.infos[0] == [{'score': 1}] and vecenv.infos[1] == []
+    assert (vecenv.buf.semaphores[[0, 2]] == MAIN).all()
+
+    # Nothing ready: keeps polling until the last worker of the block is done
+    vecenv = scheduler([MAIN, STEP, MAIN, MAIN], 4)
+    def check_workers():
+        vecenv.last_health_check = time.time()
+        vecenv.buf.semaphores[1] = MAIN
+
+    vecenv.last_health_check = 0
+    vecenv._check_workers = check_workers
+    assert vecenv._select()[0] == slice(0, 4)
+    assert vecenv.scheduler_iterations == 2
+    assert (vecenv.scheduler_batches, vecenv.scheduler_passes) == (1, 2)
+    print('Scheduler select tests passed')
+
+def test_respawn(steps=5):
+    import os
+    import signal
+    vecenv = make_mock_vecenv(num_envs=2, num_workers=2, batch_size=2, max_restarts=1)
+    try:
+        vecenv.async_reset(1)
+        vecenv.recv()
+        vecenv.send(vecenv.action_space.sample())
+
+        # Worker 0 dies mid-rollout. Its agents are masked out of the batch
+        os.kill(vecenv.processes[0].pid, signal.SIGKILL)
+        vecenv.processes[0].join()
+        o, r, d, t, infos, env_ids, m = vecenv.recv()
+        assert m.tolist() == [False, True]
+        assert env_ids.tolist() == [0, 1]
+        assert vecenv.restarts == [1, 0]
+
+        # Its first batch after the reset ends the old episode
+        vecenv.send(vecenv.action_space.sample())
+        o, r, d, t, infos, env_ids, m = vecenv.recv()
+        assert m.all()
+        assert t.tolist() == [True, False] and r[0] == 0
+
+        # The respawned worker steps normally afterwards
+        for _ in range(steps):
+            vecenv.send(vecenv.action_space.sample())
+            o, r, d, t, infos, env_ids, m = vecenv.recv()
+            assert m.all() and not t.any()
+
+        # A second death exceeds max_restarts
+        vecenv.send(vecenv.action_space.sample())
+        os.kill(vecenv.processes[0].pid, signal.SIGKILL)
+        vecenv.processes[0].join()
+        try:
+            vecenv.recv()
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError('Expected RuntimeError past max_restarts')
+    finally:
+        vecenv.close()
+
+    # Deaths found before the first reset respawn with the default seeds
+    vecenv = make_mock_vecenv(num_envs=2, num_workers=2, batch_size=2, max_restarts=1)
+    try:
+        os.kill(vecenv.processes[0].pid, signal.SIGKILL)
+        vecenv.processes[0].join()
+        vecenv._check_workers()
+        assert vecenv.restarts == [1, 0]
+        vecenv.async_reset(1)
+        assert vecenv.recv()[-1].all()
+    finally:
+        vecenv.close()
+
+    print('Respawn tests passed')
+
+def test_autotune_cache():
+    import json
+    import os
+    import tempfile
+    cache_path = os.path.join(tempfile.mkdtemp(), 'autotune.json')
+    kwargs = dict(batch_size=2, max_envs=4, time_per_test=0.2, cache_path=cache_path)
+
+    # Interrupt the search after the first config has been saved
+    make = pufferlib.vector.make
+    calls = []
+    def interrupt(*args, **kw):
+        calls.append(kw)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return make(*args, **kw)
+
+    def count(*args, **kw):
+        calls.append(kw)
+        return make(*args, **kw)
+
+    pufferlib.vector.make = interrupt
+    try:
+        pufferlib.vector.autotune(mock_env_creator, env_name='mock', **kwargs)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pufferlib.vector.make = make
+
+    with open(cache_path) as f:
+        entry, = json.load(f).values()
+    assert entry['env_name'] == 'mock' and 'profile' in entry
+    assert len(entry['results']) == 1
+
+    # Resuming only runs the configs that are missing
+    calls.clear()
+    pufferlib.vector.make = count
+    try:
+        results = pufferlib.vector.autotune(mock_env_creator, env_name='mock', **kwargs)
+    finally:
+        pufferlib.vector.make = make
+
+    assert len(calls) == len(results) - 1
+    assert [r['sps'] for r in results] == sorted([r['sps'] for r in results], reverse=True)
+
+    # make(backend='auto') loads the fastest config under the same env_name
+    best = results[0]['config']
+    vecenv = make_mock_vecenv(backend='auto', batch_size=2,
+        env_name='mock', cache_path=cache_path)
+    try:
+        assert type(vecenv).__name__ == best['backend']
+        assert vecenv.num_agents == best['num_envs']
+    finally:
+        vecenv.close()
+
+    for env_name in ['other', None]:
+        try:
+            make_mock_vecenv(backend='auto', batch_size=2,
+                env_name=env_name, cache_path=cache_path)
+        except pufferlib.exceptions.APIUsageError:
+            pass
+        else:
+            raise AssertionError(f'Expected no autotune results for {env_name}')
+
+    # Without a cached best, every config but the first is slower than
+    # prune times the best and is stopped early
+    results = pufferlib.vector.autotune(mock_env_creator, env_name='pruned',
+        prune=1e9, refresh=True, **kwargs)
+    assert sum(not r['pruned'] for r in results) == 1
+    config = pufferlib.vector.best_config('pruned', batch_size=2, cache_path=cache_path)
+    unpruned, = [r['config'] for r in results if not r['pruned']]
+    assert config['backend'].__name__ == unpruned['backend']
+    print('Autotune cache tests passed')
+
+def run_per_env(vecenv, actions):
+    '''Outputs of each env id's first len(actions) steps, where env i takes
+    actions[k][i] on its k-th step whichever batches it is served in'''
+    steps = len(actions)
+    outputs = [[] for _ in range(vecenv.num_agents)]
+    try:
+        vecenv.async_reset(1)
+        while min(len(out) for out in outputs) < steps:
+            o, r, d, t, _, env_ids, m = vecenv.recv()
+            for row, i in enumerate(env_ids):
+                outputs[i].append((o[row].copy(), r[row], d[row], t[row], m[row]))
+
+            vecenv.send(np.stack([actions[(len(outputs[i]) - 1) % steps][i]
+                for i in env_ids]))
+    finally:
+        vecenv.close()
+
+    return [out[:steps] for out in outputs]
+
+def test_padding(steps=10):
+    for puffer_cls, env_cls in [
+            (pufferlib.emulation.GymnasiumPufferEnv, test.MOCK_SINGLE_AGENT_ENVIRONMENTS[0]),
+            (pufferlib.emulation.PettingZooPufferEnv, test.MOCK_MULTI_AGENT_ENVIRONMENTS[6])]:
+        env_creator = functools.partial(puffer_cls, env_creator=env_cls)
+        serial = make_mock_vecenv(env_creator, backend=pufferlib.vector.Serial, num_envs=4)
+        actions = [[serial.single_action_space.sample() for _ in range(serial.num_agents)]
+            for _ in range(steps)]
+        expected = run_per_env(serial, actions)
+
+        # Zero-copy blocks of several workers only pad semaphores. Single
+        # worker batches and gathered batches also pad each worker's rows
+        for kwargs, padded_rows in [(dict(), False), (dict(batch_size=1), True),
+                (dict(batch_size=2, zero_copy=False), True)]:
+            for padding in [None, 'cacheline', 'page']:
+                vecenv = make_mock_vecenv(env_creator, num_envs=4, num_workers=4,
+                    padding=padding, **kwargs)
+                assert (vecenv.shm.data_align > 0) == (padded_rows and padding is not None)
+
+                # Padded slices must hold exactly the Serial data
+                outputs = run_per_env(vecenv, actions)
+                for env_expected, env_outputs in zip(expected, outputs):
+                    for step_expected, step_outputs in zip(env_expected, env_outputs):
+                        for a, b in zip(step_expected, step_outputs):
+                            assert np.shape(a) == np.shape(b) and np.all(a == b)
+
+    print('Padding tests passed')
+
+def test_probe_and_forkserver(steps=5):
+    try:
+        from pufferlib.ocean.moba.moba import Moba
+    except ImportError:
+        print('Moba not built, skipping Moba probe tests')
+    else:
+        for kwargs in [dict(num_envs=2), dict(num_envs=2, script_opponents=False)]:
+            probe = pufferlib.vector.probe_env(Moba, [], kwargs)
+            env = Moba(**kwargs)
+            assert probe.num_agents == env.num_agents
+            assert probe.single_observation_space == env.single_observation_space
+            assert probe.single_action_space == env.single_action_space
+            env.close()
+
+    env = mock_env_creator()
+    spaces = pufferlib.namespace(
+        num_agents=env.num_agents,
+        single_observation_space=env.single_observation_space,
+        single_action_space=env.single_action_space,
+        emulated=env.emulated,
+    )
+    env.close()
+
+    # Without a probe attribute, probe_env builds the env
+    assert isinstance(pufferlib.vector.probe_env(mock_env_creator, [], {}),
+        pufferlib.emulation.GymnasiumPufferEnv)
+
+    probed = functools.partial(mock_env_creator)
+    probed.probe = lambda: spaces
+
+    serial = make_mock_vecenv(backend=pufferlib.vector.Serial, num_envs=2)
+    serial.async_reset(1)
+    expected = [serial.recv()]
+    actions = [serial.action_space.sample() for _ in range(steps)]
+    for atn in actions:
+        serial.send(atn)
+        expected.append(serial.recv())
+    serial.close()
+
+    # A probed driver and a forkserver start must give the Serial results
+    for creator, kwargs in [(probed, {}), (mock_env_creator, dict(start_method='forkserver'))]:
+        vecenv = make_mock_vecenv(creator, num_envs=2, num_workers=2, **kwargs)
+        try:
+            assert vecenv.single_observation_space == spaces.single_observation_space
+            assert vecenv.single_action_space == spaces.single_action_space
+            assert (vecenv.driver_env is spaces) == (creator is probed)
+            assert vecenv.startup_time > 0
+
+            vecenv.async_reset(1)
+            outputs = [vecenv.recv()]
+            for atn in actions:
+                vecenv.send(atn)
+                outputs.append(vecenv.recv())
+
+            assert vecenv.time_to_first_batch > 0
+            for step_expected, step_outputs in zip(expected, outputs):
+                for i in (0, 1, 2, 3, 5, 6):
+                    assert np.all(step_expected[i] == step_outputs[i])
+        finally:
+            vecenv.close()
+
+    print('Probe and forkserver tests passed')
+
+def test_actor_mode(segment_length=3, rounds=6):
+    vecenv = make_mock_vecenv(num_envs=4, num_workers=4, batch_size=2, policy=WeightActor(1.0),
+        segment_length=segment_length)
+    obs_shape = vecenv.single_observation_space.shape
+    try:
+        vecenv.async_reset(1)
+        seg = vecenv.recv_segment()
+        assert seg.observations.shape == (segment_length, 2, *obs_shape)
+        assert seg.actions.shape == seg.values.shape == seg.masks.shape == (segment_length, 2)
+        assert len(seg.env_ids) == 2 and seg.masks.all()
+        assert (seg.actions == 0).all() and (seg.values == 1).all()
+
+        # Workers still running a segment keep their weights until it ends.
+        # Weights are never seen half-written
+        vecenv.update_policy(np.full(2, 7.0, dtype=np.float32))
+        for i in range(rounds):
+            seg = vecenv.recv_segment()
+            assert seg.masks.all()
+            assert (seg.values == seg.logprobs).all()
+            assert (seg.values == seg.values[0]).all(axis=0).all()
+            assert np.isin(seg.values, [1, 7]).all()
+
+        assert (seg.values == 7).all()
+        assert vecenv.weights_version[0] == 2
+    finally:
+        vecenv.close()
+
+    print('Actor mode tests passed')
+
+class SleepEnv(gymnasium.Env):
+    '''Counts its steps in the observation and sleeps delay seconds per step'''
+    observation_space = gymnasium.spaces.Box(0, 2**20, (1,), np.float32)
+    action_space = gymnasium.spaces.Discrete(2)
+
+    def __init__(self, delay=0):
+        self.delay = delay
+
+    def reset(self, seed=None):
+        self.tick = 0
+        return np.zeros(1, dtype=np.float32), {}
+
+    def step(self, action):
+        import time
+        time.sleep(self.delay)
+        self.tick += 1
+        return np.full(1, self.tick, dtype=np.float32), 1.0, False, False, {}
+
+def test_batch_timeout(steps=8):
+    env_creators = [functools.partial(pufferlib.emulation.GymnasiumPufferEnv,
+        env_creator=functools.partial(SleepEnv, delay)) for delay in [0, 0, 0, 0.5]]
+    vecenv = make_mock_vecenv(env_creators, env_args=[[]]*4, env_kwargs=[{}]*4,
+        num_envs=4, num_workers=4, batch_timeout=0.1)
+    sent = np.zeros(4, dtype=int)
+    masks = []
+    try:
+        vecenv.async_reset(1)
+        for _ in range(steps):
+            o, r, d, t, infos, env_ids, m = vecenv.recv()
+            assert env_ids.tolist() == [0, 1, 2, 3]
+
+            # Unmasked workers have run every step they were sent
+            assert (o[m, 0] == sent[m]).all()
+            masks.append(m.copy())
+            sent[vecenv.w_send] += 1
+            vecenv.send(vecenv.action_space.sample())
+    finally:
+        vecenv.close()
+
+    # Only the slow worker misses deadlines, and it rejoins once done
+    masks = np.array(masks)
+    assert masks[:, :3].all()
+    assert not masks[1, 3] and masks[1:, 3].any()
+    assert vecenv.late_counts[:3].sum() == 0
+    assert vecenv.late_counts[3] == (~masks[:, 3]).sum()
+    print('Batch timeout tests passed')
+
 if __name__ == '__main__':
     test_emulation()
     test_vectorization()
+    test_multiprocessing_blocking()
+    test_multiprocessing_double_buffer()
+    test_multiprocessing_gather()
+    test_ray()
+    test_action_buffer()
+    test_obs_rows()
+    test_socket()
+    test_multiprocessing_stats()
+    test_snapshot()
+    test_reset_pool()
+    test_columnar_infos()
+    test_vecenv_pool()
+    test_placement()
+    test_scheduler_select()
+    test_respawn()
+    test_autotune_cache()
+    test_padding()
+    test_probe_and_forkserver()
+    test_actor_mode()
+    test_batch_timeout()
     exit(0) # For Ray
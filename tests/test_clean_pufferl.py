@@ -0,0 +1,289 @@
+import torch
+import numpy as np
+import gymnasium
+
+import pufferlib
+import pufferlib.vector
+import pufferlib.models
+import pufferlib.cleanrl
+
+from c_gae import compute_gae, compute_segment_gae
+import clean_pufferl
+from clean_pufferl import Experience
+
+class CountEnv(pufferlib.PufferEnv):
+    def __init__(self, num_agents=2, masked=(), buf=None):
+        self.single_observation_space = gymnasium.spaces.Box(0, 255, (4,), np.uint8)
+        self.single_action_space = gymnasium.spaces.Discrete(2)
+        self.num_agents = num_agents
+        self.masked = list(masked)
+        super().__init__(buf)
+
+    def reset(self, seed=None):
+        self.tick = 0
+        self.observations[:] = 0
+        self.masks[self.masked] = False
+        return self.observations, []
+
+    def step(self, actions):
+        self.tick += 1
+        self.observations[:] = self.tick % 256
+        self.rewards[:] = 1
+        self.masks[self.masked] = False
+        return self.observations, self.rewards, self.terminals, self.truncations, []
+
+    def close(self):
+        pass
+
+def make_count_env(**kwargs):
+    return CountEnv(**kwargs)
+
+def reference_gae(values, rewards, terminals, truncations, bootstrap, gamma, gae_lambda):
+    '''Step by step GAE over [segments, horizon + 1] arrays'''
+    segments, horizon = values.shape[0], values.shape[1] - 1
+    advantages = np.zeros((segments, horizon), dtype=np.float32)
+    for s in range(segments):
+        next_advantage = 0
+        for t in reversed(range(horizon)):
+            if t == horizon - 1 and not bootstrap[s]:
+                next_advantage = 0
+            elif truncations[s, t+1] and not terminals[s, t+1]:
+                next_advantage = rewards[s, t+1] + (gamma - 1)*values[s, t]
+            else:
+                nonterminal = 1 - terminals[s, t+1]
+                delta = rewards[s, t+1] + gamma*values[s, t+1]*nonterminal - values[s, t]
+                next_advantage = delta + gamma*gae_lambda*nonterminal*next_advantage
+            advantages[s, t] = next_advantage
+
+    return advantages
+
+def make_gae_data(segments, horizon, seed=42):
+    np.random.seed(seed)
+    shape = (segments, horizon + 1)
+    values = np.random.randn(*shape).astype(np.float32)
+    rewards = np.random.randn(*shape).astype(np.float32)
+    terminals = (np.random.rand(*shape) < 0.1).astype(np.float32)
+    truncations = (np.random.rand(*shape) < 0.1).astype(np.float32)
+    bootstrap = (np.random.rand(segments) < 0.5).astype(np.float32)
+    bootstrap[0], bootstrap[1] = 0, 1
+    return values, rewards, terminals, truncations, bootstrap
+
+def store_step(experience, agents, t, num_agents):
+    '''Stores step t of agents. Observations, values and rewards
+    are 100*agent + t so rows can be checked by value'''
+    mask = torch.zeros(num_agents, dtype=torch.bool)
+    mask[agents] = True
+    data = torch.tensor([100*a + t for a in range(num_agents)], dtype=torch.float32)
+    experience.store(data[:, None].clone(), data.clone(), np.zeros(num_agents, dtype=np.int32),
+        torch.zeros(num_agents), data.clone(), torch.zeros(num_agents),
+        torch.zeros(num_agents), list(range(num_agents)), mask)
+
+def make_experience(batch_size, bptt_horizon, segment_agents=0, obs_rows=None):
+    return Experience(batch_size, bptt_horizon, batch_size, (1,), np.dtype(np.float32),
+        (), np.dtype(np.int32), device='cpu', segment_agents=segment_agents,
+        obs_rows=obs_rows)
+
+def test_segment_gae(segments=32, horizon=16, gamma=0.99, gae_lambda=0.95):
+    data = make_gae_data(segments, horizon)
+    advantages = compute_segment_gae(*data, gamma, gae_lambda)
+    assert np.allclose(advantages, reference_gae(*data, gamma, gae_lambda), atol=1e-5)
+
+    # Without a step after it, the last advantage of a segment is 0
+    values, rewards, terminals, truncations, bootstrap = data
+    assert np.all(advantages[bootstrap == 0, -1] == 0)
+    assert np.any(advantages[bootstrap == 1, -1] != 0)
+
+    # compute_gae is one segment that bootstraps from its last step
+    dones = terminals[0]
+    advantages = compute_gae(dones, values[0], rewards[0], gamma, gae_lambda)
+    expected = reference_gae(values[:1], rewards[:1], dones[None],
+        np.zeros_like(dones)[None], np.ones(1), gamma, gae_lambda)[0]
+    assert np.allclose(advantages[:-1], expected, atol=1e-5)
+    assert advantages[-1] == 0
+
+def test_experience_bootstrap():
+    for segment_agents in (0, 2):
+        experience = make_experience(4, 2, segment_agents=segment_agents)
+        for t in range(2):
+            store_step(experience, [0, 1], t, 2)
+
+        # Steps after the batch filled bootstrap the last row of their agent
+        assert experience.full and experience.bootstrap_pending
+        store_step(experience, [0], 2, 2)
+        assert experience.bootstrap_pending
+        store_step(experience, [1], 2, 2)
+        assert not experience.bootstrap_pending
+
+        idxs = experience.sort_training_data()
+        values, rewards, terminals, truncations, bootstrap = experience.gae_segments(idxs)
+        assert np.all(bootstrap == 1)
+        assert np.all(values[:, -1] == [2, 102])
+        assert np.all(rewards[:, -1] == [2, 102])
+        assert np.all(compute_segment_gae(values, rewards, terminals,
+            truncations, bootstrap, 0.99, 0.95)[:, -1] != 0)
+
+        # And start the next batch
+        experience.ptr = experience.step = 0
+        store_step(experience, [0, 1], 3, 2)
+        assert experience.ptr == 4 and experience.full
+        idxs = experience.sort_training_data()
+        assert np.all(experience.obs[idxs].view(2, 2).numpy() == [[2, 3], [102, 103]])
+
+def test_store_segments():
+    # Rows are filled per agent as steps arrive
+    experience = make_experience(8, 2, segment_agents=2)
+    for t in range(4):
+        store_step(experience, [0, 1], t, 2)
+
+    assert experience.full
+    assert np.all(experience.obs.view(4, 2).numpy() == [[0, 1], [100, 101], [2, 3], [102, 103]])
+    assert np.all(experience.values_np.reshape(4, 2) == experience.obs.view(4, 2).numpy())
+    assert np.all(experience.bootstrap == [1, 1, 0, 0])
+    assert np.all(experience.next_step[0, :2] == [2, 102])
+
+    # Steps of agents with no row left are dropped
+    experience = make_experience(6, 2, segment_agents=2)
+    for t in range(4):
+        store_step(experience, [0], t, 2)
+    store_step(experience, [1], 0, 2)
+    store_step(experience, [0], 4, 2)
+    assert experience.ptr == 5
+    store_step(experience, [1], 1, 2)
+    assert experience.full
+    assert np.all(experience.obs.view(3, 2).numpy() == [[0, 1], [2, 3], [100, 101]])
+    assert np.all(experience.bootstrap == [1, 1, 0])
+
+def test_segment_rows_cover_agents():
+    # Agents that never get a row would have every step dropped
+    try:
+        make_experience(4, 2, segment_agents=3)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Expected ValueError with fewer rows than agents')
+
+def test_flatten_segments():
+    experience = Experience(16, 2, 8, (1,), np.dtype(np.float32), (), np.dtype(np.int32),
+        device='cpu', segment_agents=4)
+    for t in range(4):
+        store_step(experience, [0, 1, 2, 3], t, 4)
+
+    idxs = experience.sort_training_data()
+    advantages = compute_segment_gae(*experience.gae_segments(idxs), 0.99, 0.95).ravel()
+    experience.flatten_batch(advantages)
+
+    # Minibatches are the rows in storage order
+    assert experience.b_obs.shape == (2, 4, 2, 1)
+    assert np.all(experience.b_obs.flatten().numpy() == experience.obs.flatten().numpy())
+    assert np.all(experience.b_values.flatten().numpy() == experience.values_np)
+    assert np.all(experience.b_advantages.flatten().numpy() == advantages)
+    assert np.allclose(experience.b_returns.flatten().numpy(), advantages + experience.values_np)
+    assert experience.b_obs[1, 0, :, 0].tolist() == [2, 3]
+
+def test_place_obs():
+    obs_rows = np.zeros((8, 1), dtype=np.float32)
+    experience = make_experience(4, 1, obs_rows=obs_rows)
+
+    # Agent 0 was written to row 5, masked agent 1 to row 6 and agent
+    # 2 was not written. Agent 2 is copied into the free row 6
+    obs = torch.tensor([[10], [11], [12]], dtype=torch.float32)
+    rows = experience.place_obs(obs, np.array([0, 2]), np.array([5, 6, -1]))
+    assert rows.tolist() == [5, 6]
+    assert obs_rows[6, 0] == 12
+    assert experience.obs_used == 0
+
+    # With no free rows left, copies take rows from the cursor
+    rows = experience.place_obs(obs, np.array([0, 1]), None)
+    assert rows.tolist() == [0, 1]
+    assert obs_rows[:2, 0].tolist() == [10, 11]
+    assert experience.obs_cursor == 2 and experience.obs_used == 2
+
+    assert experience.take_obs_rows(1).tolist() == [2]
+
+    # Reservations stop at batch_size rows per batch
+    assert experience.reserve_obs_rows(4, 1).tolist() == [3, -1, -1, -1]
+    assert experience.obs_used == 4
+
+def test_gae_segments_agent_switch():
+    # Sorted rows are [a0 t0, a0 t1, a0 t2] and [a0 t3, a1 t0, a1 t1]
+    experience = make_experience(6, 3)
+    for t in range(2):
+        store_step(experience, [0, 1], t, 2)
+    for t in range(2, 4):
+        store_step(experience, [0], t, 2)
+
+    idxs = experience.sort_training_data()
+    assert np.all(experience.segment_env == [[0, 0, 0], [0, 1, 1]])
+    values, rewards, terminals, truncations, bootstrap = experience.gae_segments(idxs)
+
+    # Row 0 continues into row 1 and row 1 is cut where the agent changes
+    assert values[0, -1] == 3 and bootstrap[0] == 1
+    assert truncations[1].tolist() == [0, 1, 0, 0]
+    assert rewards[1].tolist() == [3, 0, 101, 0]
+    assert bootstrap[1] == 0
+
+    advantages = compute_segment_gae(values, rewards, terminals, truncations, bootstrap, 0.99, 0.95)
+    assert np.isclose(advantages[1, 0], (0.99 - 1)*3)
+
+def make_config(**kwargs):
+    return pufferlib.namespace(**{**dict(seed=1, torch_deterministic=True,
+        cpu_offload=False, device='cpu', batch_size=16, bptt_horizon=4, minibatch_size=16,
+        segment_major=False, bootstrap_boundary=True, compile=False, compile_mode=None,
+        learning_rate=1e-3, total_timesteps=1000, env='count'), **kwargs})
+
+def test_lstm_mask():
+    vecenv = pufferlib.vector.make(make_count_env, backend=pufferlib.vector.Serial,
+        num_envs=1, env_kwargs=dict(masked=[1]))
+    env = vecenv.driver_env
+    policy = pufferlib.cleanrl.RecurrentPolicy(pufferlib.models.LSTMWrapper(
+        env, pufferlib.models.Default(env, hidden_size=8), input_size=8, hidden_size=8))
+    data = clean_pufferl.create(make_config(), vecenv, policy)
+    try:
+        clean_pufferl.evaluate(data)
+
+        # Masked agents keep their recurrent state
+        assert (data.experience.lstm_h[:, 0] != 0).any()
+        assert (data.experience.lstm_h[:, 1] == 0).all()
+        assert (data.experience.lstm_c[:, 1] == 0).all()
+    finally:
+        clean_pufferl.close(data)
+
+def test_bootstrap_boundary():
+    # Bootstrapping takes one more step per agent, except on the last batch
+    cases = [(dict(), True), (dict(bootstrap_boundary=False), False),
+        (dict(total_timesteps=16), False)]
+    for kwargs, bootstrapped in cases:
+        vecenv = pufferlib.vector.make(make_count_env, backend=pufferlib.vector.Serial)
+        policy = pufferlib.cleanrl.Policy(pufferlib.models.Default(vecenv.driver_env))
+        data = clean_pufferl.create(make_config(**kwargs), vecenv, policy)
+        try:
+            clean_pufferl.evaluate(data)
+            assert data.global_step == (18 if bootstrapped else 16)
+            assert sorted(data.experience.after) == ([0, 1] if bootstrapped else [])
+        finally:
+            clean_pufferl.close(data)
+
+def test_time_to_first_batch():
+    vecenv = pufferlib.vector.make(make_count_env, backend=pufferlib.vector.Multiprocessing,
+        num_envs=2, num_workers=2, batch_size=1, overwork=True)
+    config = make_config()
+    policy = pufferlib.cleanrl.Policy(pufferlib.models.Default(vecenv.driver_env))
+    data = clean_pufferl.create(config, vecenv, policy)
+    try:
+        clean_pufferl.evaluate(data)
+        assert data.msg.startswith('Time to first batch')
+        assert data.global_step >= config.batch_size
+    finally:
+        clean_pufferl.close(data)
+
+if __name__ == '__main__':
+    test_segment_gae()
+    test_experience_bootstrap()
+    test_store_segments()
+    test_segment_rows_cover_agents()
+    test_flatten_segments()
+    test_place_obs()
+    test_gae_segments_agent_switch()
+    test_lstm_mask()
+    test_bootstrap_boundary()
+    test_time_to_first_batch()
@@ -0,0 +1,136 @@
+from pdb import set_trace as T
+import time
+import psutil
+
+import pufferlib
+import pufferlib.vector
+from pufferlib.vector import Multiprocessing
+
+DEFAULT_TIMEOUT = 10
+
+def process_cpu_time(vecenv):
+    procs = [psutil.Process()] + [psutil.Process(p.pid) for p in vecenv.processes]
+    return sum(sum(p.cpu_times()[:2]) for p in procs)
+
+def profile_blocking(env_creator, num_envs, num_workers, batch_size=None,
+        model_forward_s=0.0, timeout=DEFAULT_TIMEOUT, **kwargs):
+    '''Compares SPS and CPU burned by the spin and blocking wake-up modes'''
+    for blocking in (False, True):
+        vecenv = pufferlib.vector.make(env_creator, num_envs=num_envs,
+            num_workers=num_workers, batch_size=batch_size,
+            backend=Multiprocessing, blocking=blocking, **kwargs)
+        actions = [vecenv.action_space.sample() for _ in range(1000)]
+        vecenv.async_reset()
+        vecenv.recv()
+
+        agent_steps = 0
+        cpu_start = process_cpu_time(vecenv)
+        start = time.time()
+        while time.time() - start < timeout:
+            vecenv.send(actions[agent_steps%1000])
+            if model_forward_s > 0:
+                time.sleep(model_forward_s)
+
+            o, r, d, t, i, env_id, mask = vecenv.recv()
+            agent_steps += sum(mask)
+
+        elapsed = time.time() - start
+        sps = agent_steps / elapsed
+        cpu = 100 * (process_cpu_time(vecenv) - cpu_start) / elapsed
+
+        # Workers are all done and the learner is busy elsewhere
+        cpu_start = process_cpu_time(vecenv)
+        time.sleep(timeout / 2)
+        idle_cpu = 100 * (process_cpu_time(vecenv) - cpu_start) / (timeout / 2)
+        vecenv.close()
+
+        mode = 'blocking' if blocking else 'spin'
+        print(f'    {mode:<10}: SPS {sps:.1f}, CPU {cpu:.1f}%, Idle CPU {idle_cpu:.1f}%')
+
+def profile_ray(env_creator, num_envs, num_workers, batch_size=None,
+        timeout=DEFAULT_TIMEOUT, **kwargs):
+    '''Compares Ray and Multiprocessing throughput on one host'''
+    for backend in (Multiprocessing, pufferlib.vector.Ray):
+        vecenv = pufferlib.vector.make(env_creator, num_envs=num_envs,
+            num_workers=num_workers, batch_size=batch_size,
+            backend=backend, **kwargs)
+        actions = [vecenv.action_space.sample() for _ in range(1000)]
+        vecenv.async_reset()
+        vecenv.recv()
+
+        agent_steps = 0
+        start = time.time()
+        while time.time() - start < timeout:
+            vecenv.send(actions[agent_steps%1000])
+            o, r, d, t, i, env_id, mask = vecenv.recv()
+            agent_steps += sum(mask)
+
+        sps = agent_steps / (time.time() - start)
+        vecenv.close()
+        print(f'    {backend.__name__:<16}: SPS {sps:.1f}')
+
+def profile_padding(env_creator, num_envs, num_workers, batch_size=None,
+        timeout=DEFAULT_TIMEOUT, **kwargs):
+    '''Compares packed and padded per-worker shared memory'''
+    for padding in (None, 'cacheline', 'page'):
+        vecenv = pufferlib.vector.make(env_creator, num_envs=num_envs,
+            num_workers=num_workers, batch_size=batch_size,
+            backend=Multiprocessing, padding=padding, **kwargs)
+        actions = [vecenv.action_space.sample() for _ in range(1000)]
+        vecenv.async_reset()
+        vecenv.recv()
+
+        agent_steps = 0
+        start = time.time()
+        while time.time() - start < timeout:
+            vecenv.send(actions[agent_steps%1000])
+            o, r, d, t, i, env_id, mask = vecenv.recv()
+            agent_steps += sum(mask)
+
+        sps = agent_steps / (time.time() - start)
+        vecenv.close()
+        print(f'    {str(padding):<10}: SPS {sps:.1f}')
+
+def profile_startup(env_creator, num_envs, num_workers, **kwargs):
+    '''Time to first batch for each worker start method'''
+    for start_method in ('fork', 'forkserver', 'spawn'):
+        vecenv = pufferlib.vector.make(env_creator, num_envs=num_envs,
+            num_workers=num_workers, backend=Multiprocessing,
+            start_method=start_method, **kwargs)
+        vecenv.async_reset()
+        vecenv.recv()
+        vecenv.close()
+        print(f'    {start_method:<10}: init {vecenv.startup_time:.3f}s, '
+            f'first batch {vecenv.time_to_first_batch:.3f}s')
+
+if __name__ == '__main__':
+    from pufferlib import ocean
+    env_creator = ocean.env_creator('performance_empiric')
+
+    print('Blocking vs spin wake-up, fast env')
+    profile_blocking(env_creator, num_envs=8, num_workers=8, overwork=True)
+
+    print('Blocking vs spin wake-up, 5 ms learner forward')
+    profile_blocking(env_creator, num_envs=8, num_workers=8,
+        model_forward_s=0.005, overwork=True)
+
+    print('Blocking vs spin wake-up, async pool')
+    profile_blocking(env_creator, num_envs=16, num_workers=8,
+        batch_size=4, overwork=True)
+
+    print('Ray vs Multiprocessing, sync')
+    profile_ray(env_creator, num_envs=8, num_workers=8, overwork=True)
+
+    print('Ray vs Multiprocessing, async pool')
+    profile_ray(env_creator, num_envs=16, num_workers=8, batch_size=4, overwork=True)
+
+    cores = psutil.cpu_count(logical=False)
+    print(f'Padded vs packed shared memory, {cores} tiny envs, one per batch')
+    profile_padding(env_creator, num_envs=cores, num_workers=cores, batch_size=1)
+
+    print(f'Padded vs packed shared memory, {4*cores} tiny envs, async pool')
+    profile_padding(env_creator, num_envs=4*cores, num_workers=4*cores,
+        batch_size=cores, zero_copy=False, overwork=True)
+
+    print('Worker startup')
+    profile_startup(env_creator, num_envs=cores, num_workers=cores)